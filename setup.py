@@ -22,11 +22,12 @@ INSTALL_REQUIRES = ['pvlib',
                     'importlib-metadata; python_version < "3.8"']
 
 PACKAGES = find_namespace_packages(include=['sg_solarsim*'])
-PACKAGE_DATA={'' : ['*.PNG','*.csv']}
+PACKAGE_DATA={'' : ['*.PNG','*.csv','*.npz']}
 
 setuptools_kwargs = {
     'zip_safe': False,
     'scripts': [],
+    'entry_points': {'console_scripts': ['sg_solarsim = sg_solarsim.__main__:main']},
     'include_package_data': True,
     'python_requires': '>=3.7'
 }
@@ -1,8 +1,54 @@
-from sg_solarsim.version import __version__  # noqa: F401
-
-from sg_solarsim import (  # noqua: F401
-    timezones,
-    tmy_clock,
-    ss_gui,
-    mppt,
-)
+""" sg_solarsim
+    Submodules are imported on first attribute access (PEP 562) so that importing the package, or a light submodule
+    such as sg_solarsim.mppt, does not pull in the GUI toolkits, pvlib or the timezone database.
+"""
+
+import importlib
+
+__all__ = [
+    'timezones',
+    'tmy_clock',
+    'ss_gui',
+    'mppt',
+]
+
+# every submodule that can be reached as an attribute of the package
+_SUBMODULES = frozenset(__all__ + [
+    'array_model',
+    'batch',
+    'celltemp',
+    'checkpoint',
+    'cities',
+    'energy_yield',
+    'engine',
+    'instrument',
+    'ivtable',
+    'liveplot',
+    'moduledb',
+    'mppt_bench',
+    'poa',
+    'profiling',
+    'pvmodel',
+    'recorder',
+    'resample',
+    'scheduler',
+    'startup',
+    'tmy',
+    'tmy_cache',
+    'worker',
+])
+
+
+def __getattr__(name):
+    if name == '__version__':
+        from sg_solarsim.version import __version__
+        globals()['__version__'] = __version__
+        return __version__
+    if name in _SUBMODULES:
+        # the import machinery sets the attribute on the package, later lookups do not come back here
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES | {'__version__'})
@@ -0,0 +1,45 @@
+""" sg_solarsim command line
+
+    sg_solarsim                 the GUI, like python -m sg_solarsim.main
+    sg_solarsim batch spec.json multi-site batch runs, see sg_solarsim.batch
+    sg_solarsim yield           annual, monthly and daily energy yield of a site, see sg_solarsim.energy_yield
+"""
+
+import sys
+import argparse
+import importlib
+
+# subcommand: (module with add_arguments() and run_cli(), help)
+SUBCOMMANDS = {
+    'batch': ('sg_solarsim.batch', 'run a job spec of sites x modules x dates x array sizes'),
+    'yield': ('sg_solarsim.energy_yield', 'energy yield over the TMY year, tracked and at Pmp'),
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog='sg_solarsim', description='NIST Solar Array Simulator')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('gui', help='run the GUI (the default)')
+
+    # only the module of the subcommand given is imported, the others just list their help line
+    command = next((a for a in argv if not a.startswith('-')), None)
+    module = None
+    for name, (module_name, summary) in SUBCOMMANDS.items():
+        p = sub.add_parser(name, help=summary)
+        if name == command:
+            module = importlib.import_module(module_name)
+            module.add_arguments(p)
+    args = parser.parse_args(argv)
+
+    if module is not None:
+        return module.run_cli(args)
+
+    from sg_solarsim.main import main as gui
+    gui(plt_curve=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
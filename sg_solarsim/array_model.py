@@ -0,0 +1,181 @@
+""" array_model.py
+    I-V model of an array of series x parallel identical modules.
+
+    Under uniform conditions the array curve is the module curve with the voltage scaled by series and the current by
+    parallel, ArrayModel.point() returns that at the cost of one IVTable lookup.
+
+    With per module irradiance and temperature (partial shading, mismatch) ArrayModel.evaluate() builds the array
+    curve in one pass:
+        the conditions are quantized and each distinct condition is looked up in the IVTable once
+        each distinct module curve is inverted to V(I) on a common current grid; beyond its short circuit current a
+            module is reverse biased, its bypass diode conducts and holds it at -bypass_drop volts (without bypass
+            diodes the reverse voltage follows the shunt slope of the curve)
+        string voltages are the sums of their module voltages at each current
+        the string curves are resampled on a common voltage grid and their currents added
+    A shaded array can have several local power maxima; the ArrayCurve reports the global one.
+"""
+
+import numpy as np
+
+DEFAULT_POINTS = 200
+DEFAULT_RESOLUTION = (1.0, 0.1)     # W/m^2 and degrees C that count as the same condition
+BYPASS_DROP = 0.5                    # volts across a conducting bypass diode
+
+
+class ArrayPoint:
+    """
+    Uniform conditions: an IVPoint of the module scaled to the array, with the IVPoint interface
+    """
+
+    def __init__(self, point, series, parallel):
+        self.point = point
+        self.series = series
+        self.parallel = parallel
+        self.v_oc = point.v_oc * series
+        self.i_sc = point.i_sc * parallel
+        self.v_mp = point.v_mp * series
+        self.i_mp = point.i_mp * parallel
+        self.p_mp = point.p_mp * series * parallel
+
+    def i_from_v(self, v):
+        """ array current at array voltage v """
+        return self.parallel * self.point.i_from_v(v / self.series)
+
+    def mpp(self):
+        return self.v_mp, self.i_mp, self.p_mp
+
+    def curve(self, pnts=100):
+        curve = self.point.curve(pnts)
+        curve.update(v=curve['v'] * self.series, i=curve['i'] * self.parallel, v_oc=self.v_oc, i_sc=self.i_sc,
+                     v_mp=self.v_mp, i_mp=self.i_mp, p_mp=self.p_mp)
+        return curve
+
+
+class ArrayCurve:
+    """
+    Array i-v curve under non uniform conditions, sampled from short circuit to open circuit, with the IVPoint interface
+    """
+
+    def __init__(self, v, i):
+        self.v = v
+        self.i = i
+        p = v * i
+        k = int(np.argmax(p))
+        self.v_oc = float(v[-1])
+        self.i_sc = float(i[0])
+        self.v_mp, self.i_mp, self.p_mp = float(v[k]), float(i[k]), float(p[k])
+
+    def i_from_v(self, v):
+        return float(np.interp(v, self.v, self.i, right=0.0))
+
+    def mpp(self):
+        return self.v_mp, self.i_mp, self.p_mp
+
+    def curve(self, pnts=100):
+        v = np.linspace(0, self.v_oc, pnts)
+        return {'v': v, 'i': np.interp(v, self.v, self.i), 'v_oc': self.v_oc, 'i_sc': self.i_sc,
+                'v_mp': self.v_mp, 'i_mp': self.i_mp, 'p_mp': self.p_mp}
+
+
+class ArrayModel:
+    """
+    series x parallel modules sharing one IVTable
+    """
+
+    def __init__(self, table, series=1, parallel=1, bypass=True, bypass_drop=BYPASS_DROP, points=DEFAULT_POINTS,
+                 resolution=DEFAULT_RESOLUTION):
+        """
+        :param table: IVTable of the module
+        :param series: modules per string
+        :param parallel: strings in parallel
+        :param bypass: each module has a bypass diode
+        :param bypass_drop: forward voltage of a bypass diode
+        :param points: points on the current and voltage grids
+        :param resolution: differences in irradiance and temperature small enough to share a module curve
+        """
+        self.table = table
+        self.series = int(series)
+        self.parallel = int(parallel)
+        self.bypass = bypass
+        self.bypass_drop = bypass_drop
+        self.points = points
+        self.resolution = resolution
+        self._x = np.linspace(0, 1, points)
+
+    @property
+    def shape(self):
+        return self.series, self.parallel
+
+    def point(self, g_eff, t_eff):
+        """ :return: ArrayPoint, the array under uniform conditions """
+        return ArrayPoint(self.table.point(g_eff, t_eff), self.series, self.parallel)
+
+    def _module_voltages(self, g, t, current):
+        """
+        V(I) of distinct module conditions on a current grid
+        :return: array of shape (len(g), len(current))
+        """
+        v_oc, i_sc = self.table.key_points(g, t)[:2]
+        v = v_oc[:, np.newaxis] * self._x
+        i = self.table.i_from_v(g[:, np.newaxis], t[:, np.newaxis], v)
+
+        # one np.interp per curve, done for all of them at once: i falls with v so the curves are reversed to have
+        # the current increasing, then each row is shifted above the one before it so a single searchsorted of the
+        # flattened rows finds the segment of every current on every curve
+        i_up, v_up = i[:, ::-1], v[:, ::-1]
+        n, m = i_up.shape
+        low = min(i_up.min(), current.min())
+        span = max(i_up.max(), current.max()) - low + 1.0
+        shift = np.arange(n)[:, np.newaxis] * span
+        j = np.searchsorted((i_up - low + shift).ravel(), current - low + shift, side='right') - 1
+        j = np.clip(j - np.arange(n)[:, np.newaxis] * m, 0, m - 2)
+        i0, i1 = np.take_along_axis(i_up, j, 1), np.take_along_axis(i_up, j + 1, 1)
+        v0, v1 = np.take_along_axis(v_up, j, 1), np.take_along_axis(v_up, j + 1, 1)
+        # clipped to the ends of the curve like np.interp
+        w = np.clip((current - i0) / np.where(i1 > i0, i1 - i0, np.inf), 0.0, 1.0)
+        volts = v0 + w * (v1 - v0)
+
+        beyond = current > i_sc[:, np.newaxis]
+        if self.bypass:
+            volts[beyond] = -self.bypass_drop
+            np.maximum(volts, -self.bypass_drop, out=volts)
+        else:
+            # reverse biased along the shunt slope at short circuit
+            slope = (v[:, 1] - v[:, 0]) / np.minimum(i[:, 1] - i[:, 0], -1e-9)
+            volts = np.where(beyond, (current - i_sc[:, np.newaxis]) * slope[:, np.newaxis], volts)
+        return volts
+
+    def evaluate(self, g_eff, t_eff):
+        """
+        Array curve for per module conditions
+        :param g_eff: effective irradiance of each module, broadcast to (series, parallel)
+        :param t_eff: cell temperature of each module, broadcast to (series, parallel)
+        :return: ArrayPoint if every module sees the same condition, otherwise ArrayCurve
+        """
+        g, t = np.broadcast_arrays(np.asarray(g_eff, dtype=float), np.asarray(t_eff, dtype=float))
+        g = np.broadcast_to(g, self.shape)
+        t = np.broadcast_to(t, self.shape)
+
+        # modules under the same condition share a curve
+        res_g, res_t = self.resolution
+        keys = np.stack([np.round(g / res_g).ravel(), np.round(t / res_t).ravel()], axis=1)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        if len(unique) == 1:
+            return self.point(float(g.flat[0]), float(t.flat[0]))
+        gu, tu = unique[:, 0] * res_g, unique[:, 1] * res_t
+        inverse = inverse.reshape(self.shape)
+
+        # string voltage at each current of a common grid, up to the brightest module's short circuit current
+        i_sc = self.table.key_points(gu, tu)[1]
+        current = np.linspace(0, float(i_sc.max()), self.points)
+        volts = self._module_voltages(gu, tu, current)
+        strings, string_index = np.unique(inverse, axis=1, return_inverse=True)
+        string_volts = volts[strings].sum(axis=0)          # (distinct strings, points)
+
+        # strings share the array voltage, their currents add
+        v = np.linspace(0, float(string_volts[:, 0].max()), self.points)
+        counts = np.bincount(np.ravel(string_index), minlength=strings.shape[1])
+        i = np.zeros(self.points)
+        for k, n in enumerate(counts):
+            i += n * np.interp(v, string_volts[k, ::-1], current[::-1], left=current[-1], right=0.0)
+        return ArrayCurve(v, i)
@@ -0,0 +1,245 @@
+""" batch.py
+    Multi-site, multi-configuration batch runs.
+
+    A job spec lists sites, modules, date ranges and series/parallel array sizes; every combination is one job.  A job
+    steps a SimulationEngine over its date range, looks the module up in its IVTable and runs an mppt tracker on the
+    array, the same loop as main.run_headless(use_table=True).  Jobs are spread over a process pool in chunks, with the
+    jobs of one site kept together so a worker reuses the site's TMY data and timezone, and the per job results are
+    collected into one table.  The disk caches the jobs need (module stores, IV tables and TMY entries) are filled
+    by prepare() in the parent before the pool starts, so the workers only ever read them.
+
+    A job spec is a json file:
+        {
+            "sites": [
+                {"lat": 39.13, "lng": -77.21, "name": "Gaithersburg"},
+                {"city": "Denver - Colorado", "country": "United States"},
+                {"country": "France", "limit": 50}
+            ],
+            "modlist": "CECMod",
+            "modules": ["Canadian_Solar_Inc__CS5P_220M"],
+            "dates": [["06-01", "06-15"], ["12-01", "12-15"]],
+            "arrays": [[1, 1], [10, 2]],
+            "timestep": 60,
+            "tracker": "inc_cond"
+        }
+    A site is given by its coordinates, by a city from the city index, or as every city of a country (optionally the
+    first limit of them).  modules defaults to the first module of the list, arrays to a single module.
+
+        python -m sg_solarsim batch spec.json --workers 8 --output results.csv
+"""
+
+import os
+import sys
+import json
+import time
+import itertools
+import multiprocessing
+from collections import namedtuple
+
+Job = namedtuple('Job', 'site lat lng modlist module start end series parallel timestep tracker')
+
+RESULT_COLUMNS = ('site', 'lat', 'lng', 'module', 'start', 'end', 'series', 'parallel', 'steps', 'energy_wh',
+                  'ideal_energy_wh', 'efficiency', 'seconds', 'error')
+
+
+def _sites(spec):
+    from sg_solarsim.cities import get_index
+
+    sites = []
+    for s in spec['sites']:
+        if 'lat' in s:
+            sites.append((s.get('name', '{:.4f},{:.4f}'.format(s['lat'], s['lng'])), s['lat'], s['lng']))
+        elif 'city' in s:
+            sites.append((s['city'],) + get_index().location(s['city'], s.get('country')))
+        else:
+            index = get_index()
+            for label in index.cities(s['country'])[:s.get('limit')]:
+                sites.append((label,) + index.location(label, s['country']))
+    return sites
+
+
+def expand(spec):
+    """
+    Turns a job spec into the list of jobs, one per combination of site, module, date range and array size
+    :param spec: dict, see the module docstring
+    :return: list of Job, grouped by site
+    """
+    from sg_solarsim.moduledb import get_modules
+
+    modlist = spec.get('modlist', 'CECMod')
+    modules = spec.get('modules') or [get_modules(modlist).names[0]]
+    dates = spec.get('dates') or [[None, None]]
+    arrays = spec.get('arrays') or [[1, 1]]
+    timestep = float(spec.get('timestep', 60.0))
+    tracker = spec.get('tracker', 'inc_cond')
+    return [Job(name, float(lat), float(lng), modlist, module, start, end, int(series), int(parallel), timestep, tracker)
+            for (name, lat, lng), module, (start, end), (series, parallel)
+            in itertools.product(_sites(spec), modules, dates, arrays)]
+
+
+# per worker process caches, a chunk of jobs usually shares a site and a module
+_tables = {}
+_slices = {}
+
+
+def _table(modlist, module):
+    from sg_solarsim.ivtable import IVTable
+    from sg_solarsim.moduledb import get_modules
+
+    key = (modlist, module)
+    if key not in _tables:
+        _tables[key] = IVTable.for_module(get_modules(modlist)[module], name=module)
+    return _tables[key]
+
+
+def _engine(job):
+    from sg_solarsim.engine import SimulationEngine
+    from sg_solarsim.main import parse_date
+
+    start = parse_date(job.start) if job.start else None
+    end = parse_date(job.end) if job.end else None
+    key = (job.lat, job.lng, job.start, job.end)
+    if key in _slices:
+        tz, tmy_slice = _slices[key]
+        return SimulationEngine(lat=job.lat, lng=job.lng, starttime=start, endtime=end, timestep=job.timestep,
+                                tz=tz, tmy_slice=tmy_slice)
+    engine = SimulationEngine(lat=job.lat, lng=job.lng, starttime=start, endtime=end, timestep=job.timestep)
+    _slices.clear()     # jobs arrive grouped by site, only the latest is worth keeping
+    _slices[key] = engine.tz, engine.tmy_slice
+    return engine
+
+
+def prepare(jobs):
+    """
+    Fills the disk caches the jobs read: the module store of each module list, the IVTable of each module and the
+    TMY entry of each site.  Done once before the pool starts, so workers never build the same entry at once.
+    A job whose module or site cannot be prepared is left to fail and report the error itself.
+    :param jobs: list of Job
+    """
+    from sg_solarsim.tmy_cache import TmyCache
+
+    for modlist, module in sorted({(job.modlist, job.module) for job in jobs}):
+        try:
+            _table(modlist, module)
+        except Exception:
+            pass
+    cache = TmyCache()
+    for lat, lng in sorted({cache.key(job.lat, job.lng) for job in jobs}):
+        try:
+            cache.get(lat, lng)
+        except Exception:
+            pass
+
+
+def run_job(job):
+    """
+    Runs one job, in a worker process or inline
+    :param job: Job
+    :return: dict with a value for each of RESULT_COLUMNS, error is set instead of raising
+    """
+    from sg_solarsim.mppt import TRACKERS
+
+    result = dict(site=job.site, lat=job.lat, lng=job.lng, module=job.module, start=job.start, end=job.end,
+                  series=job.series, parallel=job.parallel, steps=0, energy_wh=float('nan'),
+                  ideal_energy_wh=float('nan'), efficiency=float('nan'), seconds=0.0, error='')
+    began = time.perf_counter()
+    try:
+        table = _table(job.modlist, job.module)
+        engine = _engine(job)
+
+        # identical modules: the string voltage is split evenly and the string currents add
+        series, parallel = job.series, job.parallel
+        tracker = TRACKERS[job.tracker](step=0.5 * series)
+        v_ref = tracker.v_ref
+        power = ideal = 0.0
+        steps = 0
+        for eng in engine.run():
+            op = table.point(eng.g_eff, eng.t_cell)
+            tracker.sample_voc(op.v_oc * series)
+            current = parallel * op.i_from_v(v_ref / series)
+            v_ref = tracker.track(v_ref, current)
+            power += max(v_ref * parallel * op.i_from_v(v_ref / series), 0.0)
+            ideal += op.p_mp
+            steps += 1
+
+        ideal *= series * parallel
+        result.update(steps=steps, energy_wh=power * job.timestep / 3600, ideal_energy_wh=ideal * job.timestep / 3600,
+                      efficiency=power / ideal if ideal > 0 else float('nan'))
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['seconds'] = time.perf_counter() - began
+    return result
+
+
+def _progress(done, total, began, stream):
+    elapsed = time.perf_counter() - began
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else float('inf')
+    stream.write('\r{}/{} jobs  {:.2f} jobs/s  eta {:.0f} s '.format(done, total, rate, eta))
+    stream.flush()
+
+
+def run_batch(jobs, workers=None, chunksize=None, progress=True):
+    """
+    Runs jobs over a process pool
+    :param jobs: list of Job, e.g. from expand()
+    :param workers: number of processes, the number of cpus if None, 0 runs inline in this process
+    :param chunksize: jobs handed to a worker at a time, about four chunks per worker if None
+    :param progress: write progress to stderr
+    :return: DataFrame with one row per job, in the order of jobs
+    """
+    import pandas as pd
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (4 * max(workers, 1)))
+
+    results = [None] * len(jobs)
+    began = time.perf_counter()
+    indexed = list(enumerate(jobs))
+    if workers == 0:
+        outputs = map(_run_indexed, indexed)
+        pool = None
+    else:
+        prepare(jobs)
+        pool = multiprocessing.Pool(workers)
+        outputs = pool.imap_unordered(_run_indexed, indexed, chunksize=chunksize)
+    try:
+        for done, (k, result) in enumerate(outputs, 1):
+            results[k] = result
+            if progress:
+                _progress(done, len(jobs), began, sys.stderr)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if progress:
+        sys.stderr.write('\n')
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+
+def _run_indexed(item):
+    k, job = item
+    return k, run_job(job)
+
+
+def add_arguments(parser):
+    parser.add_argument('spec', help='json job spec')
+    parser.add_argument('--workers', type=int, default=None, help='processes, the cpu count by default, 0 for inline')
+    parser.add_argument('--chunksize', type=int, default=None)
+    parser.add_argument('--output', default=None, help='write the results table to this csv file')
+    parser.add_argument('--quiet', action='store_true', help='no progress output')
+
+
+def run_cli(args):
+    with open(args.spec) as f:
+        spec = json.load(f)
+    jobs = expand(spec)
+    results = run_batch(jobs, workers=args.workers, chunksize=args.chunksize, progress=not args.quiet)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.drop(columns=['lat', 'lng']).to_string(index=False, max_rows=50))
+    failed = (results['error'] != '').sum()
+    print('{} jobs, {:.1f} Wh, {} failed'.format(len(results), results['energy_wh'].sum(), failed))
+    return 1 if failed else 0
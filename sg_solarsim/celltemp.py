@@ -0,0 +1,146 @@
+""" celltemp.py
+    Cell temperature of the modules from the irradiance, air temperature and wind.
+
+    Steady state, the cells sit above the air temperature by the absorbed irradiance over a heat loss factor:
+        faiman  t_cell = t_air + g_eff / (u0 + u1 * wind)          pvlib.temperature.faiman, the default
+        noct    t_cell = t_air + g_eff / 800 * (T_NOCT - 20) * 9.5 / (5.7 + 3.8 * wind)
+                                                                  from the module's nominal operating cell temperature,
+                                                                  see CellTemperature.for_module()
+    The modules have thermal mass, so after a change in irradiance the cells approach the steady state with a first
+    order lag of time constant tau (several minutes for a glass module):
+        t_cell(t + dt) = t_ss + (t_cell(t) - t_ss) * exp(-dt / tau)
+    The update is exact for an input held over dt, so a tick costs the same and stays stable whatever dt is, i.e.
+    whatever the simulation speed.
+
+    Two forms:
+        cell_temperature()   batch, whole arrays at once, e.g. a year for the energy yield
+        CellTemperature      incremental, one update() per tick in constant time, held by the SimulationEngine
+"""
+
+import math
+
+import numpy as np
+
+MODELS = ('faiman', 'noct')
+DEFAULT_TAU = 420.0     # seconds
+DEFAULT_WIND = 1.0      # m/s when the weather has no wind speed
+U0, U1 = 25.0, 6.84     # pvlib faiman defaults, W/m^2/K and W/m^2/K/(m/s)
+T_NOCT = 45.0           # degrees C when the module parameters have none
+
+
+def steady_state(g_eff, t_air, wind=DEFAULT_WIND, model='faiman', u0=U0, u1=U1, t_noct=T_NOCT):
+    """
+    Steady state cell temperature, scalars or arrays
+    :param g_eff: irradiance W/m^2
+    :param t_air: air temperature degrees C
+    :param wind: wind speed m/s
+    :param model: 'faiman' or 'noct'
+    :return: degrees C
+    """
+    if model == 'faiman':
+        return t_air + g_eff / (u0 + u1 * wind)
+    if model == 'noct':
+        return t_air + g_eff / 800.0 * (t_noct - 20.0) * 9.5 / (5.7 + 3.8 * wind)
+    raise ValueError('model must be one of {}'.format(MODELS))
+
+
+def cell_temperature(g_eff, t_air, wind=DEFAULT_WIND, times=None, step=None, tau=DEFAULT_TAU, model='faiman',
+                     t0=None, **kwargs):
+    """
+    Batch cell temperature
+    :param g_eff: irradiance W/m^2, 1d array in time order
+    :param t_air: air temperature degrees C, array like g_eff or scalar
+    :param wind: wind speed m/s, array like g_eff or scalar
+    :param times: seconds of each sample, for uneven steps
+    :param step: seconds between samples if they are evenly spaced, used instead of times
+    :param tau: thermal time constant in seconds, 0 or no times and step for the steady state
+    :param t0: cell temperature before the first sample, the steady state of the first sample if None
+    :param kwargs: model parameters passed to steady_state()
+    :return: array of degrees C
+    """
+    t_ss = np.asarray(steady_state(np.asarray(g_eff, dtype=float), t_air, wind, model=model, **kwargs), dtype=float)
+    t_ss = np.broadcast_to(t_ss, np.shape(g_eff)).astype(float)
+    if not tau or (times is None and step is None) or not t_ss.size:
+        return t_ss
+    if t0 is None:
+        t0 = t_ss.flat[0]
+
+    if step is not None:
+        # y[n] = a y[n-1] + (1 - a) x[n] is a linear filter, run over the whole array by scipy
+        from scipy.signal import lfilter
+        a = math.exp(-step / tau)
+        x = t_ss.ravel()
+        y, _ = lfilter([1.0 - a], [1.0, -a], x, zi=[a * t0])
+        return y.reshape(t_ss.shape)
+
+    # uneven steps, each with its own decay
+    decay = np.exp(-np.diff(np.asarray(times, dtype=float), prepend=times[0]) / tau).tolist()
+    x = t_ss.ravel().tolist()
+    y = np.empty(len(x))
+    t = t0
+    for k in range(len(x)):
+        t = x[k] + (t - x[k]) * decay[k]
+        y[k] = t
+    return y.reshape(t_ss.shape)
+
+
+class CellTemperature:
+    """
+    Incremental cell temperature, one constant time update() per tick
+    """
+
+    def __init__(self, model='faiman', tau=DEFAULT_TAU, u0=U0, u1=U1, t_noct=T_NOCT):
+        """
+        :param model: 'faiman' or 'noct'
+        :param tau: thermal time constant in seconds, 0 for the steady state every tick
+        :param u0, u1: faiman heat loss factors
+        :param t_noct: nominal operating cell temperature for the noct model, e.g. the module's T_NOCT
+        """
+        if model not in MODELS:
+            raise ValueError('model must be one of {}'.format(MODELS))
+        self.model = model
+        self.tau = float(tau)
+        self.u0 = u0
+        self.u1 = u1
+        self.t_noct = t_noct
+        self.t_cell = None
+        self.time = None
+
+    @classmethod
+    def for_module(cls, model, module_params, **kwargs):
+        """
+        :param module_params: parameters of the module, its T_NOCT is used by the noct model
+        :param kwargs: see __init__
+        :return: CellTemperature, with the default T_NOCT if the module has none
+        """
+        t_noct = module_params.get('T_NOCT')
+        if t_noct is None or not np.isfinite(t_noct):
+            t_noct = T_NOCT
+        return cls(model, t_noct=float(t_noct), **kwargs)
+
+    def steady_state(self, g_eff, t_air, wind=DEFAULT_WIND):
+        return steady_state(g_eff, t_air, wind, self.model, self.u0, self.u1, self.t_noct)
+
+    def reset(self, t_cell=None, time=None):
+        """ forgets the thermal history, the next update() starts at t_cell or the steady state """
+        self.t_cell = t_cell
+        self.time = time
+
+    def update(self, g_eff, t_air, wind=DEFAULT_WIND, time=None, dt=None):
+        """
+        Advances to the present conditions
+        :param time: seconds of this tick, dt is taken from the previous update's time
+        :param dt: seconds since the previous update, instead of time
+        :return: cell temperature degrees C
+        """
+        t_ss = self.steady_state(g_eff, t_air, wind)
+        if dt is None:
+            dt = time - self.time if time is not None and self.time is not None else None
+        if time is not None:
+            self.time = time
+        if self.t_cell is None or dt is None or dt < 0 or not self.tau:
+            # first tick, or a seek back in time: no history to carry
+            self.t_cell = t_ss
+        elif dt > 0:
+            self.t_cell = t_ss + (self.t_cell - t_ss) * math.exp(-dt / self.tau)
+        return self.t_cell
@@ -0,0 +1,100 @@
+""" checkpoint.py
+    Saves and restores the state of a run so a long simulation can carry on after a crash or a stop.
+
+    A checkpoint is a small json file of the parts' snapshot() dicts:
+        engine    SimulationEngine: step count, speed, pause and the cell temperature, not the weather, which is
+                  looked up again for the restored time
+        tracker   the mppt tracker's state
+        sink      the recorder sink's cursor(), where its output ends
+    It is written to a temporary file then renamed over the old one so a crash while saving leaves the previous
+    checkpoint intact.  Loading one is a json read and a bisect into the TMY hours, milliseconds whatever the length
+    of the run so far.
+
+        python -m sg_solarsim.main --headless --table --record run.csv --checkpoint run.ckpt
+"""
+
+import os
+import json
+import time
+import tempfile
+
+VERSION = 1
+DEFAULT_EVERY = 8192    # records between checkpoints of a recording
+
+
+def save(path, **parts):
+    """
+    Atomically writes a checkpoint
+    :param parts: snapshot dicts, e.g. engine=engine.snapshot()
+    """
+    state = dict(parts, version=VERSION, saved=time.time())
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def load(path):
+    """
+    :return: dict of the saved parts, None if there is no checkpoint at path
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get('version') != VERSION:
+        raise ValueError('{} is not a version {} checkpoint'.format(path, VERSION))
+    return state
+
+
+def restore(path, engine, tracker=None):
+    """
+    Puts an engine, and optionally a tracker, back in the state saved at path
+    :return: the checkpoint dict, None if there is none or it is of a different run, e.g. other dates
+    """
+    state = load(path)
+    if state is None:
+        return None
+    try:
+        engine.restore(state['engine'])
+    except ValueError:
+        return None
+    if tracker is not None and 'tracker' in state:
+        tracker.restore(state['tracker'])
+    return state
+
+
+class Checkpointer:
+    """
+    Saves a checkpoint of a recording every so many records, called once per record by recorder.record()
+    """
+
+    def __init__(self, path, engine, tracker, sink=None, every=DEFAULT_EVERY):
+        """
+        :param every: records between checkpoints, the sink is flushed at each one so the cursor matches the engine
+        """
+        self.path = path
+        self.engine = engine
+        self.tracker = tracker
+        self.sink = sink
+        self.every = every
+        self._n = 0
+        self.saves = 0
+
+    def save(self):
+        parts = {'engine': self.engine.snapshot(), 'tracker': self.tracker.snapshot()}
+        if self.sink is not None:
+            parts['sink'] = self.sink.cursor()
+        save(self.path, **parts)
+        self.saves += 1
+
+    def __call__(self):
+        self._n += 1
+        if self._n >= self.every:
+            self._n = 0
+            self.save()
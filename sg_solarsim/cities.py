@@ -0,0 +1,266 @@
+""" cities.py
+    Indexed city database for the CityPicker.
+
+    worldcities.csv is parsed once into a compact binary index, a numpy .npz holding
+        the country names, sorted
+        for each country the offset of its first city, cities are sorted by country then name
+        the "city - admin" labels of the cities as one utf-8 blob
+        the latitude and longitude of every city
+        the labels, and the country and label pairs, utf-8 encoded and sorted, with the row of each
+    Loading the index is one file read and a split of the label blob, no csv parsing or pandas.  Looking up the cities
+    of a country is a slice between two offsets and the location of a city label is a binary search of the sorted
+    labels.
+
+    The nearest city to a coordinate is found with a KD tree on unit vectors, built the first time it is needed.
+
+    The index is looked for next to worldcities.csv in the package data, otherwise it is built from the csv into
+    ~/.sg_solarsim/cities (or $SG_SOLARSIM_CITY_CACHE) and rebuilt whenever the csv changes.
+
+        python -m sg_solarsim.cities build [worldcities.csv] [-o worldcities.npz]
+        python -m sg_solarsim.cities nearest 39.13 -77.21
+"""
+
+import os
+import tempfile
+from bisect import bisect_right
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sg_solarsim', 'cities')
+INDEX_NAME = 'worldcities.npz'
+EARTH_RADIUS_KM = 6371.0
+
+# label separator used by the city drop down, entries with no admin_name end with the separator
+SEPARATOR = ' - '
+
+
+def _package_data(name):
+    from pkg_resources import resource_filename
+    return resource_filename('sg_solarsim.resources.data', name)
+
+
+def _source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def _join(strings):
+    return np.frombuffer('\n'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def _split(blob):
+    return blob.tobytes().decode('utf-8').split('\n') if len(blob) else []
+
+
+def _sorted_keys(keys):
+    """
+    :param keys: list of str, one per row
+    :return: the utf-8 encoded keys sorted, and the row of each, the first row of equal keys first
+    """
+    encoded = np.array([k.encode('utf-8') for k in keys], dtype=bytes)
+    order = np.argsort(encoded, kind='stable')
+    return encoded[order], order.astype(np.int32)
+
+
+def _lookup_keys(countries, offsets, labels):
+    """ the sorted lookup arrays stored in the index """
+    country = np.repeat(np.arange(len(countries)), np.diff(offsets))
+    label_keys, label_rows = _sorted_keys(labels)
+    pair_keys, pair_rows = _sorted_keys([countries[c] + '\n' + label for c, label in zip(country.tolist(), labels)])
+    return {'label_keys': label_keys, 'label_rows': label_rows, 'pair_keys': pair_keys, 'pair_rows': pair_rows}
+
+
+def build_index(csv_path, out_path):
+    """
+    Parses worldcities.csv and writes the binary index
+    :param csv_path: path of worldcities.csv
+    :param out_path: path of the .npz to write
+    :return: out_path
+    """
+    import pandas as pd
+
+    data = pd.read_csv(csv_path, usecols=['country', 'city_ascii', 'admin_name', 'lat', 'lng'],
+                       keep_default_na=False, na_values={'lat': [''], 'lng': ['']})
+    data = data.dropna(subset=['lat', 'lng'])
+    data = data.sort_values(by=['country', 'city_ascii'], kind='stable')
+
+    country = data['country'].to_numpy(dtype=str)
+    countries, offsets = np.unique(country, return_index=True)
+    offsets = np.append(offsets, len(country)).astype(np.int32)
+    labels = (data['city_ascii'].astype(str) + SEPARATOR + data['admin_name'].astype(str)).tolist()
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    # a temp file of its own, two processes may build the index at once
+    fd, tmp = tempfile.mkstemp(dir=out_dir, prefix='.tmp_', suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f,
+                     countries=_join(countries),
+                     offsets=offsets,
+                     labels=_join(labels),
+                     lat=data['lat'].to_numpy(dtype=np.float32),
+                     lng=data['lng'].to_numpy(dtype=np.float32),
+                     source=_source_stamp(csv_path),
+                     **_lookup_keys(countries.tolist(), offsets, labels))
+        os.replace(tmp, out_path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return out_path
+
+
+class CityIndex:
+    """
+    Read only city database.  Listing the cities of a country and location() are constant time, nearest() is
+    logarithmic.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: .npz written by build_index()
+        """
+        self.path = path
+        with np.load(path) as f:
+            self.countries = _split(f['countries'])
+            self.offsets = f['offsets'].tolist()
+            self.labels = _split(f['labels'])
+            self.lat = f['lat'].astype(float)
+            self.lng = f['lng'].astype(float)
+            if 'label_keys' in f.files:
+                keys = {name: f[name] for name in ('label_keys', 'label_rows', 'pair_keys', 'pair_rows')}
+            else:
+                # an index from before the lookup keys were stored
+                keys = _lookup_keys(self.countries, self.offsets, self.labels)
+        self._label_keys, self._label_rows = keys['label_keys'], keys['label_rows']
+        self._pair_keys, self._pair_rows = keys['pair_keys'], keys['pair_rows']
+        self._country_pos = {c: k for k, c in enumerate(self.countries)}
+        self._label_lookup = None
+        self._pair_lookup = None
+        self._tree = None
+
+    @classmethod
+    def open(cls, csv_path=None, cache_dir=None):
+        """
+        Loads the index for a worldcities.csv, building it first if it is missing or older than the csv
+        :param csv_path: path of worldcities.csv, the one in the package data if None
+        :param cache_dir: where to build the index when there is none next to the csv
+        """
+        if csv_path is None:
+            csv_path = _package_data('worldcities.csv')
+        if cache_dir is None:
+            cache_dir = os.environ.get('SG_SOLARSIM_CITY_CACHE', DEFAULT_CACHE_DIR)
+
+        have_csv = os.path.exists(csv_path)
+        candidates = [os.path.join(os.path.dirname(csv_path), INDEX_NAME), os.path.join(cache_dir, INDEX_NAME)]
+        for path in candidates:
+            if os.path.exists(path) and (not have_csv or cls._current(path, csv_path)):
+                return cls(path)
+        if not have_csv:
+            raise FileNotFoundError(csv_path)
+        return cls(build_index(csv_path, candidates[1]))
+
+    @staticmethod
+    def _current(path, csv_path):
+        with np.load(path) as f:
+            return ('source' in f.files and 'label_keys' in f.files
+                    and np.array_equal(f['source'], _source_stamp(csv_path)))
+
+    def cities(self, country):
+        """
+        :return: list of "city - admin" labels of a country, sorted by city
+        """
+        k = self._country_pos.get(country)
+        if k is None:
+            return []
+        return self.labels[self.offsets[k]:self.offsets[k + 1]]
+
+    @staticmethod
+    def _hashed(keys, rows):
+        """ :return: dict of key to row, the first of any duplicates like the old table search """
+        # the sorted keys put the first row of equal keys first, built backwards so it is the one kept
+        return dict(zip(keys[::-1].tolist(), rows[::-1].tolist()))
+
+    def _row(self, label, country=None):
+        if self._label_lookup is None:
+            # built on the first lookup, opening the index for the country lists alone stays a plain load
+            self._pair_lookup = self._hashed(self._pair_keys, self._pair_rows)
+            self._label_lookup = self._hashed(self._label_keys, self._label_rows)
+        if country is not None:
+            row = self._pair_lookup.get((country + '\n' + label).encode('utf-8'))
+            if row is not None:
+                return row
+        return self._label_lookup.get(label.encode('utf-8'))
+
+    def location(self, label, country=None):
+        """
+        :param label: "city - admin" as shown in the drop down
+        :param country: looked in first, if given
+        :return: latitude, longitude
+        :raises KeyError: if there is no such city
+        """
+        row = self._row(label, country)
+        if row is None:
+            raise KeyError(label)
+        return self._coords(row)
+
+    def _coords(self, row):
+        # stored as float32, worldcities.csv only has 4 decimals
+        return round(float(self.lat[row]), 4), round(float(self.lng[row]), 4)
+
+    def country_of(self, row):
+        return self.countries[bisect_right(self.offsets, row) - 1]
+
+    @staticmethod
+    def _xyz(lat, lng):
+        lat, lng = np.radians(lat), np.radians(lng)
+        return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+    def nearest(self, lat, lng, k=1):
+        """
+        Cities nearest a coordinate by great circle distance
+        :param k: number of cities
+        :return: list of (country, label, lat, lng, distance km), nearest first
+        """
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self._xyz(self.lat, self.lng))
+        k = min(k, len(self.labels))
+        chord, rows = self._tree.query(self._xyz(lat, lng), k=k)
+        chord, rows = np.atleast_1d(chord), np.atleast_1d(rows)
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+        return [(self.country_of(r), self.labels[r]) + self._coords(r) + (float(d),)
+                for r, d in zip(rows.tolist(), distance.tolist())]
+
+
+_index = None
+
+
+def get_index():
+    """ the package city index, loaded on first use and shared """
+    global _index
+    if _index is None:
+        _index = CityIndex.open()
+    return _index
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build or query the city index')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_build = sub.add_parser('build', help='build the binary index from worldcities.csv')
+    p_build.add_argument('csv', nargs='?', default=None)
+    p_build.add_argument('-o', '--output', default=None)
+    p_near = sub.add_parser('nearest', help='list the cities nearest a coordinate')
+    p_near.add_argument('lat', type=float)
+    p_near.add_argument('lng', type=float)
+    p_near.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        csv = args.csv or _package_data('worldcities.csv')
+        print(build_index(csv, args.output or os.path.join(os.path.dirname(csv), INDEX_NAME)))
+    elif args.command == 'nearest':
+        for country, label, lat, lng, d in get_index().nearest(args.lat, args.lng, k=args.k):
+            print('{:>8.1f} km  {}, {}  ({:.4f}, {:.4f})'.format(d, label, country, lat, lng))
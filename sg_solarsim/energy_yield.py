@@ -0,0 +1,280 @@
+""" energy_yield.py
+    Annual, monthly and daily energy yield of a module or array at a site, from the whole TMY year at once.
+
+    Replaying a year on the tmy_clock takes hours, here the year is computed in a few numpy passes:
+        the hourly ghi, or the plane of array irradiance of a tilted module, and the air temperature are interpolated
+            to every step of the year, linearly like the engine and wrapping from December 31st back to January 1st
+            since a TMY is a typical, cyclic year.  Gaps in the hours are closed up rather than bridged, so an 8760
+            hour TMY whose year was coerced to 2000 has no February 29th instead of one made up by interpolation
+        the ideal energy is the maximum power of every step, one vectorized IVTable lookup over the whole year
+        the tracked energy runs the modified incremental conductance tracker at the chosen sub-hourly step.  The year
+            is cut into days starting at local solar midnight, when the array is dark, and one tracker per day runs in
+            an MPPTBank, so the loop is over the steps of a day with every day advanced together
+    The yield is then summed into local calendar days and months, the difference between the two energies being the
+    tracking loss.
+
+        python -m sg_solarsim.energy_yield --lat 39.13 --lng -77.21 --step 60 --period monthly
+        sg_solarsim yield --lat 39.13 --lng -77.21 --series 10 --parallel 2 --output daily.csv --period daily
+"""
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+DAY = 86400.0
+PERIODS = ('annual', 'monthly', 'daily')
+
+Yield = namedtuple('Yield', 'annual monthly daily')
+
+
+def site_weather(lat, lng, tz=None, cache=None, filename=None):
+    """
+    :param tz: pytz timezone of the site, found from lat and lng if None
+    :param cache: TmyCache, the default store if None
+    :param filename: local weather file to read instead of the cache
+    :return: (DataFrame of the whole TMY year indexed in UTC, tz)
+    """
+    from pytz import timezone
+
+    from sg_solarsim.tmy_cache import TmyCache, read_weather_file, normalize
+    from sg_solarsim.timezones import timezone_at
+
+    if filename is not None:
+        data = normalize(read_weather_file(filename)[0])
+    else:
+        data = (cache if cache is not None else TmyCache()).get(lat, lng)
+    if tz is None:
+        tz = timezone(timezone_at(lat, lng))
+    return data, tz
+
+
+def _gaps(times):
+    """
+    :param times: epoch seconds of the hourly data, increasing
+    :return: (usual seconds between the hours, list of (epoch seconds of the first missing hour, seconds missing))
+    """
+    spacing = float(np.median(np.diff(times)))
+    missing = np.diff(times) - spacing
+    k = np.flatnonzero(missing > 0)
+    return spacing, list(zip((times[k] + spacing).tolist(), missing[k].tolist()))
+
+
+def _nearest_midnight(when, lng, tz=None):
+    """ :return: epoch seconds of the local midnight nearest when, solar midnight at lng if tz is None """
+    if tz is None:
+        solar = (-lng / 15.0 * 3600.0) % DAY
+        return solar + DAY * round((when - solar) / DAY)
+    import pandas as pd
+    local = pd.Timestamp(when, unit='s', tz='UTC').tz_convert(tz)
+    return (local + pd.Timedelta(hours=12)).normalize().timestamp()
+
+
+def _solar_days(times, lng, step, spacing=3600.0):
+    """
+    :param times: epoch seconds of the hourly data, without gaps
+    :param spacing: seconds between the hours
+    :return: epoch seconds of every step, shape (days, steps per day), each row starting at local solar midnight
+    """
+    year_start = times[0]
+    midnight = year_start + (-lng / 15.0 * 3600.0) % DAY
+    days = int(round((times[-1] - times[0] + spacing) / DAY))
+    steps = int(DAY // step)
+    return midnight + DAY * np.arange(days)[:, np.newaxis] + step * np.arange(steps)
+
+
+def _check_step(step):
+    if not 0 < step <= 3600.0 or DAY % step:
+        raise ValueError('step must be positive, at most an hour and divide a day evenly, not {}'.format(step))
+
+
+def simulate(table, weather, lng, step=60.0, series=1, parallel=1, mppt_step=0.5, track=True, thermal='faiman',
+             tz=None, t_noct=None):
+    """
+    Steps the whole year
+    :param table: IVTable of the module
+    :param weather: TMY year indexed in UTC with ghi and temp_air, as from site_weather()
+    :param lng: longitude of the site, places the start of each tracker's day at solar midnight
+    :param step: seconds between tracker steps
+    :param series: modules per string
+    :param parallel: strings in parallel
+    :param mppt_step: tracker voltage step per module in series
+    :param track: run the tracker, otherwise only the ideal energy is computed and energy is nan
+    :param thermal: celltemp model of the cell temperature, None for cells at air temperature
+    :param tz: pytz timezone the days are summed in, the steps are moved past any gap in the hours at its midnights
+    :param t_noct: T_NOCT of the module in degrees C for the noct model, the celltemp default if None
+    :return: (epoch seconds, energy Wh, ideal energy Wh), each of shape (days, steps per day)
+    :raises ValueError: if step is not a sub-hourly divisor of a day
+    """
+    from sg_solarsim.mppt import MPPTBank
+
+    _check_step(step)
+    # the steps are laid out on the hours present, every gap closed up
+    times = weather.index.asi8 / 1e9
+    spacing, gaps = _gaps(times)
+    real = times
+    times = times.copy()
+    for start, missing in gaps:
+        times[real >= start] -= missing
+    period = times[-1] - times[0] + spacing
+    t = _solar_days(times, lng, step, spacing)
+    # the engine interpolates linearly between the hours, g_eff is the ghi (or plane of array irradiance)
+    g = np.interp(t, times, weather['ghi'].to_numpy(dtype=float), period=period)
+    t_cell = np.interp(t, times, weather['temp_air'].to_numpy(dtype=float), period=period)
+    if thermal is not None:
+        # the rows follow on from each other so the year is one evenly stepped series for the thermal lag
+        from sg_solarsim.celltemp import cell_temperature
+        wind = (np.interp(t, times, weather['wind_speed'].to_numpy(dtype=float), period=period)
+                if 'wind_speed' in weather.columns else 1.0)
+        params = {} if t_noct is None else {'t_noct': t_noct}
+        t_cell = cell_temperature(g, t_cell, wind, step=step, model=thermal, **params)
+
+    ideal = table.key_points(g, t_cell)[4] * (series * parallel * step / 3600.0)
+
+    # then moved back past each gap from the local midnight nearest it, so the days either side stay whole and none
+    # is made up inside it: the 24 hours of February 29th missing from an 8760 hour TMY leave February 28th and
+    # March 1st as whole days and no February 29th
+    when = t.copy()
+    closed = 0.0
+    for start, missing in gaps:
+        when[t >= _nearest_midnight(start, lng, tz) - closed] += missing
+        closed += missing
+    if not track:
+        return when, np.full_like(ideal, np.nan), ideal
+
+    days, steps = g.shape
+    bank = MPPTBank(days, step=mppt_step * series)
+    v_ref = bank.v_ref.copy()
+    power = np.zeros_like(g)
+    zero = np.zeros(days)
+    lit = (g > 0).any(axis=0)
+    for k in range(steps):
+        if lit[k]:
+            gk, tk = g[:, k], t_cell[:, k]
+            current = parallel * table.i_from_v(gk, tk, v_ref / series)
+            v_ref = bank.inc_cond(v_ref, current).copy()
+            power[:, k] = v_ref * parallel * table.i_from_v(gk, tk, v_ref / series)
+        else:
+            # dark for every day at this time of day, no current to look up
+            v_ref = bank.inc_cond(v_ref, zero).copy()
+    energy = np.maximum(power, 0.0) * (step / 3600.0)
+    return when, energy, ideal
+
+
+def summarize(t, energy, ideal, tz):
+    """
+    Sums the step energies into local calendar days and months
+    :return: Yield of a dict and two DataFrames with energy_wh, ideal_wh, loss_wh and efficiency
+    """
+    import pandas as pd
+
+    local = pd.to_datetime(t.ravel(), unit='s', utc=True).tz_convert(tz)
+    # the days wrapped around the end of the typical year keep their month and day
+    key = local.month.to_numpy() * 32 + local.day.to_numpy()
+    keys, inverse = np.unique(key, return_inverse=True)
+    daily = pd.DataFrame({
+        'energy_wh': np.bincount(inverse, energy.ravel(), minlength=len(keys)),
+        'ideal_wh': np.bincount(inverse, ideal.ravel(), minlength=len(keys)),
+    }, index=pd.DatetimeIndex(pd.to_datetime({'year': 2000, 'month': keys // 32, 'day': keys % 32}), name='date'))
+    monthly = daily.groupby(daily.index.month).sum(min_count=1)
+    monthly.index.name = 'month'
+    for frame in (daily, monthly):
+        frame['loss_wh'] = frame['ideal_wh'] - frame['energy_wh']
+        frame['efficiency'] = frame['energy_wh'] / frame['ideal_wh'].where(frame['ideal_wh'] > 0)
+
+    # nan when the tracker was not run
+    energy_wh, ideal_wh = float(daily['energy_wh'].sum(min_count=1)), float(daily['ideal_wh'].sum())
+    annual = {'energy_kwh': energy_wh / 1000, 'ideal_kwh': ideal_wh / 1000, 'loss_kwh': (ideal_wh - energy_wh) / 1000,
+              'efficiency': energy_wh / ideal_wh if ideal_wh > 0 else float('nan')}
+    return Yield(annual, monthly, daily)
+
+
+def site_yield(lat, lng, module=None, modlist='CECMod', step=60.0, series=1, parallel=1, track=True, tz=None,
+               cache=None, filename=None, tilt=None, azimuth=180.0, thermal='faiman'):
+    """
+    Energy yield of a module or array at a site over the TMY year
+    :param module: module name, the first module of the list if None
+    :param step: seconds between tracker steps
+    :param series: modules per string
+    :param parallel: strings in parallel
+    :param track: run the mppt tracker, otherwise only the ideal (always at Pmp) yield
+    :param tilt: module tilt in degrees, the plane of array irradiance is used if given, else the ghi
+    :param azimuth: degrees clockwise from north the module faces
+    :param thermal: cell temperature model, 'faiman' or 'noct' with the module's T_NOCT, None for cells at air
+                    temperature
+    :return: Yield, annual is a dict of energy_kwh, ideal_kwh, loss_kwh, efficiency and seconds
+    :raises ValueError: if step is not a sub-hourly divisor of a day
+    """
+    from sg_solarsim.ivtable import IVTable
+    from sg_solarsim.moduledb import get_modules
+
+    _check_step(step)
+    began = time.perf_counter()
+    modules = get_modules(modlist)
+    if module is None:
+        module = modules.names[0]
+    table = IVTable.for_module(modules[module], name=module)
+    t_noct = None
+    if thermal is not None:
+        from sg_solarsim.celltemp import CellTemperature
+        # checks the model name before the weather is loaded, and falls back to the default for a module without one
+        t_noct = CellTemperature.for_module(thermal, modules[module]).t_noct
+    weather, tz = site_weather(lat, lng, tz=tz, cache=cache, filename=filename)
+    if tilt is not None:
+        from sg_solarsim.poa import with_poa
+        weather = with_poa(weather, lat, lng, tilt, azimuth)
+    result = summarize(*simulate(table, weather, lng, step=step, series=series, parallel=parallel, track=track,
+                                 thermal=thermal, tz=tz, t_noct=t_noct), tz)
+    result.annual.update(lat=lat, lng=lng, module=module, series=series, parallel=parallel, tilt=tilt, azimuth=azimuth,
+                         step=step, thermal=thermal,
+                         seconds=time.perf_counter() - began)
+    return result
+
+
+def add_arguments(parser):
+    parser.add_argument('--lat', type=float, default=39.13)
+    parser.add_argument('--lng', type=float, default=-77.21)
+    parser.add_argument('--modlist', default='CECMod')
+    parser.add_argument('--module', default=None)
+    parser.add_argument('--series', type=int, default=1)
+    parser.add_argument('--parallel', type=int, default=1)
+    parser.add_argument('--tilt', type=float, default=None, help='module tilt in degrees, horizontal ghi if not given')
+    parser.add_argument('--azimuth', type=float, default=180.0, help='degrees clockwise from north the module faces')
+    parser.add_argument('--step', type=float, default=60.0, help='seconds between mppt tracker steps')
+    parser.add_argument('--thermal', choices=['faiman', 'noct', 'none'], default='faiman',
+                        help='cell temperature model, none for cells at air temperature')
+    parser.add_argument('--ideal', action='store_true', help='skip the tracker, ideal Pmp yield only')
+    parser.add_argument('--period', choices=PERIODS, default='monthly', help='table to print')
+    parser.add_argument('--output', default=None, help='write the table of the period to this csv file')
+    parser.add_argument('--weather', default=None, help='local PVGIS, EPW or TMY3 file instead of the TMY cache')
+
+
+def run_cli(args):
+    result = site_yield(args.lat, args.lng, module=args.module, modlist=args.modlist, step=args.step,
+                        series=args.series, parallel=args.parallel, track=not args.ideal, filename=args.weather,
+                        tilt=args.tilt, azimuth=args.azimuth, thermal=None if args.thermal == 'none' else args.thermal)
+    a = result.annual
+    if args.period == 'annual':
+        if args.output:
+            import pandas as pd
+            pd.DataFrame([a]).to_csv(args.output, index=False)
+    else:
+        table = result.daily if args.period == 'daily' else result.monthly
+        print(table.to_string(float_format='{:.1f}'.format, formatters={'efficiency': '{:.4f}'.format}, max_rows=40))
+        if args.output:
+            table.to_csv(args.output)
+    if args.ideal:
+        print('{module} x {series}s{parallel}p at ({lat}, {lng}): {ideal_kwh:.1f} kWh/year at Pmp, {seconds:.2f} s'
+              .format(**a))
+        return 0
+    print('{module} x {series}s{parallel}p at ({lat}, {lng}), {step:g} s steps: {energy_kwh:.1f} kWh/year tracked, '
+          '{ideal_kwh:.1f} kWh/year at Pmp, {loss_kwh:.2f} kWh mppt loss ({efficiency:.2%}), {seconds:.2f} s'.format(**a))
+    return 0
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='annual, monthly and daily energy yield from the TMY year')
+    add_arguments(parser)
+    raise SystemExit(run_cli(parser.parse_args()))
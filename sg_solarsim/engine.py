@@ -0,0 +1,331 @@
+"""engine.py
+    Headless simulation engine.
+
+    SimulationEngine holds the simulated clock and the TMY weather for the run and steps through it with a fixed
+    simulated timestep.  It does not need a display: the tmy_clock window only draws the engine state, and
+    main.run_headless() steps the engine as fast as possible for batch studies and CI.
+
+    Per step work is constant: the simulated time is kept as epoch seconds computed from an integer step count, and the
+    TMY data is held in plain lists with a cursor on the present hour that moves forward incrementally.
+"""
+
+import time as _time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from pytz import timezone
+
+from sg_solarsim.timezones import timezones
+
+
+class SimulationEngine:
+    """
+    Simulated TMY clock.
+
+    The engine can be driven two ways:
+        update() advances by the wall clock time since the last call multiplied by speed, the way tmy_clock runs.
+        step() / run() advance by exactly one timestep per call, as fast as the caller can go.
+    In both cases the simulated time only moves in whole timesteps and g_eff and t_air are linearly interpolated from
+    the hourly TMY data at the new time.  The engine pauses itself once the time passes endtime.
+    seek() jumps to any time of the run directly, snapshot() and restore() save and resume the state.
+    """
+
+    def __init__(self, lat=39.13, lng=-77.21, speed=1, starttime=None, endtime=None, timestep=1.0, tz=None,
+                 tmy_slice=None, cache=None, filename=None, resample=None, clouds=None, tilt=None, azimuth=180.0,
+                 thermal='faiman'):
+        """
+        :param lat: latitude of the site
+        :param lng: longitude of the site
+        :param speed: time multiplier used by update()
+        :param starttime: Datetime to start the clock, defaults to now
+        :param endtime: Datetime to pause the clock at the end of the run, defaults to two weeks after starttime
+        :param timestep: simulated seconds per step
+        :param tz: pytz timezone of the site, found from lat and lng if None
+        :param tmy_slice: TMY data for the run, fetched with tmy() if None
+        :param cache: TmyCache passed to tmy()
+        :param filename: local weather file passed to tmy()
+        :param resample: seconds between samples of a resample.Resampler to take g_eff and t_air from instead of the
+                         hourly interpolation, or a Resampler or Timeline over the run
+        :param clouds: seed of the Resampler's clouds, or a resample.Clouds
+        :param tilt: degrees from horizontal of the array, g_eff is the plane of array irradiance instead of the ghi
+                     if given
+        :param azimuth: degrees clockwise from north the array faces
+        :param thermal: cell temperature model, a celltemp.CellTemperature or a model name for one with the default
+                        time constant and T_NOCT (see CellTemperature.for_module() for the module's own), None to
+                        take the cells to be at air temperature
+        """
+        if starttime is None:
+            starttime = datetime.now()
+        if endtime is None:
+            endtime = starttime + timedelta(weeks=2)
+        if tz is None:
+            tz = timezone(timezones(lat, lng).tz)
+        self.tz = tz
+        self.starttime = self._localize(starttime)
+        self.endtime = self._localize(endtime)
+        self.speed = speed
+        self.timestep = float(timestep)
+        self.pause = False
+
+        if tmy_slice is None:
+            from sg_solarsim.tmy import tmy
+            tmy_slice = tmy(lat=lat, lng=lng, tz=self.tz, daterange=[self.starttime, self.endtime],
+                            cache=cache, filename=filename).tmy_slice
+        self.tmy_slice = tmy_slice
+        self.tilt = tilt
+        self.azimuth = azimuth
+        if tilt is not None:
+            # one vectorized, cached pass over the hours, the ticks only interpolate it
+            from sg_solarsim.poa import with_poa
+            tmy_slice = with_poa(tmy_slice, lat, lng, tilt, azimuth)
+
+        # contiguous python lists so a sample does not go through pandas or numpy scalars,
+        # with the slope of each hour precomputed
+        times = tmy_slice.index.asi8 / 1e9    # epoch seconds
+        ghi = tmy_slice['ghi'].to_numpy(dtype=float)
+        temp_air = tmy_slice['temp_air'].to_numpy(dtype=float)
+        dt = times[1:] - times[:-1]
+        self._times = times.tolist()
+        self._ghi = ghi.tolist()
+        self._temp_air = temp_air.tolist()
+        self._ghi_slope = ((ghi[1:] - ghi[:-1]) / dt).tolist()
+        self._temp_air_slope = ((temp_air[1:] - temp_air[:-1]) / dt).tolist()
+        self._wind = tmy_slice['wind_speed'].tolist() if 'wind_speed' in tmy_slice.columns else None
+        self._cursor = 0
+
+        # sub-hourly variability comes from a lazily produced high resolution series
+        if resample is not None and not hasattr(resample, 'sample'):
+            from sg_solarsim.resample import Resampler
+            resample = Resampler(tmy_slice, step=resample, start=self.starttime.timestamp(),
+                                 end=self.endtime.timestamp(), clouds=clouds)
+        self.resampler = resample
+
+        # the cell temperature lags the irradiance, updated once per sample in constant time
+        if isinstance(thermal, str):
+            from sg_solarsim.celltemp import CellTemperature
+            thermal = CellTemperature(thermal)
+        self.thermal = thermal
+
+        self._t0 = self.starttime.timestamp()
+        self._t_end = self.endtime.timestamp()
+        self.steps = 0              # whole timesteps since starttime
+        self.time = self._t0        # simulated time in epoch seconds
+
+        self.then = None            # wall clock time of the last update()
+        self._pending = 0.0         # wall clock seconds times speed not yet turned into whole steps
+        self._offset_key = None     # the utc offset is looked up once per quarter hour
+        self._offset = 0
+        self.g_eff = 500    # effective irradiance
+        self.t_air = 20     # air temperature
+        self.wind_speed = 1.0
+        self.t_cell = 20    # cell temperature
+        self.sample()
+
+    def _localize(self, dt):
+        dt = dt.replace(year=2000)
+        if dt.tzinfo is None or dt.utcoffset() is None:
+            return self.tz.localize(dt)
+        return dt.astimezone(self.tz)
+
+    @property
+    def displaytime(self):
+        """ simulated time as an aware datetime in the site timezone """
+        return datetime.fromtimestamp(self.time, self.tz)
+
+    @property
+    def elapsed(self):
+        return timedelta(seconds=self.steps * self.timestep)
+
+    @property
+    def finished(self):
+        return self.time > self._t_end
+
+    def _utc_offset(self):
+        key = int(self.time // 900)
+        if key != self._offset_key:
+            # utc offsets only change on a quarter hour
+            self._offset_key = key
+            self._offset = datetime.fromtimestamp(self.time, self.tz).utcoffset().total_seconds()
+        return self._offset
+
+    def local_time(self):
+        """
+        Local wall clock fields of the simulated time without building a datetime.
+        :return: hour (0-23), minute, second
+        """
+        s = int(self.time + self._utc_offset()) % 86400
+        return s // 3600, (s % 3600) // 60, s % 60
+
+    def local_day(self):
+        """ days since the epoch in the site timezone, changes at local midnight """
+        return int((self.time + self._utc_offset()) // 86400)
+
+    def steps_left(self):
+        """ number of steps up to and including the first one past endtime """
+        return max(int((self._t_end - self.time) // self.timestep) + 1, 0)
+
+    def advance(self, steps=1):
+        """
+        Moves the simulated time forward by a whole number of timesteps and samples the weather there
+        :return: False once the time has passed endtime
+        """
+        steps = min(steps, self.steps_left())
+        self.steps += steps
+        self.time = self._t0 + self.steps * self.timestep
+        self.sample()
+
+        # pause after endtime
+        if self.finished:
+            self.pause = True
+            return False
+        return True
+
+    def step(self):
+        """ advances one timestep """
+        return self.advance(1)
+
+    def update(self, now=None):
+        """
+        Advances by the wall clock time since the last call multiplied by speed, rounded down to whole timesteps.
+        The remainder is carried to the next call.
+        :param now: wall clock seconds, time.monotonic() if None
+        :return: number of steps taken
+        """
+        if now is None:
+            now = _time.monotonic()
+        if self.then is None or self.pause:
+            self.then = now
+            return 0
+
+        self._pending += (now - self.then) * self.speed
+        self.then = now
+        steps = min(int(self._pending // self.timestep), self.steps_left())
+        if steps:
+            self._pending -= self.timestep * steps
+            self.advance(steps)
+        return steps
+
+    def run(self):
+        """
+        Generator that steps from the present time to endtime as fast as possible.
+        Yields the engine at the present time then after every step.
+        """
+        self.pause = False
+        if self.finished:
+            return
+        yield self
+        while self.step():
+            yield self
+
+    def seek(self, when):
+        """
+        Jumps straight to a time in the run, no replay of the steps before it: the time is a step count and the weather
+        is looked up by bisecting the hours
+        :param when: aware or naive datetime in the site timezone, epoch seconds, or a fraction of the run from 0 to 1
+        :return: the new simulated time in epoch seconds, on a whole timestep between starttime and endtime
+        """
+        if isinstance(when, datetime):
+            t = self._localize(when).timestamp()
+        elif 0.0 <= when <= 1.0:
+            t = self._t0 + when * (self._t_end - self._t0)
+        else:
+            t = float(when)
+        last = int((self._t_end - self._t0) // self.timestep)
+        self.steps = min(max(int(round((t - self._t0) / self.timestep)), 0), last)
+        self.time = self._t0 + self.steps * self.timestep
+        # the wall clock restarts from the next update() rather than catching up on the jump
+        self.then = None
+        self._pending = 0.0
+        self._warm_up()
+        self.sample()
+        return self.time
+
+    def _warm_up(self, step=60.0):
+        """ brings the cell temperature to where the weather of the last few time constants would have left it """
+        thermal = self.thermal
+        if thermal is None:
+            return
+        thermal.reset()
+        span = 5 * thermal.tau
+        t = self.time - span
+        while t < self.time:
+            g_eff, t_air = self.sample(t)
+            thermal.update(g_eff, t_air, self.wind_speed, time=t)
+            t += step
+
+    def snapshot(self):
+        """
+        The state the run continues from, small and json serializable, e.g. for a checkpoint file
+        :return: dict for restore()
+        """
+        thermal = self.thermal
+        return {
+            'start': self._t0,
+            'end': self._t_end,
+            'timestep': self.timestep,
+            'steps': self.steps,
+            'speed': self.speed,
+            'pause': self.pause,
+            'pending': self._pending,
+            'thermal': None if thermal is None or thermal.t_cell is None else [thermal.t_cell, thermal.time],
+        }
+
+    def restore(self, state):
+        """
+        Puts the engine back in the state of a snapshot() of the same run
+        :raise ValueError: if the snapshot is of a run with another date range or timestep
+        """
+        if (state['start'], state['end'], state['timestep']) != (self._t0, self._t_end, self.timestep):
+            raise ValueError('snapshot of a different run')
+        self.steps = state['steps']
+        self.time = self._t0 + self.steps * self.timestep
+        self.speed = state['speed']
+        self.pause = state['pause']
+        self._pending = state['pending']
+        self.then = None
+        if self.thermal is not None:
+            if state['thermal'] is None:
+                self._warm_up()
+            else:
+                # the present sample leaves the restored temperature as it is, no time has passed
+                self.thermal.reset(*state['thermal'])
+        self.sample()
+
+    def sample(self, t=None):
+        """
+        Linearly interpolates the TMY ghi and temp_air, updating g_eff and t_air, and at the present time the cell
+        temperature
+        :param t: epoch seconds, the present simulated time if None
+        :return: g_eff, t_air
+        """
+        present = t is None
+        if present:
+            t = self.time
+        times = self._times
+        last = len(times) - 2
+        i = self._cursor
+        if times[i] <= t < times[i + 1]:
+            pass
+        elif i < last and times[i + 1] <= t < times[i + 2]:
+            # the common case, on to the next hour
+            i += 1
+        else:
+            # a seek, or off either end of the slice
+            i = min(max(bisect_right(times, t) - 1, 0), last)
+        self._cursor = i
+
+        if self.resampler is not None:
+            self.g_eff, self.t_air = self.resampler.sample(t)
+        else:
+            # clamp to the ends of the slice rather than extrapolating
+            dt = min(max(t - times[i], 0.0), times[i + 1] - times[i])
+            self.g_eff = self._ghi[i] + self._ghi_slope[i] * dt
+            self.t_air = self._temp_air[i] + self._temp_air_slope[i] * dt
+        if self._wind is not None:
+            self.wind_speed = self._wind[i]
+
+        if self.thermal is None:
+            self.t_cell = self.t_air
+        elif present:
+            self.t_cell = self.thermal.update(self.g_eff, self.t_air, self.wind_speed, time=t)
+        return self.g_eff, self.t_air
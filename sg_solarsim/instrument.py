@@ -0,0 +1,316 @@
+""" instrument.py
+    Output stage that drives a programmable DC supply / solar array simulator over TCP with SCPI.
+
+    SetpointStream runs an asyncio loop on its own thread so the GUI or simulation loop never waits on the network.
+    The simulation submits setpoints whenever it has them; the stream sends at most one per period, always the latest,
+    and counts the ones it dropped as coalesced.  Each update is followed by *OPC? so the round trip, from submit() to
+    the instrument acknowledging, is measured as the end to end latency.
+
+    Two kinds of update:
+        Setpoint(v, i)                   fixed voltage and current limit, 'VOLT ..;:CURR ..'
+        Curve(v_oc, i_sc, v_mp, i_mp)    the four points of a SAS curve, e.g. an IVPoint of the present conditions
+
+    FakeInstrument is a local SCPI server standing in for the supply in tests and demos.
+
+        python -m sg_solarsim.instrument fake --port 5025
+        python -m sg_solarsim.instrument demo --rate 50
+"""
+
+import time
+import asyncio
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_PORT = 5025     # the usual raw socket SCPI port
+
+Setpoint = namedtuple('Setpoint', 'v i')
+Curve = namedtuple('Curve', 'v_oc i_sc v_mp i_mp')
+
+# command templates, Keysight E4360 style solar array simulator commands by default
+SETPOINT_COMMAND = 'VOLT {v:.4f};:CURR {i:.4f}'
+CURVE_COMMAND = 'CURR:SAS:ISC {i_sc:.4f};:VOLT:SAS:VOC {v_oc:.4f};:CURR:SAS:IMP {i_mp:.4f};:VOLT:SAS:VMP {v_mp:.4f}'
+
+
+def format_update(update, setpoint_command=SETPOINT_COMMAND, curve_command=CURVE_COMMAND):
+    """ :return: the SCPI command line for a Setpoint or a Curve """
+    if isinstance(update, Curve):
+        return curve_command.format(**update._asdict())
+    return setpoint_command.format(v=update.v, i=update.i)
+
+
+class SetpointStream:
+    """
+    Rate limited, coalescing setpoint sender running on a background thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, rate=20.0, setpoint_command=SETPOINT_COMMAND,
+                 curve_command=CURVE_COMMAND, latency_window=1024):
+        """
+        :param rate: maximum updates per second sent to the instrument
+        :param latency_window: number of recent latencies kept for the statistics
+        """
+        self.host = host
+        self.port = port
+        self.period = 1.0 / rate
+        self.setpoint_command = setpoint_command
+        self.curve_command = curve_command
+
+        self._lock = threading.Lock()
+        self._latest = None         # (update, submit time) not sent yet
+        self._loop = None
+        self._wake = None
+        self._thread = None
+        self._stopping = False
+        self.error = None           # exception that stopped the sender
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self._latency = np.zeros(latency_window)
+        self._started = None
+
+    def start(self):
+        """ connects and starts sending, returns once connected """
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name='SetpointStream', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def submit(self, update):
+        """
+        Queues an update, replacing one that has not been sent yet.  Safe to call from any thread, never blocks on
+        the network.
+        :param update: Setpoint or Curve
+        """
+        with self._lock:
+            if self._latest is not None:
+                self.coalesced += 1
+            self._latest = (update, time.perf_counter())
+            self.submitted += 1
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._main(ready))
+        except Exception as e:
+            self.error = e
+        finally:
+            ready.set()
+            loop.close()
+
+    async def _main(self, ready):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._started = time.perf_counter()
+        ready.set()
+        try:
+            next_send = time.perf_counter()
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                # hold off until the next slot, updates arriving meanwhile replace this one
+                delay = next_send - time.perf_counter()
+                if delay > 0 and not self._stopping:
+                    await asyncio.sleep(delay)
+                with self._lock:
+                    item, self._latest = self._latest, None
+                if item is None:
+                    if self._stopping:
+                        break
+                    continue
+                update, submitted = item
+                line = format_update(update, self.setpoint_command, self.curve_command)
+                writer.write((line + '\n*OPC?\n').encode())
+                await writer.drain()
+                await reader.readline()
+                self._latency[self.sent % len(self._latency)] = time.perf_counter() - submitted
+                self.sent += 1
+                next_send = max(next_send + self.period, time.perf_counter() - self.period)
+                if self._stopping:
+                    # the last update has been sent
+                    break
+        finally:
+            self._loop = None
+            writer.close()
+            await writer.wait_closed()
+
+    def stats(self):
+        """
+        :return: dict of counts, the achieved update rate and latency statistics in seconds over the recent updates
+        """
+        n = min(self.sent, len(self._latency))
+        latency = self._latency[:n]
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            'submitted': self.submitted,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'rate': self.sent / elapsed if elapsed > 0 else 0.0,
+            'latency_mean': float(latency.mean()) if n else float('nan'),
+            'latency_p50': float(np.percentile(latency, 50)) if n else float('nan'),
+            'latency_p99': float(np.percentile(latency, 99)) if n else float('nan'),
+            'latency_max': float(latency.max()) if n else float('nan'),
+        }
+
+
+class FakeInstrument:
+    """
+    Local SCPI server that stands in for the supply.  It keeps the last value of every setting command, answers
+    *IDN? and *OPC?, and can add a fixed processing delay per command line.
+    """
+
+    IDN = 'NIST,sg_solarsim FakeInstrument,0,0'
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0):
+        """
+        :param port: 0 picks a free port, see .port once started
+        :param delay: seconds the instrument takes per command line
+        """
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.settings = {}
+        self.commands = 0
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for command in line.decode().strip().split(';'):
+                    reply = self.execute(command.strip().lstrip(':'))
+                    if reply is not None:
+                        writer.write((reply + '\n').encode())
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def execute(self, command):
+        """ :return: reply for a query, None for a setting """
+        if not command:
+            return None
+        self.commands += 1
+        upper = command.upper()
+        if upper == '*IDN?':
+            return self.IDN
+        if upper == '*OPC?':
+            return '1'
+        if upper.endswith('?'):
+            return self.settings.get(upper[:-1], '0')
+        name, _, value = command.partition(' ')
+        self.settings[name.upper()] = value
+        return None
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def _close(self):
+        self._server.close()
+        # connections still open are dropped, their handlers finished before the loop closes
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def start(self):
+        """ serves on a background thread, returns once listening """
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='FakeInstrument', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def format_stats(stats):
+    return ('{sent} sent of {submitted} submitted ({coalesced} coalesced), {rate:.1f} updates/s, latency mean '
+            '{mean:.2f} ms, p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max:.2f} ms').format(
+        mean=stats['latency_mean'] * 1e3, p50=stats['latency_p50'] * 1e3, p99=stats['latency_p99'] * 1e3,
+        max=stats['latency_max'] * 1e3, **stats)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SCPI output stage and a stand-in instrument')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_fake = sub.add_parser('fake', help='run the stand-in instrument until interrupted')
+    p_fake.add_argument('--host', default='127.0.0.1')
+    p_fake.add_argument('--port', type=int, default=DEFAULT_PORT)
+    p_fake.add_argument('--delay', type=float, default=0.0, help='seconds per command line')
+    p_demo = sub.add_parser('demo', help='stream a synthetic sweep to the stand-in instrument and report the stats')
+    p_demo.add_argument('--rate', type=float, default=50.0, help='maximum updates per second')
+    p_demo.add_argument('--submit-rate', type=float, default=200.0, help='setpoints submitted per second')
+    p_demo.add_argument('--seconds', type=float, default=3.0)
+    p_demo.add_argument('--delay', type=float, default=0.001, help='instrument seconds per command line')
+    args = parser.parse_args()
+
+    if args.command == 'fake':
+        fake = FakeInstrument(args.host, args.port, delay=args.delay).start()
+        print('listening on {}:{}'.format(fake.host, fake.port))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            fake.stop()
+    elif args.command == 'demo':
+        with FakeInstrument(delay=args.delay) as fake, SetpointStream(port=fake.port, rate=args.rate) as stream:
+            end = time.perf_counter() + args.seconds
+            k = 0
+            while time.perf_counter() < end:
+                stream.submit(Setpoint(v=30 + 5 * np.sin(k / 50), i=8.0))
+                k += 1
+                time.sleep(1 / args.submit_rate)
+            time.sleep(2 / args.rate)
+            print(format_stats(stream.stats()))
+            print('instrument settings:', fake.settings)
@@ -0,0 +1,305 @@
+""" ivtable.py
+    Precomputed i-v surface of a module for real-time lookups.
+
+    The single diode curves are solved once over a grid of effective irradiance and cell temperature.  The irradiance
+    grid is evenly spaced in sqrt(g_eff) so it is denser at low light where the curves change fastest.  Each curve is
+    stored against the voltage normalized by its own open circuit voltage, which keeps the steep knee near Voc well
+    resolved at every grid point.  At run time I(V), the full curve and the maximum power point are found by bilinear
+    interpolation between the four grid points around (g_eff, t_eff), which takes microseconds instead of a pvlib solve.
+
+    The grid is refined until the interpolated current is within a configurable error of the exact solution, and the
+    finished table is cached on disk per module so it is only built once.
+"""
+
+import os
+import re
+import math
+import hashlib
+import tempfile
+import warnings
+
+import numpy as np
+import pvlib.pvsystem as pvsys
+
+from sg_solarsim import pvmodel
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sg_solarsim', 'ivtable')
+DEFAULT_TOLERANCE = 0.001   # fraction of I_L_ref
+G_MAX = 1400.0              # W/m^2
+T_RANGE = (-30.0, 90.0)     # degrees C
+GRID_STEPS = (12, 12)       # initial number of irradiance and temperature intervals
+X_MAX = 1.1                 # the curves extend a little past Voc so trackers can overshoot
+X_PNTS = 221
+MAX_REFINE = 4              # each refinement doubles the intervals of an axis
+
+
+class IVTable:
+    """
+    Lookup table of the i-v surface of one module.
+
+    point() does the bilinear interpolation setup for an operating condition once, then the returned IVPoint answers
+    I(V), the curve and the MPP for that condition.  Use one IVPoint per tick for every query at that condition.
+    """
+
+    def __init__(self, g, t, x, i, v_oc, i_sc, v_mp, i_mp, p_mp, max_error=None):
+        """
+        Use IVTable.build() or IVTable.for_module() rather than calling this directly.
+        :param g: 1d irradiance grid, evenly spaced in sqrt(g) from 0
+        :param t: 1d temperature grid, evenly spaced
+        :param x: 1d normalized voltage grid V/Voc, evenly spaced from 0
+        :param i: current, shape (len(g), len(t), len(x))
+        :param v_oc: shape (len(g), len(t)), as are i_sc, v_mp, i_mp, p_mp
+        :param max_error: largest current error in amps between short circuit and Voc measured when the table was built
+        """
+        self.g = np.asarray(g, dtype=float)
+        self.t = np.asarray(t, dtype=float)
+        self.x = np.asarray(x, dtype=float)
+        self.i = np.asarray(i, dtype=float)
+        self.v_oc = np.asarray(v_oc, dtype=float)
+        self.i_sc = np.asarray(i_sc, dtype=float)
+        self.v_mp = np.asarray(v_mp, dtype=float)
+        self.i_mp = np.asarray(i_mp, dtype=float)
+        self.p_mp = np.asarray(p_mp, dtype=float)
+        self.max_error = max_error
+
+        # python floats for the scalar path
+        self._keys = np.stack([self.v_oc, self.i_sc, self.v_mp, self.i_mp, self.p_mp], axis=-1).tolist()
+        self._du, self._ng = float(np.sqrt(self.g[1])), len(self.g)
+        self._t0, self._dt, self._nt = float(self.t[0]), float(self.t[1] - self.t[0]), len(self.t)
+        self._dx, self._nx = float(self.x[1] - self.x[0]), len(self.x)
+
+    @classmethod
+    def build(cls, module_params, tolerance=DEFAULT_TOLERANCE, g_max=G_MAX, t_range=T_RANGE, grid_steps=GRID_STEPS,
+              x_pnts=X_PNTS, max_refine=MAX_REFINE):
+        """
+        Solves the single diode model over the grid, refining until the interpolation error is within tolerance.
+        The error is checked between short circuit and Voc, past Voc the table is only a rough guide.
+        :param module_params: parameters of one module, e.g. a column from pvmodel.retrieve_modules()
+        :param tolerance: largest allowed current error as a fraction of the module I_L_ref
+        :param g_max: largest irradiance in the grid
+        :param t_range: (first, last) temperature in the grid
+        :param grid_steps: initial number of (irradiance, temperature) intervals
+        :param x_pnts: number of points on each normalized curve
+        :param max_refine: maximum number of times the intervals of either axis are doubled
+        :return: IVTable
+        """
+        max_error = tolerance * float(module_params['I_L_ref'])
+        x = np.linspace(0, X_MAX, x_pnts)
+        ng, nt = grid_steps
+        for _ in range(max_refine + 1):
+            g = np.linspace(0, np.sqrt(g_max), ng + 1) ** 2
+            t = np.linspace(t_range[0], t_range[1], nt + 1)
+            table = cls(g, t, x, *_solve(module_params, g[:, np.newaxis], t[np.newaxis, :], x))
+
+            # the error is largest between grid points, check half way along each axis against the exact solution
+            gm = ((np.sqrt(g[:-1]) + np.sqrt(g[1:])) / 2) ** 2
+            tm = (t[:-1] + t[1:]) / 2
+            g_error = table._error(module_params, gm[:, np.newaxis], t[np.newaxis, :])
+            t_error = table._error(module_params, g[:, np.newaxis], tm[np.newaxis, :])
+            table.max_error = table._error(module_params, gm[:, np.newaxis], tm[np.newaxis, :])
+            if table.max_error <= max_error:
+                break
+            if g_error > max_error / 2 or t_error <= max_error / 2:
+                ng *= 2
+            if t_error > max_error / 2:
+                nt *= 2
+        else:
+            warnings.warn('i-v table error {:.3g} A is over the tolerance of {:.3g} A after {} refinements'
+                          .format(table.max_error, max_error, max_refine), RuntimeWarning, stacklevel=2)
+        return table
+
+    def _error(self, module_params, g_eff, t_eff):
+        """ largest absolute current error between short circuit and Voc at the given conditions """
+        x = self.x[self.x <= 1]
+        exact = _solve(module_params, g_eff, t_eff, x)
+        v = exact[1][..., np.newaxis] * x
+        return float(np.max(np.abs(self.i_from_v(g_eff[..., np.newaxis], t_eff[..., np.newaxis], v) - exact[0])))
+
+    @classmethod
+    def for_module(cls, module_params, name=None, cache_dir=None, tolerance=DEFAULT_TOLERANCE):
+        """
+        Loads the table for a module from the disk cache, building and saving it on a miss.
+        The cache file name includes a hash of the module parameters and the table settings so a stale table is
+        never used.
+        :param module_params: parameters of one module
+        :param name: module name for the cache file, module_params.name if None
+        :param cache_dir: defaults to ~/.sg_solarsim/ivtable or the SG_SOLARSIM_IVTABLE_CACHE environment variable
+        :param tolerance: see build()
+        :return: IVTable
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('SG_SOLARSIM_IVTABLE_CACHE', DEFAULT_CACHE_DIR)
+        if name is None:
+            name = getattr(module_params, 'name', None) or 'module'
+        params = [float(module_params[k]) for k in ('alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s')]
+        settings = repr((params, tolerance, G_MAX, T_RANGE, GRID_STEPS, X_MAX, X_PNTS, MAX_REFINE)).encode()
+        digest = hashlib.sha1(settings).hexdigest()[:12]
+        path = os.path.join(cache_dir, '{}_{}.npz'.format(re.sub(r'[^A-Za-z0-9_.-]+', '_', str(name)), digest))
+
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            pass
+        table = cls.build(module_params, tolerance=tolerance)
+        os.makedirs(cache_dir, exist_ok=True)
+        table.save(path)
+        return table
+
+    def save(self, path):
+        # write to a temporary file first so a crash never leaves a truncated table behind, named uniquely so
+        # processes building the same table at once do not rename each other's file away
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp_', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, g=self.g, t=self.t, x=self.x, i=self.i, v_oc=self.v_oc, i_sc=self.i_sc, v_mp=self.v_mp,
+                         i_mp=self.i_mp, p_mp=self.p_mp, max_error=np.array(self.max_error, dtype=float))
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz['g'], npz['t'], npz['x'], npz['i'], npz['v_oc'], npz['i_sc'], npz['v_mp'], npz['i_mp'],
+                       npz['p_mp'], max_error=float(npz['max_error']))
+
+    def point(self, g_eff, t_eff):
+        """
+        :return: IVPoint for the operating condition, conditions outside the grid are clamped to its edges
+        """
+        return IVPoint(self, g_eff, t_eff)
+
+    def i_from_v(self, g_eff, t_eff, v):
+        """
+        Vectorized I(V) lookup, g_eff, t_eff and v are broadcast against each other.
+        """
+        g_eff, t_eff, v = np.broadcast_arrays(np.asarray(g_eff, dtype=float), np.asarray(t_eff, dtype=float),
+                                              np.asarray(v, dtype=float))
+        gi, gw = _cell(np.sqrt(np.maximum(g_eff, 0)), 0.0, self._du, self._ng)
+        ti, tw = _cell(t_eff, self._t0, self._dt, self._nt)
+
+        # the corner curves are blended at the same fraction of the interpolated Voc, not at the same voltage,
+        # so the interpolated curve always crosses zero current at Voc
+        xk, xw = _cell(v / _bilinear(self.v_oc, gi, gw, ti, tw), 0.0, self._dx, self._nx)
+        current = 0.0
+        for dg, wg in ((0, 1 - gw), (1, gw)):
+            for dt, wt in ((0, 1 - tw), (1, tw)):
+                a, b = gi + dg, ti + dt
+                current = current + wg * wt * (self.i[a, b, xk] * (1 - xw) + self.i[a, b, xk + 1] * xw)
+        return current
+
+    def mpp(self, g_eff, t_eff):
+        """
+        Vectorized maximum power point lookup
+        :return: v_mp, i_mp, p_mp
+        """
+        return self.key_points(g_eff, t_eff)[2:]
+
+    def key_points(self, g_eff, t_eff):
+        """
+        Vectorized lookup of the key points of the curves
+        :return: v_oc, i_sc, v_mp, i_mp, p_mp
+        """
+        gi, gw = _cell(np.sqrt(np.maximum(g_eff, 0)), 0.0, self._du, self._ng)
+        ti, tw = _cell(np.asarray(t_eff, dtype=float), self._t0, self._dt, self._nt)
+        return tuple(_bilinear(table, gi, gw, ti, tw) for table in (self.v_oc, self.i_sc, self.v_mp, self.i_mp,
+                                                                      self.p_mp))
+
+
+class IVPoint:
+    """
+    One operating condition looked up in an IVTable.
+
+    The grid cell, the bilinear weights and the interpolated key points are found once when the point is created,
+    the queries after that only interpolate along the four corner curves.
+    """
+
+    def __init__(self, table, g_eff, t_eff):
+        self.table = table
+        self.g_eff = g_eff
+        self.t_eff = t_eff
+        gi, gw = _cell_scalar(math.sqrt(max(g_eff, 0)), 0.0, table._du, table._ng)
+        ti, tw = _cell_scalar(t_eff, table._t0, table._dt, table._nt)
+        corners = ((gi, ti), (gi, ti + 1), (gi + 1, ti), (gi + 1, ti + 1))
+        weights = ((1 - gw) * (1 - tw), (1 - gw) * tw, gw * (1 - tw), gw * tw)
+        self._corners = []
+        keys = [0.0] * 5
+        for w, (a, b) in zip(weights, corners):
+            if w > 0:
+                self._corners.append((w, table.i[a, b]))
+                for n, value in enumerate(table._keys[a][b]):
+                    keys[n] += w * value
+        self.v_oc, self.i_sc, self.v_mp, self.i_mp, self.p_mp = keys
+        self._scale = 1 / (self.v_oc * table._dx)
+
+    def i_from_v(self, v):
+        """ module current at voltage v """
+        f = v * self._scale
+        k = int(f)
+        last = self.table._nx - 2
+        if k > last:
+            k = last
+        elif k < 0:
+            k = 0
+        # held at the ends of the curve like IVTable.i_from_v(), not extrapolated
+        f -= k
+        if f > 1.0:
+            f = 1.0
+        elif f < 0.0:
+            f = 0.0
+        current = 0.0
+        for w, curve in self._corners:
+            current += w * (curve[k] + (curve[k + 1] - curve[k]) * f)
+        return float(current)
+
+    def mpp(self):
+        """ :return: v_mp, i_mp, p_mp """
+        return self.v_mp, self.i_mp, self.p_mp
+
+    def curve(self, pnts=100):
+        """
+        :return: dict with v and i arrays from short circuit to open circuit, like pvmodel.singlediode()
+        """
+        v = np.linspace(0, self.v_oc, pnts)
+        i = np.zeros(pnts)
+        x = np.linspace(0, 1, pnts)
+        for w, curve in self._corners:
+            i += w * np.interp(x, self.table.x, curve)
+        return {'v': v, 'i': i, 'v_oc': self.v_oc, 'i_sc': self.i_sc,
+                'v_mp': self.v_mp, 'i_mp': self.i_mp, 'p_mp': self.p_mp}
+
+
+def _solve(module_params, g_eff, t_eff, x):
+    """
+    exact curves on the normalized voltage grid x for broadcast arrays of conditions
+    :return: i, v_oc, i_sc, v_mp, i_mp, p_mp
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        op = pvmodel.batch_operating_points(module_params, g_eff, t_eff)
+        v = op['v_oc'][..., np.newaxis] * x
+        i = pvsys.i_from_v(op['Rsh'][..., np.newaxis], op['Rs'][..., np.newaxis], op['nNsVth'][..., np.newaxis], v,
+                           op['I0'][..., np.newaxis], op['IL'][..., np.newaxis])
+    return np.asarray(i), op['v_oc'], op['i_sc'], op['v_mp'], op['i_mp'], op['p_mp']
+
+
+def _cell(value, start, step, n):
+    """ vectorized index of the grid cell holding value and the fractional position in it """
+    f = np.clip((value - start) / step, 0, n - 1)
+    k = np.minimum(f.astype(int), n - 2)
+    return k, f - k
+
+
+def _cell_scalar(value, start, step, n):
+    f = (value - start) / step
+    if f <= 0:
+        return 0, 0.0
+    if f >= n - 1:
+        return n - 2, 1.0
+    k = int(f)
+    return k, f - k
+
+
+def _bilinear(table, gi, gw, ti, tw):
+    return ((1 - gw) * (1 - tw) * table[gi, ti] + (1 - gw) * tw * table[gi, ti + 1]
+            + gw * (1 - tw) * table[gi + 1, ti] + gw * tw * table[gi + 1, ti + 1])
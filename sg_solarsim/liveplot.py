@@ -0,0 +1,145 @@
+""" liveplot.py
+    Live i-v curve and mppt trajectory plot with constant cost per frame.
+
+    The trajectory is a fixed size ring of the latest operating points drawn by a single artist, so the artist count
+    and memory do not grow however long the session runs.  The axes, ticks and labels are drawn once into a cached
+    background; a frame restores the background and redraws only the curve, the trajectory and the present point
+    (blitting).  Frames are capped at fps independently of how often points are added, extra calls to draw() return
+    without drawing.  The full figure is only redrawn when it is resized or a point falls outside the axis limits.
+"""
+
+import time
+
+import numpy as np
+
+
+class LivePlot:
+    """
+    i-v curve plus mppt trajectory, fed with set_curve() and add_point() and drawn with draw()
+    """
+
+    def __init__(self, fig=None, ax=None, trajectory=500, fps=20.0, xlim=(0, 50), ylim=(0, 10), title=None,
+                 clock=time.monotonic):
+        """
+        :param fig: matplotlib figure, a new pyplot figure if None
+        :param ax: axes to draw on, a new subplot of fig if None
+        :param trajectory: number of latest operating points shown, 0 for none
+        :param fps: most frames drawn per second
+        :param xlim: initial voltage limits, grown when a point falls outside
+        :param ylim: initial current limits, grown when a point falls outside
+        """
+        if fig is None:
+            import matplotlib.pyplot as plt
+            fig = plt.figure()
+        if ax is None:
+            ax = fig.add_subplot(111)
+        self.fig = fig
+        self.ax = ax
+        self.min_interval = 1.0 / fps if fps else 0.0
+        self.clock = clock
+
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+        ax.set_xlabel('voltage (V)')
+        ax.set_ylabel('current (A)')
+        if title:
+            ax.set_title(title)
+
+        # animated artists are left out of the full draw that makes the background
+        self.curve, = ax.plot([], [], animated=True)
+        self.trail, = ax.plot([], [], linestyle='none', marker='o', markersize=3, alpha=0.4, animated=True)
+        self.point, = ax.plot([], [], linestyle='none', marker='o', color='red', animated=True)
+        self._artists = (self.curve, self.trail, self.point)
+
+        self._v = np.zeros(trajectory)
+        self._i = np.zeros(trajectory)
+        self._n = 0             # points added
+        self._dirty = False
+        self._last = None       # time of the last frame
+        self._background = None
+        self.frames = 0
+        self.frame_time = 0.0   # seconds spent drawing frames
+
+        # a resize or other full redraw invalidates the background
+        fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def show(self):
+        self.fig.show()
+        self.redraw()
+
+    def set_curve(self, v, i):
+        """ :param v, i: arrays of the i-v curve of the present conditions """
+        self.curve.set_data(v, i)
+        self._fit(np.max(v, initial=0.0), np.max(i, initial=0.0))
+        self._dirty = True
+
+    def add_point(self, v, i):
+        """ adds an operating point to the trajectory and makes it the present point """
+        if len(self._v):
+            k = self._n % len(self._v)
+            self._v[k] = v
+            self._i[k] = i
+        self._n += 1
+        self.point.set_data([v], [i])
+        self._fit(v, i)
+        self._dirty = True
+
+    def trajectory(self):
+        """ :return: v, i of the points held, oldest first """
+        size = len(self._v)
+        if self._n <= size:
+            return self._v[:self._n], self._i[:self._n]
+        k = self._n % size
+        return np.concatenate([self._v[k:], self._v[:k]]), np.concatenate([self._i[k:], self._i[:k]])
+
+    def _fit(self, v, i):
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        if v > x1 or i > y1:
+            # rare: grow by half again and redraw the static parts once
+            self.ax.set_xlim(x0, max(x1, 1.5 * v))
+            self.ax.set_ylim(y0, max(y1, 1.5 * i))
+            self._background = None
+
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for a in self._artists:
+            self.ax.draw_artist(a)
+
+    def redraw(self):
+        """ full redraw of the figure, caching the background """
+        self.fig.canvas.draw()
+
+    def draw(self, force=False):
+        """
+        Draws a frame if anything changed and the frame rate allows
+        :param force: ignore the frame rate cap
+        :return: True if a frame was drawn
+        """
+        now = self.clock()
+        if not self._dirty or (not force and self._last is not None and now - self._last < self.min_interval):
+            return False
+        began = time.perf_counter()
+        self._last = now
+        self._dirty = False
+
+        canvas = self.fig.canvas
+        if len(self._v):
+            self.trail.set_data(self._v[:min(self._n, len(self._v))], self._i[:min(self._n, len(self._v))])
+        if self._background is None or not getattr(canvas, 'supports_blit', False):
+            # the draw_event handler caches the background and draws the animated artists
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            for a in self._artists:
+                self.ax.draw_artist(a)
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+        self.frames += 1
+        self.frame_time += time.perf_counter() - began
+        return True
+
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
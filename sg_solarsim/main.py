@@ -1,20 +1,45 @@
 """ Solar Sim main program
     Launches ss_gui
     closes when ss_gui is closed
+
+    With --headless the simulation runs without a display, as fast as possible, over the chosen date range.
 """
-from sg_solarsim.ss_gui import SSTopGui
-from mppt import MPPT
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
 
-import matplotlib.pyplot as plt
+from sg_solarsim.engine import SimulationEngine
+from sg_solarsim.mppt import MPPT
+from sg_solarsim import pvmodel
+from sg_solarsim.ivtable import IVTable
+from sg_solarsim.moduledb import get_modules
+from sg_solarsim.scheduler import Scheduler, format_stats
+from sg_solarsim.profiling import profiler
 
 
-def main(plt_curve=False):
+def main(plt_curve=False, instrument=None, tick=0.05, policy='catch_up', report_interval=None, checkpoint=None,
+         checkpoint_interval=10.0, threaded=True, frame=0.05):
     """
     Starts the solarsim gui and runs it in a while loop
 
     :param iv_plot: boolean if True will plot the I-V curve while the tmy clock is running
+    :param instrument: host:port of a SCPI solar array simulator to stream the operating points to
+    :param tick: seconds between simulation ticks
+    :param policy: what to do with ticks missed while the gui was busy, see scheduler.Scheduler
+    :param report_interval: seconds between profile reports while running, if profiling is enabled
+    :param checkpoint: file the clock and tracker state is saved to while running, a clock started on the same dates
+                       carries on from it
+    :param checkpoint_interval: wall clock seconds between checkpoints
+    :param threaded: run the simulation and tracker on a worker thread, the gui only draws its latest state, else
+                     both share the gui loop
+    :param frame: seconds between gui refreshes when threaded
     :return: none
     """
+    # the gui toolkits are only needed here, not for headless runs
+    from sg_solarsim.ss_gui import SSTopGui
+    from sg_solarsim.liveplot import LivePlot
+    from sg_solarsim import checkpoint as ckpt
 
     sstop = SSTopGui(modlistname='CECMod', iv_plot=True)
     sstop.start_gui()
@@ -22,39 +47,342 @@ def main(plt_curve=False):
     # instantiate an mppt tracker with default values
     mppt = MPPT()
     v_ref = mppt.v_ref
+    step = mppt.step
+
+    # figure to plot the mppt tracker, the latest points only and at a capped frame rate
+    plot = LivePlot(trajectory=500, fps=20, xlim=(0, 45), ylim=(0, 10), title='mppt trajectory')
+    plot.show()
+
+    # the supply is fed from its own thread, the gui loop only hands over the latest setpoint
+    stream = None
+    if instrument is not None:
+        from sg_solarsim.instrument import SetpointStream, Setpoint
+        host, _, port = instrument.partition(':')
+        stream = SetpointStream(host, int(port or 5025)).start()
+
+    if threaded:
+        _main_threaded(sstop, plot, stream, step, tick, policy, report_interval, checkpoint, checkpoint_interval, frame)
+        return
 
-    # figure to plot the mppt tracker
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    ax.set_xbound(45)
-    ax.set_ybound(10)
-    fig.show()
+    # the simulation advances on a fixed rate of ticks, by the tick's virtual time rather than the wall clock
+    scheduler = Scheduler(period=tick, policy=policy).start()
 
+    clock = None            # the clock the checkpoint was last restored to or saved from
+    saved = time.monotonic()
 
     while 1:
         # first check to see if the gui has been closed
         if sstop.state == 'CLOSED':
             break
 
+        # one engine step and mppt update per tick, deterministic however late the ticks run
+        for now in scheduler.due():
+            if sstop.clk == []:
+                continue
+            if checkpoint and sstop.clk is not clock:
+                # a new clock, resume the run if the checkpoint is of the same dates
+                clock = sstop.clk
+                if ckpt.restore(checkpoint, clock.engine, mppt) is not None:
+                    v_ref = mppt.v_ref
+            with profiler.phase('engine.update'):
+                sstop.clk.engine.update(now)
+            profiler.count('ticks')
+
+            # get the module current at the present v_ref, the lookup is shared with the i-v curve plot
+            with profiler.phase('model.operating_point'):
+                op = sstop.operating_point(g_eff=sstop.clk.g_eff, t_eff=sstop.clk.t_cell)
+            # the tracker works on the array voltage, its step grows with the modules in series
+            mppt.step = step * sstop.array_model().series
+            with profiler.phase('model.i_from_v'):
+                current = op.i_from_v(v_ref)
+
+            # run the mppt algorithm to get the new v_ref then get the new current
+            with profiler.phase('mppt.inc_cond'):
+                v_ref = mppt.inc_cond(v_ref, current)
+            with profiler.phase('model.i_from_v'):
+                current = op.i_from_v(v_ref)
+            if stream is not None:
+                stream.submit(Setpoint(v_ref, current))
+            plot.add_point(v_ref, current)
+
         # This is the "outer loop"
-        # if the TMY Clock is running, update it
-        sstop.run_gui()
+        # gui events until the next tick, the clock is drawn at the latest tick's time
+        sstop.run_gui(timeout=int(scheduler.remaining() * 1000), now=scheduler.time)
 
+        # plot the new v-i points
+        with profiler.phase('trajectory.draw'):
+            if plot.draw():
+                profiler.count('trajectory.frames')
+        if report_interval:
+            profiler.maybe_report(report_interval)
+        if checkpoint and clock is not None and sstop.clk is clock and time.monotonic() - saved >= checkpoint_interval:
+            ckpt.save(checkpoint, engine=clock.engine.snapshot(), tracker=mppt.snapshot())
+            saved = time.monotonic()
 
-        if sstop.clk != []:
-            # get the module current at the present v_ref
-            IL, I0, Rs, Rsh, nNsVth = sstop.calcparams_desoto(g_eff=sstop.clk.g_eff, t_eff=sstop.clk.t_air)
-            current = sstop.i_from_v(Rsh, Rs, nNsVth, v_ref, I0, IL)
+    print(format_stats(scheduler.stats()))
+    if stream is not None:
+        _stop_stream(stream)
+    if profiler.enabled:
+        print(profiler.report())
 
-            # run the mppt algorithm to get the new v_ref then get the new current
+
+def _stop_stream(stream):
+    """ sends the last setpoint, stops the stream and prints its update rate and latency """
+    from sg_solarsim import instrument
+
+    stream.stop()
+    print('instrument: ' + instrument.format_stats(stream.stats()))
+
+
+def _main_threaded(sstop, plot, stream, step, tick, policy, report_interval, checkpoint, checkpoint_interval,
+                   frame):
+    """
+    The gui loop of main() with the simulation on a worker.SimulationWorker: the gui refreshes every frame seconds
+    from the worker's snapshots, however slow a redraw is the worker keeps ticking
+    """
+    from sg_solarsim import checkpoint as ckpt
+
+    clock = None            # the clock the worker was started for
+    worker = None
+    failure = None          # exception that ended the worker thread
+    saved = time.monotonic()
+
+    while 1:
+        if sstop.state == 'CLOSED':
+            break
+
+        if sstop.clk is not clock:
+            # a new clock gets a worker of its own, Stop has already stopped the last one
+            clock = sstop.clk
+            if clock != []:
+                tracker = MPPT()
+                if checkpoint:
+                    # resume the run if the checkpoint is of the same dates
+                    ckpt.restore(checkpoint, clock.engine, tracker)
+                    clock.engine.pause = False     # play was just pressed
+                worker = sstop.start_worker(tracker=tracker, step=step, period=tick, policy=policy, stream=stream)
+
+        # every point the tracker went through since the last frame, as many as the worker kept
+        if sstop.worker is not None:
+            for snapshot in sstop.worker.drain():
+                plot.add_point(snapshot.v_ref, snapshot.current)
+            # a worker that died would leave the gui showing its last snapshot forever
+            failure = sstop.worker_failed()
+            if failure is not None:
+                break
+
+        sstop.run_gui(timeout=int(frame * 1000))
+
+        with profiler.phase('trajectory.draw'):
+            if plot.draw():
+                profiler.count('trajectory.frames')
+        if report_interval:
+            profiler.maybe_report(report_interval)
+        if checkpoint and sstop.worker is not None and time.monotonic() - saved >= checkpoint_interval:
+            sstop.worker.checkpoint(checkpoint)
+            saved = time.monotonic()
+
+    sstop.stop_worker()
+    if worker is not None:
+        print(format_stats(worker.scheduler.stats()))
+    if stream is not None:
+        _stop_stream(stream)
+    if profiler.enabled:
+        print(profiler.report())
+    if failure is not None:
+        raise RuntimeError('the simulation worker failed') from failure
+
+
+def _thermal(thermal, module_params):
+    """ a model name as a CellTemperature using the module's T_NOCT, anything else as it is """
+    if isinstance(thermal, str):
+        from sg_solarsim.celltemp import CellTemperature
+        return CellTemperature.for_module(thermal, module_params)
+    return thermal
+
+
+def run_headless(lat=39.13, lng=-77.21, starttime=None, endtime=None, timestep=60.0, modlistname='CECMod', module=None,
+                 engine=None, use_table=False, resample=None, clouds=None, tilt=None, azimuth=180.0,
+                 thermal='faiman', report_interval=None):
+    """
+    Runs the simulation without the GUI, stepping the engine through the whole date range as fast as possible
+    and running the mppt tracker once per step.
+
+    :param lat: latitude of the site
+    :param lng: longitude of the site
+    :param starttime: Datetime to start the simulation
+    :param endtime: Datetime to end the simulation
+    :param timestep: simulated seconds per step
+    :param modlistname: module list to get the module from
+    :param module: module name, the first module in the list if None
+    :param engine: SimulationEngine to step, one is created from the other arguments if None
+    :param use_table: look the module up in its IVTable instead of solving the single diode model every step
+    :param resample: seconds between samples of a high resolution weather series, hourly interpolation if None
+    :param clouds: seed of the stochastic clouds of the high resolution series
+    :param tilt: tilt of the module in degrees, g_eff is the plane of array irradiance if given, else the ghi
+    :param azimuth: degrees clockwise from north the module faces
+    :param thermal: cell temperature model, 'faiman' or 'noct' with the module's T_NOCT, None for cells at air
+                    temperature
+    :param report_interval: seconds between profile reports while running, if profiling is enabled
+    :return: list of (time, g_eff, t_air, v_ref, current) tuples, one per step
+    """
+    modules = get_modules(modlistname)
+    if module is None:
+        module = modules.names[0]
+    module_params = modules[module]
+    table = IVTable.for_module(module_params, name=module) if use_table else None
+
+    if engine is None:
+        engine = SimulationEngine(lat=lat, lng=lng, starttime=starttime, endtime=endtime, timestep=timestep,
+                                  resample=resample, clouds=clouds, tilt=tilt, azimuth=azimuth,
+                                  thermal=_thermal(thermal, module_params))
+
+    # instantiate an mppt tracker with default values
+    mppt = MPPT()
+    v_ref = mppt.v_ref
+
+    results = []
+    for eng in engine.run():
+        profiler.count('steps')
+        if report_interval:
+            profiler.maybe_report(report_interval)
+        if table is not None:
+            with profiler.phase('model.operating_point'):
+                op = table.point(eng.g_eff, eng.t_cell)
+            with profiler.phase('model.i_from_v'):
+                current = op.i_from_v(v_ref)
+            with profiler.phase('mppt.inc_cond'):
+                v_ref = mppt.inc_cond(v_ref, current)
+            with profiler.phase('model.i_from_v'):
+                current = op.i_from_v(v_ref)
+            results.append((eng.displaytime, eng.g_eff, eng.t_air, v_ref, current))
+            continue
+
+        # get the module current at the present v_ref
+        with profiler.phase('model.calcparams_desoto'):
+            IL, I0, Rs, Rsh, nNsVth = pvmodel.calcparams_desoto(module_params, g_eff=eng.g_eff, t_eff=eng.t_cell)
+        with profiler.phase('model.i_from_v'):
+            current = pvmodel.i_from_v(Rsh, Rs, nNsVth, v_ref, I0, IL)
+
+        # run the mppt algorithm to get the new v_ref then get the new current
+        with profiler.phase('mppt.inc_cond'):
             v_ref = mppt.inc_cond(v_ref, current)
-            current = sstop.i_from_v(Rsh, Rs, nNsVth, v_ref, I0, IL)
+        with profiler.phase('model.i_from_v'):
+            current = pvmodel.i_from_v(Rsh, Rs, nNsVth, v_ref, I0, IL)
+        results.append((eng.displaytime, eng.g_eff, eng.t_air, v_ref, float(current)))
+
+    return results
+
+
+def record_headless(path, lat=39.13, lng=-77.21, starttime=None, endtime=None, timestep=60.0, modlistname='CECMod',
+                    module=None, use_table=False, chunk=8192, resample=None, clouds=None, tilt=None, azimuth=180.0,
+                    thermal='faiman', checkpoint=None, report_interval=None):
+    """
+    Runs the simulation without the GUI like run_headless() but streams every step to a file instead of keeping it,
+    so memory does not grow with the length of the run.
 
-            # plot the new v-i point
-            #print (v_ref, current)
-            ax.plot(v_ref, current, marker='o')
-            fig.show()
+    :param path: a .csv file, or a directory for one memory mappable column file per field
+    :param checkpoint: checkpoint file saved every chunk steps, a run stopped part way carries on from it when run
+                       again with the same arguments, removed once the run is complete
+    :param report_interval: seconds between profile reports while running, if profiling is enabled
+    :return: number of steps recorded
+    """
+    from sg_solarsim import recorder
+    from sg_solarsim import checkpoint as ckpt
+
+    modules = get_modules(modlistname)
+    if module is None:
+        module = modules.names[0]
+    table = IVTable.for_module(modules[module], name=module) if use_table else None
+    engine = SimulationEngine(lat=lat, lng=lng, starttime=starttime, endtime=endtime, timestep=timestep,
+                              resample=resample, clouds=clouds, tilt=tilt, azimuth=azimuth,
+                              thermal=_thermal(thermal, modules[module]))
+    tracker = MPPT()
+
+    state = ckpt.restore(checkpoint, engine, tracker) if checkpoint else None
+    if state is not None:
+        # the checkpointed step was recorded, carry on from the one after it
+        engine.step()
+        sink = recorder.open_sink(path, chunk=chunk, resume=state['sink'])
+    else:
+        sink = recorder.open_sink(path, chunk=chunk)
+    saver = ckpt.Checkpointer(checkpoint, engine, tracker, sink, every=chunk) if checkpoint else None
+    after = saver
+    if report_interval:
+        def after():
+            if saver is not None:
+                saver()
+            profiler.count('steps')
+            profiler.maybe_report(report_interval)
+    stream = recorder.records(engine, modules[module], table=table, tracker=tracker)
+    recorder.record(stream, sink, checkpoint=after)
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return sink.count
+
+
+def parse_date(text):
+    """ dates are given as MM-DD, the time is noon like the GUI """
+    return datetime.strptime(text, '%m-%d').replace(year=2000) + timedelta(hours=12)
 
 
 if __name__ == "__main__":
-    main(plt_curve=True)
+    parser = argparse.ArgumentParser(description='NIST Solar Array Simulator')
+    parser.add_argument('--headless', action='store_true', help='run without the GUI as fast as possible')
+    parser.add_argument('--lat', type=float, default=39.13)
+    parser.add_argument('--lng', type=float, default=-77.21)
+    parser.add_argument('--start', type=parse_date, default=None, help='start date MM-DD')
+    parser.add_argument('--end', type=parse_date, default=None, help='end date MM-DD')
+    parser.add_argument('--timestep', type=float, default=60.0, help='simulated seconds per step')
+    parser.add_argument('--modlist', default='CECMod')
+    parser.add_argument('--module', default=None)
+    parser.add_argument('--table', action='store_true', help='use the precomputed i-v table of the module')
+    parser.add_argument('--resample', type=float, default=None,
+                        help='seconds between samples of high resolution weather instead of the hourly interpolation')
+    parser.add_argument('--clouds', type=int, default=None, help='seed of stochastic clouds in the resampled weather')
+    parser.add_argument('--tilt', type=float, default=None,
+                        help='module tilt in degrees, simulate the plane of array irradiance instead of the ghi')
+    parser.add_argument('--azimuth', type=float, default=180.0, help='degrees clockwise from north the module faces')
+    parser.add_argument('--thermal', choices=['faiman', 'noct', 'none'], default='faiman',
+                        help='cell temperature model, none for cells at air temperature')
+    parser.add_argument('--record', default=None, help='stream every step to a .csv file or a column directory')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint file of the recording or the gui run, resumes from it if it is there')
+    parser.add_argument('--instrument', default=None, help='host:port of a SCPI supply to stream setpoints to')
+    parser.add_argument('--tick', type=float, default=0.05, help='seconds between gui simulation ticks')
+    parser.add_argument('--policy', choices=['catch_up', 'skip'], default='catch_up',
+                        help='what to do with ticks missed while the gui was busy')
+    parser.add_argument('--single-thread', action='store_true',
+                        help='run the simulation in the gui loop instead of on a worker thread')
+    parser.add_argument('--profile', action='store_true', help='time the phases of the loop and report on exit')
+    parser.add_argument('--profile-interval', type=float, default=None,
+                        help='also print the profile every this many seconds while running')
+    parser.add_argument('--profile-out', default=None, help='write the profile statistics to a json file on exit')
+    args = parser.parse_args()
+    thermal = None if args.thermal == 'none' else args.thermal
+    if args.profile or args.profile_out or args.profile_interval:
+        profiler.enable()
+
+    if args.headless and args.record:
+        n = record_headless(args.record, lat=args.lat, lng=args.lng, starttime=args.start, endtime=args.end,
+                            timestep=args.timestep, modlistname=args.modlist, module=args.module,
+                            use_table=args.table, resample=args.resample, clouds=args.clouds,
+                            tilt=args.tilt, azimuth=args.azimuth, thermal=thermal, checkpoint=args.checkpoint,
+                            report_interval=args.profile_interval)
+        print('{} steps recorded to {}'.format(n, args.record))
+    elif args.headless:
+        results = run_headless(lat=args.lat, lng=args.lng, starttime=args.start, endtime=args.end,
+                               timestep=args.timestep, modlistname=args.modlist, module=args.module,
+                               use_table=args.table, resample=args.resample, clouds=args.clouds,
+                               tilt=args.tilt, azimuth=args.azimuth, thermal=thermal,
+                               report_interval=args.profile_interval)
+        energy = sum(r[3] * r[4] for r in results) * args.timestep / 3600
+        print('{} steps, {:.1f} Wh'.format(len(results), energy))
+    else:
+        main(plt_curve=True, instrument=args.instrument, tick=args.tick, policy=args.policy,
+             report_interval=args.profile_interval, checkpoint=args.checkpoint, threaded=not args.single_thread)
+    if profiler.enabled:
+        if args.headless:
+            print(profiler.report())
+        if args.profile_out:
+            profiler.dump(args.profile_out)
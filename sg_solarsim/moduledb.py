@@ -0,0 +1,207 @@
+""" moduledb.py
+    Compact module parameter store.
+
+    pvlib's retrieve_sam() parses the whole SAM library csv into a wide DataFrame every time it is called.  The
+    simulator only uses a handful of parameters per module, so each module list is converted once into
+        {modlist}.npy   float64 array of shape (len(PARAMETERS), modules), one contiguous row per parameter
+        {modlist}.json  module names, parameter names and the pvlib version the store was built from
+    under ~/.sg_solarsim/modules (or $SG_SOLARSIM_MODULE_CACHE).  A module list can also be a csv in the SAM library
+    format, its store is rebuilt whenever the csv changes.  The array is memory mapped, so opening a store is
+    a json read and an mmap, and whole parameter rows can be used directly in vectorized code.
+
+    Parameters a module list does not have (the Sandia list has no DeSoto parameters) are stored as nan.
+
+        python -m sg_solarsim.moduledb build CECMod
+"""
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sg_solarsim', 'modules')
+
+# DeSoto parameters used by pvmodel.calcparams_desoto() first, then the datasheet values
+PARAMETERS = ('alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s',
+              'N_s', 'I_sc_ref', 'V_oc_ref', 'I_mp_ref', 'V_mp_ref', 'beta_oc', 'gamma_r', 'T_NOCT', 'STC')
+
+
+def _write(path, suffix, write, mode='wb'):
+    """
+    Writes path + suffix through a temp file of its own in the same directory, so two processes building a store at
+    once never write the same file
+    :param write: function taking the open temp file
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix=suffix)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp, path + suffix)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _store_name(modlistname):
+    """ :return: file name of the store of a module list or csv """
+    if modlistname.lower().endswith('.csv'):
+        return os.path.splitext(os.path.basename(modlistname))[0]
+    return modlistname
+
+
+def _source_stamp(modlistname):
+    """ :return: path, size and mtime of a module list csv, None for the lists shipped with pvlib """
+    if not modlistname.lower().endswith('.csv'):
+        return None
+    st = os.stat(modlistname)
+    return [os.path.abspath(modlistname), st.st_size, st.st_mtime_ns]
+
+
+class ModuleParams(dict):
+    """ parameters of one module, indexed like a column of the retrieve_sam() DataFrame """
+
+    def __init__(self, name, values):
+        super().__init__(values)
+        self.name = name
+
+
+class ModuleDB:
+    """
+    Read only, memory mapped parameters of every module in a module list.
+    Parameters of a module are converted to a ModuleParams the first time they are fetched and reused after that.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the store without extension, as written by build()
+        """
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        self.modlistname = meta['modlistname']
+        self.pvlib_version = meta.get('pvlib')
+        self.source = meta.get('source')
+        self.parameters = tuple(meta['parameters'])
+        self.names = meta['names']
+        self.values = np.load(path + '.npy', mmap_mode='r')
+        self.index = {name: k for k, name in enumerate(self.names)}
+        self._rows = {p: k for k, p in enumerate(self.parameters)}
+        self._records = {}
+
+    @staticmethod
+    def _version():
+        try:
+            from importlib.metadata import version
+        except ImportError:
+            # python 3.7
+            from importlib_metadata import version
+        return version('pvlib')
+
+    @classmethod
+    def build(cls, modlistname='CECMod', cache_dir=None):
+        """
+        Converts a module list from pvlib into a store
+        :return: ModuleDB
+        """
+        from sg_solarsim import pvmodel
+
+        if cache_dir is None:
+            cache_dir = os.environ.get('SG_SOLARSIM_MODULE_CACHE', DEFAULT_CACHE_DIR)
+        # stamped before reading, a csv changed while it is read is rebuilt next time
+        source = _source_stamp(modlistname)
+        modules = pvmodel.retrieve_modules(modlistname)
+        values = np.full((len(PARAMETERS), modules.shape[1]), np.nan)
+        for k, p in enumerate(PARAMETERS):
+            if p in modules.index:
+                values[k] = modules.loc[p].to_numpy(dtype=float)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, _store_name(modlistname))
+        # the array first: a store is only complete once its json is in place
+        _write(path, '.npy', lambda f: np.save(f, values))
+        meta = {
+            'modlistname': modlistname,
+            'pvlib': cls._version(),
+            'source': source,
+            'parameters': list(PARAMETERS),
+            'names': modules.columns.astype(str).tolist(),
+        }
+        _write(path, '.json', lambda f: json.dump(meta, f), mode='w')
+        return cls(path)
+
+    @classmethod
+    def open(cls, modlistname='CECMod', cache_dir=None):
+        """
+        Opens the store of a module list, building it if it is missing, was built with another pvlib or parameter set
+        or its csv has changed
+        :param modlistname: name of a module list in the pvlib-python data folder, or the path of a SAM format csv
+        :param cache_dir: defaults to ~/.sg_solarsim/modules or the SG_SOLARSIM_MODULE_CACHE environment variable
+        :return: ModuleDB
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('SG_SOLARSIM_MODULE_CACHE', DEFAULT_CACHE_DIR)
+        path = os.path.join(cache_dir, _store_name(modlistname))
+        try:
+            db = cls(path)
+        except (OSError, ValueError, KeyError):
+            return cls.build(modlistname, cache_dir)
+        if (db.parameters != PARAMETERS or db.pvlib_version != cls._version()
+                or db.source != _source_stamp(modlistname)):
+            return cls.build(modlistname, cache_dir)
+        return db
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        """
+        :param name: module name
+        :return: ModuleParams of the module
+        """
+        record = self._records.get(name)
+        if record is None:
+            k = self.index[name]
+            # numpy scalars like the DataFrame column, pvlib relies on them for a zero irradiance divide
+            record = self._records[name] = ModuleParams(name, zip(self.parameters, np.array(self.values[:, k])))
+        return record
+
+    def column(self, parameter):
+        """
+        :return: read only array of one parameter for every module, in the order of names
+        """
+        return self.values[self._rows[parameter]]
+
+
+_stores = {}
+
+
+def get_modules(modlistname='CECMod'):
+    """ the store of a module list, opened on first use and shared """
+    db = _stores.get(modlistname)
+    if db is None:
+        db = _stores[modlistname] = ModuleDB.open(modlistname)
+    return db
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build the module parameter store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_build = sub.add_parser('build', help='convert a module list from pvlib')
+    p_build.add_argument('modlist', nargs='*', default=['CECMod'])
+    p_show = sub.add_parser('show', help='print the parameters of a module')
+    p_show.add_argument('module')
+    p_show.add_argument('--modlist', default='CECMod')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for name in args.modlist:
+            db = ModuleDB.build(name)
+            print('{}: {} modules'.format(name, len(db)))
+    elif args.command == 'show':
+        for k, v in get_modules(args.modlist)[args.module].items():
+            print('{:<10}{}'.format(k, v))
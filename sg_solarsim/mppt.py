@@ -1,10 +1,17 @@
 """
 Class and methods for mppt tracker(s)
+
+All trackers share the Tracker interface: track(v, i) takes the measured voltage and current and returns the new
+reference voltage.  TRACKERS maps a short name to each tracker class.
 """
+import abc
+
+import numpy as np
+
 
-class MPPT:
+class Tracker(abc.ABC):
     """
-    MPPT class
+    Base class of the mppt trackers
     """
 
     def __init__(self,
@@ -18,6 +25,40 @@ class MPPT:
         self.v_ref = V0
         self.step = step
 
+    @abc.abstractmethod
+    def _track(self, v, i):
+        """ moves self.v_ref for the measured v and i, every tracker implements this """
+
+    def track(self, v, i):
+        """
+        :param v: measured voltage
+        :param i: measured current
+        :return: new reference voltage, never below 0
+        """
+        self._track(v, i)
+        if self.v_ref < 0:
+            self.v_ref = 0
+        return self.v_ref
+
+    def sample_voc(self, v_oc):
+        """
+        Open circuit voltage measurement, e.g. from briefly disconnecting the load.
+        Ignored by trackers that do not use it.
+        """
+        pass
+
+    def snapshot(self):
+        """ :return: dict of the tracker state for restore(), json serializable """
+        return {k: v.item() if hasattr(v, 'item') else v for k, v in vars(self).items()}
+
+    def restore(self, state):
+        self.__dict__.update(state)
+
+
+class MPPT(Tracker):
+    """
+    MPPT class
+    """
 
     def _inc_cond(self, v, i):
         """
@@ -68,3 +109,174 @@ class MPPT:
             self.v_ref = 0
         return self.v_ref
 
+    def _track(self, v, i):
+        return self._inc_cond(v, i)
+
+
+class PerturbObserve(Tracker):
+    """
+    Perturb and observe: keep stepping in the same direction while the power increases, reverse when it falls
+    """
+
+    def __init__(self, V0=0, I0=0, step=0.5):
+        Tracker.__init__(self, V0, I0, step)
+        self.direction = 1
+
+    def _track(self, v, i):
+        dp = v * i - self.v_k1 * self.i_k1
+        self.v_k1 = v
+        self.i_k1 = i
+        if dp < 0:
+            self.direction = -self.direction
+        self.v_ref += self.direction * self.step
+        return self.v_ref
+
+
+class VariableStepIncCond(Tracker):
+    """
+    Incremental conductance with the step scaled by the slope of the power curve,
+    large steps far from the maximum power point and small steps close to it.
+    Liu, F., Duan, S., Liu, F., Liu, B. & Kang, Y. A variable step size INC MPPT method for PV systems.
+    IEEE Trans. Ind. Electron. 55, 2622-2628 (2008). https://doi.org/10.1109/TIE.2008.920550
+    """
+
+    def __init__(self, V0=0, I0=0, step=0.5, gain=0.5, step_min=0.01, step_max=1.0):
+        """
+        :param step: step size used while the power slope is unknown
+        :param gain: step = gain * |dP/dV|
+        :param step_min: smallest step
+        :param step_max: largest step, right of the maximum power point the power slope is steep and larger steps
+            overshoot it back and forth
+        """
+        Tracker.__init__(self, V0, I0, step)
+        self.gain = gain
+        self.step_min = step_min
+        self.step_max = step_max
+
+    def _track(self, v, i):
+        dv = v - self.v_k1
+        di = i - self.i_k1
+        dp = v * i - self.v_k1 * self.i_k1
+        self.v_k1 = v
+        self.i_k1 = i
+        if dv == 0:
+            if di > 0:
+                self.v_ref += self.step
+            elif di < 0:
+                self.v_ref -= self.step
+            return self.v_ref
+
+        step = min(max(self.gain * abs(dp / dv), self.step_min), self.step_max)
+        # dP/dV = I + V dI/dV is positive left of the maximum power point
+        l = i + v * di / dv
+        if l > 0:
+            self.v_ref += step
+        elif l < 0:
+            self.v_ref -= step
+        return self.v_ref
+
+
+class ConstantVoltage(Tracker):
+    """
+    Fractional open circuit voltage: holds the reference at a fixed fraction of the last measured Voc.
+    Until a Voc measurement arrives the reference steps up from V0 toward the open circuit.
+    """
+
+    def __init__(self, V0=0, I0=0, step=0.5, fraction=0.76, v_oc=None):
+        """
+        :param fraction: v_ref / Voc, 0.71 to 0.80 for crystalline silicon
+        :param v_oc: initial open circuit voltage, e.g. from the module datasheet
+        """
+        Tracker.__init__(self, V0, I0, step)
+        self.fraction = fraction
+        self.v_oc = v_oc
+
+    def sample_voc(self, v_oc):
+        self.v_oc = v_oc
+
+    def _track(self, v, i):
+        self.v_k1 = v
+        self.i_k1 = i
+        if self.v_oc is None:
+            # no measurement yet, the current falls to zero at the open circuit
+            if i > 0:
+                self.v_ref += self.step
+            else:
+                self.v_oc = v
+        if self.v_oc is not None:
+            self.v_ref = self.fraction * self.v_oc
+        return self.v_ref
+
+
+TRACKERS = {
+    'inc_cond': MPPT,
+    'p_and_o': PerturbObserve,
+    'vs_inc_cond': VariableStepIncCond,
+    'cv_fraction': ConstantVoltage,
+}
+
+
+class MPPTBank:
+    """
+    State for many MPPT trackers held in numpy arrays, stepped together.
+
+    Each tracker follows exactly the same modified incremental conductance rules as MPPT so a bank of N trackers gives
+    the same v_ref as N MPPT objects fed the same voltages and currents.
+    """
+
+    def __init__(self,
+                 n,
+                 V0 = 0,
+                 I0 = 0,
+                 step = 0.5     # increment or decrement step size, scalar or one per tracker
+                 ):
+        """
+        :param n: number of trackers
+        :param V0: initial voltage, scalar or array of n
+        :param I0: initial current, scalar or array of n
+        :param step: step size, scalar or array of n
+        """
+        self.v_k1 = np.full(n, V0, dtype=float)
+        self.i_k1 = np.full(n, I0, dtype=float)
+        self.v_ref = self.v_k1.copy()
+        self.step = np.broadcast_to(np.asarray(step, dtype=float), (n,)).copy()
+
+    def __len__(self):
+        return len(self.v_ref)
+
+    def snapshot(self):
+        """ :return: dict of the tracker states for restore(), json serializable """
+        return {k: v.tolist() for k, v in vars(self).items()}
+
+    def restore(self, state):
+        for k, v in state.items():
+            setattr(self, k, np.asarray(v, dtype=float))
+
+    def _inc_cond(self, v, i):
+        """
+        Vectorized modified incremental conductance, see MPPT._inc_cond
+        :param v: array of n voltages
+        :param i: array of n currents
+        :return: array of n v_ref
+        """
+        v = np.asarray(v, dtype=float)
+        i = np.asarray(i, dtype=float)
+        dv = v - self.v_k1
+        di = i - self.i_k1
+        self.v_k1 = v.copy()
+        self.i_k1 = i.copy()
+
+        # -1, 0 or +1 step for each tracker, following the branches of MPPT._inc_cond
+        with np.errstate(divide='ignore', invalid='ignore'):
+            l = i + (v * di/dv)
+        sign_di = np.where(di > 0, 1.0, np.where(di == 0, 0.0, -1.0))
+        sign_l = np.where(l > 0, np.where(dv*di > 0, np.where(dv > 0, 1.0, -1.0), 1.0), np.where(l == 0, 0.0, -1.0))
+        direction = np.where(dv == 0, sign_di, sign_l)
+
+        self.v_ref += direction * self.step
+        return self.v_ref
+
+    def inc_cond(self, v, i):
+        self._inc_cond(v, i)
+        self.v_ref = np.where(self.v_ref < 0, 0.0, self.v_ref)
+        return self.v_ref
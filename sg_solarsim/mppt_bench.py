@@ -0,0 +1,207 @@
+""" mppt_bench.py
+    Benchmark harness for the mppt trackers.
+
+    Each tracker is run against the same irradiance and temperature profile, a synthetic ramp, step or cloud pattern
+    or recorded TMY data, with the module looked up in its IVTable.  For every tracker the harness reports
+        convergence time: seconds until the delivered power first comes within a tolerance of the ideal Pmp
+        efficiency: delivered energy / energy at the ideal Pmp over the whole profile
+        steps per second: throughput of the tracker alone, replaying the same measurements without the module model
+
+    python -m sg_solarsim.mppt_bench --profile ramp
+    python -m sg_solarsim.mppt_bench --profile tmy --start 06-21 --end 06-22
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from sg_solarsim.moduledb import get_modules
+from sg_solarsim.ivtable import IVTable
+from sg_solarsim.mppt import TRACKERS
+
+MAX_SAMPLES = 20 * 1000 * 1000     # longest recorded profile, about half a gigabyte of g_eff and t_eff
+
+def ramp(g_start=200.0, g_end=1000.0, duration=60.0, hold=10.0, t_air=25.0, dt=0.1):
+    """
+    irradiance held at g_start, ramped linearly to g_end over duration, then held at g_end
+    :return: g_eff, t_eff arrays sampled every dt seconds
+    """
+    time_s = np.arange(0, duration + 2 * hold, dt)
+    g = np.interp(time_s, [hold, hold + duration], [g_start, g_end])
+    return g, np.full_like(g, t_air)
+
+
+def step_change(g_low=300.0, g_high=900.0, period=20.0, cycles=3, t_air=25.0, dt=0.1):
+    """
+    irradiance switching between g_low and g_high every period seconds
+    :return: g_eff, t_eff arrays sampled every dt seconds
+    """
+    time_s = np.arange(0, 2 * period * cycles, dt)
+    g = np.where((time_s // period) % 2 == 0, g_low, g_high)
+    return g, np.full_like(g, t_air)
+
+
+def clouds(g_clear=1000.0, duration=120.0, depth=0.7, mean_cloud=8.0, t_air=25.0, dt=0.1, seed=0):
+    """
+    clear sky irradiance with random passing clouds, reproducible for a given seed
+    :param depth: fraction of the irradiance a cloud blocks
+    :param mean_cloud: mean length of a cloud or a gap in seconds
+    :return: g_eff, t_eff arrays sampled every dt seconds
+    """
+    rng = np.random.default_rng(seed)
+    n = int(round(duration / dt))
+    cover = np.zeros(n)
+    k, cloudy = 0, False
+    while k < n:
+        length = max(1, int(rng.exponential(mean_cloud) / dt))
+        cover[k:k + length] = depth if cloudy else 0.0
+        k += length
+        cloudy = not cloudy
+    # cloud edges take about a second to pass
+    width = max(1, int(1.0 / dt))
+    cover = np.convolve(cover, np.ones(width) / width, mode='same')
+    g = g_clear * (1 - cover)
+    return g, np.full_like(g, t_air)
+
+
+def recorded(data, dt=60.0):
+    """
+    a recorded profile, e.g. a TMY slice, linearly interpolated to one sample every dt seconds
+    :param data: DataFrame with a DatetimeIndex and ghi and temp_air columns
+    :return: g_eff, t_eff arrays
+    :raise ValueError: if the profile would have more than MAX_SAMPLES samples
+    """
+    ts = data.index.asi8 / 1e9
+    n = int((ts[-1] - ts[0]) // dt) + 1 if len(ts) else 0
+    if n > MAX_SAMPLES:
+        raise ValueError('{:,} samples of {} s, more than {:,}: use a shorter range or a larger dt'
+                         .format(n, dt, MAX_SAMPLES))
+    time_s = np.arange(ts[0], ts[-1], dt)
+    return (np.interp(time_s, ts, data['ghi'].to_numpy(dtype=float)),
+            np.interp(time_s, ts, data['temp_air'].to_numpy(dtype=float)))
+
+
+def solar_days(data, lng, start, end):
+    """
+    The days start to end of a TMY year, split at local solar midnight so each day runs from one night to the next
+    :param data: DataFrame indexed in UTC
+    :param lng: longitude of the site
+    :param start: first day MM-DD
+    :param end: last day MM-DD
+    :return: the rows of data from solar midnight before start to solar midnight after end
+    """
+    import pandas as pd
+
+    year = data.index[0].year if len(data) else 2000
+    solar = data.index.tz_convert(None) + pd.Timedelta(hours=lng / 15.0)
+    first = pd.Timestamp('{}-{}'.format(year, start))
+    last = pd.Timestamp('{}-{}'.format(year, end)) + pd.Timedelta(days=1)
+    return data[(solar >= first) & (solar < last)]
+
+
+PROFILES = {
+    'ramp': ramp,
+    'step': step_change,
+    'clouds': clouds,
+}
+
+
+def run_tracker(factory, table, g_eff, t_eff, dt=0.1, tolerance=0.01, voc_period=5.0):
+    """
+    Runs one tracker over a profile
+    :param factory: callable returning a new tracker, e.g. a class from mppt.TRACKERS
+    :param table: IVTable of the module
+    :param g_eff: array of effective irradiance
+    :param t_eff: array of cell temperature
+    :param dt: seconds between tracker updates
+    :param tolerance: fraction of Pmp the delivered power must come within to count as converged
+    :param voc_period: seconds between open circuit measurements passed to tracker.sample_voc(), None for never
+    :return: dict of results
+    """
+    tracker = factory()
+    v_ref = tracker.v_ref
+    n = len(g_eff)
+    voc_every = max(int(round(voc_period / dt)), 1) if voc_period else 0
+    measured = np.empty((n, 2))
+    power = np.empty(n)
+    ideal = np.empty(n)
+
+    for k in range(n):
+        op = table.point(g_eff[k], t_eff[k])
+        if voc_every and k % voc_every == 0:
+            tracker.sample_voc(op.v_oc)
+        current = op.i_from_v(v_ref)
+        measured[k] = v_ref, current
+        v_ref = tracker.track(v_ref, current)
+        power[k] = max(v_ref * op.i_from_v(v_ref), 0.0)
+        ideal[k] = op.p_mp
+
+    converged = np.nonzero(power >= (1 - tolerance) * ideal)[0]
+
+    # throughput of the tracker alone on the same measurements
+    replay = factory()
+    start = time.perf_counter()
+    for v, i in measured.tolist():
+        replay.track(v, i)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'energy': power.sum() * dt / 3600,
+        'ideal_energy': ideal.sum() * dt / 3600,
+        'efficiency': power.sum() / ideal.sum() if ideal.sum() > 0 else float('nan'),
+        'convergence_time': converged[0] * dt if len(converged) else float('inf'),
+        'steps_per_second': n / elapsed if elapsed > 0 else float('inf'),
+        'steps': n,
+    }
+
+
+def benchmark(table, g_eff, t_eff, trackers=None, **kwargs):
+    """
+    Runs every tracker over the same profile
+    :param trackers: dict of name to tracker factory, mppt.TRACKERS if None
+    :param kwargs: passed to run_tracker()
+    :return: dict of name to results
+    """
+    if trackers is None:
+        trackers = TRACKERS
+    return {name: run_tracker(factory, table, g_eff, t_eff, **kwargs) for name, factory in trackers.items()}
+
+
+def format_results(results):
+    lines = ['{:<14}{:>12}{:>12}{:>14}{:>14}'.format('tracker', 'efficiency', 'converge s', 'energy Wh', 'steps/s')]
+    for name, r in results.items():
+        lines.append('{:<14}{:>11.2f}%{:>12.1f}{:>14.3f}{:>14,.0f}'.format(
+            name, 100 * r['efficiency'], r['convergence_time'], r['energy'], r['steps_per_second']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the mppt trackers')
+    parser.add_argument('--profile', choices=sorted(PROFILES) + ['tmy'], default='ramp')
+    parser.add_argument('--modlist', default='CECMod')
+    parser.add_argument('--module', default=None)
+    parser.add_argument('--dt', type=float, default=0.1, help='seconds between tracker updates')
+    parser.add_argument('--lat', type=float, default=39.13, help='site of the tmy profile')
+    parser.add_argument('--lng', type=float, default=-77.21, help='site of the tmy profile')
+    parser.add_argument('--start', default='06-21', help='first day MM-DD of the tmy profile')
+    parser.add_argument('--end', default='06-21', help='last day MM-DD of the tmy profile')
+    parser.add_argument('--tracker', action='append', choices=sorted(TRACKERS), default=None)
+    args = parser.parse_args()
+
+    modules = get_modules(args.modlist)
+    module = args.module or modules.names[0]
+    table = IVTable.for_module(modules[module], name=module)
+
+    if args.profile == 'tmy':
+        from sg_solarsim.tmy_cache import TmyCache
+        data = TmyCache().get(args.lat, args.lng)
+        # a day at a time, a year at 0.1 s would be 3e8 samples
+        data = solar_days(data, args.lng, args.start, args.end)
+        g, t = recorded(data, dt=args.dt)
+    else:
+        g, t = PROFILES[args.profile](dt=args.dt)
+
+    trackers = {name: TRACKERS[name] for name in (args.tracker or TRACKERS)}
+    print('{} on {} profile, {} steps of {} s'.format(module, args.profile, len(g), args.dt))
+    print(format_results(benchmark(table, g, t, trackers=trackers, dt=args.dt)))
@@ -0,0 +1,126 @@
+""" poa.py
+    Plane of array effective irradiance for a tilted, oriented module, from the TMY ghi, dni and dhi.
+
+    The sun position and the transposition to the plane of the array are computed with pvlib for every hour of the
+    weather data in one vectorized pass, then the engine interpolates the hourly result per tick like it does the ghi,
+    so none of the solar position math runs in the real-time loop.  The beam component is reduced by the reflection
+    losses at its angle of incidence (pvlib physical IAM).  When the data has no dni and dhi they are split from the
+    ghi with the Erbs model.
+
+    Results are kept in an LRU cache keyed by site, date range, orientation and a hash of the irradiance data, so
+    restarting the clock or running batch jobs over the same site and orientation does not redo the pass, while
+    other weather for the same hours (a local file, an updated TMY entry) does.
+
+        python -m sg_solarsim.main --headless --tilt 30 --azimuth 180
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_ALBEDO = 0.2
+DEFAULT_MODEL = 'haydavies'     # pvlib sky diffuse model
+DEFAULT_CACHE_SIZE = 32         # entries
+
+
+def poa_irradiance(weather, lat, lng, tilt, azimuth=180.0, albedo=DEFAULT_ALBEDO, model=DEFAULT_MODEL, iam=True):
+    """
+    :param weather: DataFrame with a timezone aware index and ghi, optionally dni and dhi, W/m^2
+    :param tilt: degrees from horizontal
+    :param azimuth: degrees clockwise from north the array faces, 180 is south
+    :param albedo: ground reflectance
+    :param model: pvlib sky diffuse model, e.g. 'isotropic', 'haydavies', 'perez'
+    :param iam: apply the reflection losses of the beam at its angle of incidence
+    :return: numpy array of the effective irradiance on the plane of the array at each row of weather
+    """
+    import pvlib
+
+    times = weather.index
+    position = pvlib.solarposition.get_solarposition(times, lat, lng)
+    zenith = position['apparent_zenith'].to_numpy()
+    sun_azimuth = position['azimuth'].to_numpy()
+    ghi = weather['ghi'].to_numpy(dtype=float)
+    if 'dni' in weather.columns and 'dhi' in weather.columns:
+        dni = weather['dni'].to_numpy(dtype=float)
+        dhi = weather['dhi'].to_numpy(dtype=float)
+    else:
+        split = pvlib.irradiance.erbs(ghi, zenith, times)
+        dni = np.asarray(split['dni'], dtype=float)
+        dhi = np.asarray(split['dhi'], dtype=float)
+
+    dni_extra = np.asarray(pvlib.irradiance.get_extra_radiation(times), dtype=float)
+    airmass = pvlib.atmosphere.get_relative_airmass(zenith) if model == 'perez' else None
+    poa = pvlib.irradiance.get_total_irradiance(tilt, azimuth, zenith, sun_azimuth, dni, ghi, dhi,
+                                                dni_extra=dni_extra, airmass=airmass, albedo=albedo, model=model)
+    direct = np.asarray(poa['poa_direct'], dtype=float)
+    diffuse = np.asarray(poa['poa_diffuse'], dtype=float)
+    if iam:
+        aoi = pvlib.irradiance.aoi(tilt, azimuth, zenith, sun_azimuth)
+        direct = direct * np.asarray(pvlib.iam.physical(aoi), dtype=float)
+    return np.nan_to_num(np.maximum(direct + diffuse, 0.0))
+
+
+class PoaCache:
+    """
+    LRU cache of plane of array irradiance per site, date range, orientation and weather data
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(weather, lat, lng, tilt, azimuth, albedo, model, iam):
+        index = weather.index
+        # the irradiance the result is computed from, a few hundred kB for a year
+        digest = hashlib.sha1(index.asi8.tobytes())
+        for column in ('ghi', 'dni', 'dhi'):
+            if column in weather.columns:
+                digest.update(column.encode())
+                digest.update(np.ascontiguousarray(weather[column].to_numpy(dtype=float)).tobytes())
+        return (round(lat, 4), round(lng, 4), int(index.asi8[0]), int(index.asi8[-1]), len(index), float(tilt),
+                float(azimuth), float(albedo), model, bool(iam), digest.hexdigest())
+
+    def get(self, weather, lat, lng, tilt, azimuth=180.0, albedo=DEFAULT_ALBEDO, model=DEFAULT_MODEL, iam=True):
+        """ poa_irradiance(), from the cache when the same site, range and orientation were asked for before """
+        key = self.key(weather, lat, lng, tilt, azimuth, albedo, model, iam)
+        poa = self._entries.get(key)
+        if poa is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return poa
+        self.misses += 1
+        poa = poa_irradiance(weather, lat, lng, tilt, azimuth, albedo=albedo, model=model, iam=iam)
+        poa.setflags(write=False)   # shared between the callers
+        self._entries[key] = poa
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return poa
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+
+
+def get_cache():
+    """ :return: the process wide PoaCache """
+    global _cache
+    if _cache is None:
+        _cache = PoaCache()
+    return _cache
+
+
+def with_poa(weather, lat, lng, tilt, azimuth=180.0, **kwargs):
+    """
+    :return: a copy of weather with the ghi column replaced by the plane of array irradiance, for the code that
+             reads g_eff from the ghi
+    """
+    return weather.assign(ghi=get_cache().get(weather, lat, lng, tilt, azimuth, **kwargs))
@@ -0,0 +1,192 @@
+""" profiling.py
+    Lightweight timing of the phases of the simulation loop.
+
+    Phases are timed with a context manager,
+
+        from sg_solarsim.profiling import profiler
+        with profiler.phase('mppt.inc_cond'):
+            v_ref = mppt.inc_cond(v_ref, current)
+
+    and events counted with profiler.count('frames').  Every phase keeps a count, total, min, max and a histogram of
+    its durations in log spaced bins (4 per decade from 1 us to 10 s), so memory is fixed however long the run is and
+    percentiles can be estimated from the bins.
+
+    The profiler is off unless enabled (main.py --profile).  Off, phase() hands back one shared do-nothing context
+    manager and count() returns at once, the cost is an attribute test per call.  report() formats the statistics as
+    a table, maybe_report() prints it at most every interval seconds and dump() writes them as json.
+"""
+
+import json
+import time
+import functools
+from bisect import bisect_right
+
+# upper edges of the histogram bins in seconds, 1 us to 10 s, the last bin takes anything longer
+BIN_EDGES = [10 ** (k / 4 - 6) for k in range(29)]
+
+
+class _NullPhase:
+    """ context manager that does nothing, shared by every phase while the profiler is off """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class PhaseStats:
+    """ duration statistics of one phase """
+
+    __slots__ = ('name', 'count', 'total', 'min', 'max', 'bins')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.bins = [0] * (len(BIN_EDGES) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.bins[bisect_right(BIN_EDGES, seconds)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """ :return: upper edge of the bin holding the q-th percentile, in seconds, capped at the maximum """
+        if not self.count:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for k, n in enumerate(self.bins):
+            seen += n
+            if seen >= target:
+                return min(BIN_EDGES[k], self.max) if k < len(BIN_EDGES) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.mean, 'min': self.min if self.count else 0.0,
+                'max': self.max, 'p50': self.percentile(50), 'p99': self.percentile(99), 'bins': list(self.bins)}
+
+
+class _Phase:
+    """ times one pass through a phase """
+
+    __slots__ = ('stats', 'clock', 'began')
+
+    def __init__(self, stats, clock):
+        self.stats = stats
+        self.clock = clock
+
+    def __enter__(self):
+        self.began = self.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add(self.clock() - self.began)
+        return False
+
+
+class Profiler:
+    """
+    Phase timers and event counters, off until enabled
+    """
+
+    def __init__(self, enabled=False, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.phases = {}            # name -> PhaseStats, in order of first use
+        self.counters = {}
+        self._started = clock()
+        self._reported = self._started
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        return self
+
+    def reset(self):
+        self.phases.clear()
+        self.counters.clear()
+        self._started = self._reported = self.clock()
+
+    def phase(self, name):
+        """ :return: context manager timing the block under name, a shared no-op one while disabled """
+        if not self.enabled:
+            return _NULL_PHASE
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats(name)
+        return _Phase(stats, self.clock)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed(self, name=None):
+        """ decorator timing every call of a function as a phase, by default named after the function """
+        def decorate(func):
+            label = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.phase(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def stats(self):
+        """ :return: dict of the elapsed seconds, the phase statistics and the counters """
+        return {'elapsed': self.clock() - self._started,
+                'phases': {name: s.as_dict() for name, s in self.phases.items()},
+                'counters': dict(self.counters)}
+
+    def report(self):
+        """ :return: table of the phases, slowest total first, and the counters """
+        elapsed = self.clock() - self._started
+        lines = ['{:<24} {:>9} {:>10} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+            'phase', 'count', 'total s', '%', 'mean us', 'p50 us', 'p99 us', 'max us')]
+        for s in sorted(self.phases.values(), key=lambda s: s.total, reverse=True):
+            lines.append('{:<24} {:>9} {:>10.3f} {:>6.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                s.name, s.count, s.total, 100 * s.total / elapsed if elapsed > 0 else 0.0, s.mean * 1e6,
+                s.percentile(50) * 1e6, s.percentile(99) * 1e6, s.max * 1e6))
+        for name, n in self.counters.items():
+            lines.append('{:<24} {:>9} {:>10.1f}/s'.format(name, n, n / elapsed if elapsed > 0 else 0.0))
+        return '\n'.join(lines)
+
+    def maybe_report(self, interval=10.0, out=print):
+        """ passes the report to out if enabled and interval seconds have gone by since the last one """
+        if not self.enabled:
+            return False
+        now = self.clock()
+        if now - self._reported < interval:
+            return False
+        self._reported = now
+        out(self.report())
+        return True
+
+    def dump(self, path):
+        """ writes stats() to a json file, the bin edges included """
+        data = self.stats()
+        data['bin_edges'] = BIN_EDGES
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+
+
+# process wide profiler the simulation loop reports to
+profiler = Profiler()
@@ -0,0 +1,125 @@
+"""pvmodel.py
+    Photovoltaic module model functions shared by the GUI and the headless simulation.
+    These wrap pvlib-python with the parameters the solar simulator uses so they can run without a display.
+"""
+
+import numpy as np
+import pandas as pd
+import pvlib.pvsystem as pvsys
+
+
+def retrieve_modules(modlistname='CECMod'):
+    """
+    :param modlistname: The name of the module list to get module data from.
+                        Must match of the module lists in the pvlib-python data folder, or be the path of a csv in
+                        the SAM library format
+    :return: DataFrame with one column of parameters per module
+    """
+    if modlistname.lower().endswith('.csv'):
+        return pvsys.retrieve_sam(path=modlistname)
+    return pvsys.retrieve_sam(modlistname)
+
+
+def calcparams_desoto(module_params, g_eff=500, t_eff=25):
+    """
+    adjust the reference parameters according to the operating conditions using the DeSoto model
+    :param module_params: parameters of one module, a column from retrieve_modules() or a moduledb.ModuleParams
+    :param g_eff: effective irradiance W/m^2
+    :param t_eff: cell temperature degrees C
+    :return: IL, I0, Rs, Rsh, nNsVth
+    """
+    if np.ndim(g_eff) == 0:
+        # pvlib divides by the irradiance, a python float of zero at night would raise rather than give inf
+        g_eff = np.float64(g_eff)
+    IL, I0, Rs, Rsh, nNsVth = pvsys.calcparams_desoto(
+        g_eff,
+        t_eff,
+        module_params['alpha_sc'],
+        module_params['a_ref'],
+        module_params['I_L_ref'],
+        module_params['I_o_ref'],
+        module_params['R_sh_ref'],
+        module_params['R_s'],
+        EgRef=1.121,
+        dEgdT=-0.0002677
+    )
+    return IL, I0, Rs, Rsh, nNsVth
+
+
+def singlediode(IL, I0, Rs, Rsh, nNsVth, pnts=100, method='lambertw'):
+    """
+    Solves the single diode equation for the i-v curve and its key points
+    :return: dict or DataFrame from pvlib singlediode
+    """
+    if IL <= 0:
+        IL = 0.001
+    curve_info = pvsys.singlediode(
+        photocurrent=IL,
+        saturation_current=I0,
+        resistance_series=Rs,
+        resistance_shunt=Rsh,
+        nNsVth=nNsVth,
+        ivcurve_pnts=pnts,
+        method=method
+    )
+    return curve_info
+
+
+def i_from_v(Rsh, Rs, nNsVth, v, I0, IL):
+    return pvsys.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)
+
+
+def batch_operating_points(module_params, g_eff, t_eff, ivcurve_pnts=None, method='lambertw'):
+    """
+    Computes the DeSoto parameters, the key points of the i-v curve and optionally the full curves for arrays of
+    operating conditions in one vectorized pass, instead of one pvlib call per sample.
+
+    :param module_params: parameters of one module, e.g. a column from retrieve_modules()
+    :param g_eff: array of effective irradiance W/m^2
+    :param t_eff: array of cell temperature degrees C, broadcast against g_eff
+    :param ivcurve_pnts: number of points on each i-v curve, no curves if None
+    :param method: single diode solution method
+    :return: dict of arrays with keys IL, I0, Rs, Rsh, nNsVth, i_sc, v_oc, i_mp, v_mp, p_mp,
+             plus v and i of shape (samples, ivcurve_pnts) when ivcurve_pnts is given
+    """
+    g_eff, t_eff = np.broadcast_arrays(np.asarray(g_eff, dtype=float), np.asarray(t_eff, dtype=float))
+    IL, I0, Rs, Rsh, nNsVth = calcparams_desoto(module_params, g_eff, t_eff)
+    IL, I0, Rs, Rsh, nNsVth = np.broadcast_arrays(IL, I0, Rs, Rsh, nNsVth)
+
+    # the same floor singlediode() puts on the photocurrent, keeps dark samples solvable
+    IL = np.maximum(IL, 0.001)
+
+    out = pvsys.singlediode(IL, I0, Rs, Rsh, nNsVth, method=method)
+    result = {
+        'IL': IL, 'I0': I0, 'Rs': Rs, 'Rsh': Rsh, 'nNsVth': nNsVth,
+        'i_sc': np.asarray(out['i_sc']),
+        'v_oc': np.asarray(out['v_oc']),
+        'i_mp': np.asarray(out['i_mp']),
+        'v_mp': np.asarray(out['v_mp']),
+        'p_mp': np.asarray(out['p_mp']),
+    }
+
+    if ivcurve_pnts:
+        # every curve runs from short circuit to its own open circuit voltage
+        v = result['v_oc'][..., np.newaxis] * np.linspace(0, 1, ivcurve_pnts)
+        i = pvsys.i_from_v(Rsh[..., np.newaxis], Rs[..., np.newaxis], nNsVth[..., np.newaxis], v,
+                           I0[..., np.newaxis], IL[..., np.newaxis], method=method)
+        result['v'] = v
+        result['i'] = np.asarray(i)
+
+    return result
+
+
+def tmy_operating_points(module_params, tmy_slice, t_eff=None, method='lambertw'):
+    """
+    batch_operating_points() over every row of a TMY slice
+
+    :param module_params: parameters of one module
+    :param tmy_slice: DataFrame with ghi and temp_air columns
+    :param t_eff: cell temperature, the air temperature is used if None
+    :return: DataFrame with the index of tmy_slice and a column for each of the scalar results
+    """
+    if t_eff is None:
+        t_eff = tmy_slice['temp_air'].to_numpy()
+    result = batch_operating_points(module_params, tmy_slice['ghi'].to_numpy(), t_eff, method=method)
+    return pd.DataFrame(result, index=tmy_slice.index)
@@ -0,0 +1,241 @@
+""" recorder.py
+    Streaming record of what the simulator did, one record per engine step.
+
+    records() is a generator over the simulation loop, engine -> module -> mppt tracker, yielding a tuple of
+    RECORD_FIELDS per step.  Sinks take the records one at a time into a preallocated block of chunk rows and write a
+    whole block at a time, so memory stays constant however long the run is:
+        CsvSink       appends blocks to a csv file
+        ColumnarSink  one raw float64 file per field in a directory, read back memory mapped with read_columns()
+        RingSink      keeps the latest capacity records in memory, e.g. for a live display
+    A file sink's cursor() is where its output ends after a flush, opening it again with resume=cursor truncates any
+    records written after that and appends from there, to carry on a run from a checkpoint.
+
+        python -m sg_solarsim.main --headless --start 01-01 --end 12-30 --timestep 1 --table --record run.csv
+"""
+
+import os
+import json
+
+import numpy as np
+
+RECORD_FIELDS = ('time', 'g_eff', 't_air', 't_cell', 'IL', 'v_ref', 'current', 'power', 'p_mp')
+
+DEFAULT_CHUNK = 8192
+
+
+def records(engine, module_params, table=None, tracker=None):
+    """
+    Runs the simulation loop and yields one record per step
+    :param engine: SimulationEngine, run from its present time to its endtime
+    :param module_params: parameters of the module
+    :param table: IVTable of the module, the single diode model is solved every step if None
+    :param tracker: mppt tracker, a new mppt.MPPT if None
+    :return: generator of (time, g_eff, t_air, t_cell, IL, v_ref, current, power, p_mp) tuples, time in epoch seconds
+    """
+    from sg_solarsim import pvmodel
+    from sg_solarsim.mppt import MPPT
+
+    if tracker is None:
+        tracker = MPPT()
+    v_ref = tracker.v_ref
+
+    for eng in engine.run():
+        g_eff, t_air, t_cell = eng.g_eff, eng.t_air, eng.t_cell
+        if table is not None:
+            op = table.point(g_eff, t_cell)
+            IL = float(pvmodel.calcparams_desoto(module_params, g_eff=g_eff, t_eff=t_cell)[0])
+            tracker.sample_voc(op.v_oc)
+            v_ref = tracker.track(v_ref, op.i_from_v(v_ref))
+            current = op.i_from_v(v_ref)
+            p_mp = op.p_mp
+        else:
+            IL, I0, Rs, Rsh, nNsVth = pvmodel.calcparams_desoto(module_params, g_eff=g_eff, t_eff=t_cell)
+            v_ref = tracker.track(v_ref, float(pvmodel.i_from_v(Rsh, Rs, nNsVth, v_ref, I0, IL)))
+            current = float(pvmodel.i_from_v(Rsh, Rs, nNsVth, v_ref, I0, IL))
+            p_mp = float(pvmodel.singlediode(IL, I0, Rs, Rsh, nNsVth, pnts=None)['p_mp'])
+            IL = float(IL)
+        yield eng.time, g_eff, t_air, t_cell, IL, v_ref, current, v_ref * current, p_mp
+
+
+class Sink:
+    """
+    Base class of the record sinks.  Records are copied into a block of chunk rows and _flush() is called with each
+    full block and with the partial block on close().
+    """
+
+    def __init__(self, chunk=DEFAULT_CHUNK, fields=RECORD_FIELDS):
+        self.fields = tuple(fields)
+        self.chunk = chunk
+        self._block = np.empty((chunk, len(self.fields)))
+        self._n = 0
+        self.count = 0      # records written
+
+    def write(self, record):
+        self._block[self._n] = record
+        self._n += 1
+        self.count += 1
+        if self._n == self.chunk:
+            self._flush(self._block)
+            self._n = 0
+
+    def flush(self):
+        if self._n:
+            self._flush(self._block[:self._n])
+            self._n = 0
+
+    def _flush(self, block):
+        raise NotImplementedError
+
+    def cursor(self):
+        """ flushes and :return: dict of where the output ends, for resume """
+        self.flush()
+        return {'count': self.count}
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvSink(Sink):
+    """ appends the records to a csv file with a header row """
+
+    def __init__(self, path, chunk=DEFAULT_CHUNK, fields=RECORD_FIELDS, resume=None):
+        """
+        :param resume: cursor() of an earlier sink on the same file to carry on from, a new file if None
+        """
+        super().__init__(chunk, fields)
+        self.path = path
+        if resume is None:
+            self._file = open(path, 'w', newline='')
+            self._file.write(','.join(self.fields) + '\n')
+        else:
+            self._file = open(path, 'r+', newline='')
+            self._file.seek(resume['offset'])
+            self._file.truncate()
+            self.count = resume['count']
+        # seconds resolution for the time, 6 significant digits for the measurements
+        self._fmt = ['%.3f' if f == 'time' else '%.6g' for f in self.fields]
+
+    def _flush(self, block):
+        np.savetxt(self._file, block, fmt=self._fmt, delimiter=',')
+
+    def cursor(self):
+        self.flush()
+        self._file.flush()
+        return {'count': self.count, 'offset': self._file.tell()}
+
+    def close(self):
+        if not self._file.closed:
+            super().close()
+            self._file.close()
+
+
+class ColumnarSink(Sink):
+    """
+    One raw float64 file per field in a directory plus a meta.json written on close, so a column can be read back
+    memory mapped without loading the others
+    """
+
+    def __init__(self, path, chunk=DEFAULT_CHUNK, fields=RECORD_FIELDS, resume=None):
+        """
+        :param resume: cursor() of an earlier sink on the same directory to carry on from, new files if None
+        """
+        super().__init__(chunk, fields)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        names = [os.path.join(path, f + '.f8') for f in self.fields]
+        if resume is not None:
+            self.count = resume['count']
+            for name in names:
+                os.truncate(name, self.count * 8)
+        self._files = [open(name, 'ab' if resume is not None else 'wb') for name in names]
+
+    def _flush(self, block):
+        for k, f in enumerate(self._files):
+            f.write(np.ascontiguousarray(block[:, k]).tobytes())
+
+    def cursor(self):
+        self.flush()
+        for f in self._files:
+            f.flush()
+        return {'count': self.count}
+
+    def close(self):
+        if self._files[0].closed:
+            return
+        super().close()
+        for f in self._files:
+            f.close()
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({'fields': list(self.fields), 'count': self.count, 'dtype': 'float64'}, f)
+
+
+def read_columns(path):
+    """
+    :param path: directory written by ColumnarSink
+    :return: dict of field name to read only memory mapped array
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    return {field: np.memmap(os.path.join(path, field + '.f8'), dtype=meta['dtype'], mode='r', shape=(meta['count'],))
+            for field in meta['fields']}
+
+
+class RingSink(Sink):
+    """ keeps the latest capacity records in memory, older records are overwritten """
+
+    def __init__(self, capacity=DEFAULT_CHUNK, fields=RECORD_FIELDS):
+        # written straight into the ring, there is nothing to batch
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._ring = np.empty((capacity, len(self.fields)))
+        self.count = 0
+
+    def write(self, record):
+        self._ring[self.count % self.capacity] = record
+        self.count += 1
+
+    def flush(self):
+        pass
+
+    def array(self):
+        """ :return: copy of the records held, oldest first, shape (records, fields) """
+        if self.count <= self.capacity:
+            return self._ring[:self.count].copy()
+        k = self.count % self.capacity
+        return np.concatenate([self._ring[k:], self._ring[:k]])
+
+    def column(self, field):
+        return self.array()[:, self.fields.index(field)]
+
+
+def open_sink(path, chunk=DEFAULT_CHUNK, resume=None):
+    """ a CsvSink for a .csv path, otherwise a ColumnarSink directory, see the sinks for resume """
+    if path.lower().endswith('.csv'):
+        return CsvSink(path, chunk=chunk, resume=resume)
+    return ColumnarSink(path, chunk=chunk, resume=resume)
+
+
+def record(stream, *sinks, checkpoint=None):
+    """
+    Drains a record stream into sinks and closes them
+    :param checkpoint: called after every record, e.g. a checkpoint.Checkpointer
+    :return: number of records
+    """
+    n = 0
+    try:
+        for rec in stream:
+            for sink in sinks:
+                sink.write(rec)
+            n += 1
+            if checkpoint is not None:
+                checkpoint()
+    finally:
+        for sink in sinks:
+            sink.close()
+    return n
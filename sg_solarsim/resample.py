@@ -0,0 +1,269 @@
+""" resample.py
+    High resolution irradiance and temperature from the hourly TMY data, produced lazily.
+
+    Resampler turns a TMY slice into g_eff and t_air every step seconds (1 s by default): linear between the hours like
+    the engine, optionally times a stochastic cloud pattern.  Nothing is computed up front, the series is produced in
+    chunks of whole hours when asked for, so a two week run at 1 Hz holds one chunk in memory at a time:
+        chunks()       iterates over the whole range, chunk by chunk
+        values(a, b)   samples a to b, e.g. for a plot window
+        sample(t)      the value at any time, the chunk around t is kept for the next call
+        save(path)     writes the series to .npy files chunk by chunk, read back memory mapped with Timeline.open()
+
+    Clouds are random but reproducible and random access: cloud events are drawn per fixed block of time from a
+    generator seeded with (seed, block number), so any chunk comes out the same whichever order the chunks are made in.
+    Each cloud dims the irradiance by up to depth with edges that take a few seconds to pass.  With preserve_mean the
+    cloud pattern is scaled within every hour so the hourly irradiation is still the TMY value, the clouds move
+    energy around within the hour rather than remove it.  The clear moments of an hour are scaled up to make up for
+    its clouds and can exceed the TMY value: with the default Clouds by about 1.15x in a typical hour, 1.33x in the
+    cloudiest 1% of hours and up to about 1.5x, so a 1000 W/m^2 hour can peak near 1500 W/m^2.
+
+        python -m sg_solarsim.main --headless --timestep 1 --resample 1 --clouds 7
+        python -m sg_solarsim.resample --start 06-01 --end 06-15 --clouds 7 --save timeline
+"""
+
+import os
+import json
+
+import numpy as np
+
+HOUR = 3600.0
+DEFAULT_CHUNK = 6 * HOUR     # seconds of series per chunk
+
+
+class Clouds:
+    """
+    Reproducible random passing clouds as a factor on the clear irradiance
+    """
+
+    def __init__(self, seed=0, cover=0.3, mean_cloud=60.0, depth=0.7, edge=5.0, block=600.0):
+        """
+        :param seed: the same seed always gives the same clouds
+        :param cover: fraction of the time under a cloud, roughly, clouds may overlap
+        :param mean_cloud: mean length of a cloud in seconds, lengths are exponential and cut at five times this
+        :param depth: largest fraction of the irradiance a cloud blocks, each cloud blocks between half this and this
+        :param edge: seconds a cloud edge takes to pass
+        :param block: seconds of time whose clouds are drawn from one seeded generator
+        """
+        self.seed = seed
+        self.cover = cover
+        self.mean_cloud = mean_cloud
+        self.depth = depth
+        self.edge = edge
+        self.block = block
+        self.max_cloud = 5 * mean_cloud
+
+    def events(self, t0, t1):
+        """ :return: starts, lengths and depths of the clouds overlapping t0 to t1 """
+        first = int((t0 - self.max_cloud) // self.block)
+        last = int(t1 // self.block)
+        rate = self.cover / self.mean_cloud * self.block
+        starts, lengths, depths = [], [], []
+        for b in range(first, last + 1):
+            rng = np.random.default_rng([self.seed, b + 2 ** 40])     # the block number may be negative
+            n = rng.poisson(rate)
+            starts.append(b * self.block + rng.uniform(0.0, self.block, n))
+            lengths.append(np.minimum(rng.exponential(self.mean_cloud, n), self.max_cloud))
+            depths.append(self.depth * rng.uniform(0.5, 1.0, n))
+        starts, lengths, depths = np.concatenate(starts), np.concatenate(lengths), np.concatenate(depths)
+        keep = (starts < t1) & (starts + lengths > t0)
+        return starts[keep], lengths[keep], depths[keep]
+
+    def factor(self, t):
+        """
+        :param t: sorted epoch seconds
+        :return: fraction of the irradiance getting through at each time, 1 under a clear sky
+        """
+        factor = np.ones(len(t))
+        if not len(t):
+            return factor
+        for start, length, depth in zip(*self.events(t[0], t[-1])):
+            a, b = np.searchsorted(t, [start, start + length])
+            if a == b:
+                continue
+            inside = t[a:b]
+            # trapezoid: the cloud thickens over the edge time at either end
+            shade = np.minimum(np.minimum(inside - start, start + length - inside) / self.edge, 1.0)
+            factor[a:b] *= 1.0 - depth * shade
+        return factor
+
+    def as_dict(self):
+        return {'seed': self.seed, 'cover': self.cover, 'mean_cloud': self.mean_cloud, 'depth': self.depth,
+                'edge': self.edge, 'block': self.block}
+
+
+class _Series:
+    """ g_eff and t_air at start + k * step for k in range(len(self)), values() is up to the subclass """
+
+    def __len__(self):
+        return self.n
+
+    def times(self, a=0, b=None):
+        """ :return: epoch seconds of samples a to b """
+        b = self.n if b is None else b
+        return self.start + self.step * np.arange(a, b)
+
+    def values(self, a, b):
+        raise NotImplementedError
+
+    def sample(self, t):
+        """
+        Linear between the samples around t, clamped to the ends of the range
+        :return: g_eff, t_air
+        """
+        x = min(max((t - self.start) / self.step, 0.0), self.n - 1.0)
+        k = int(x)
+        w = x - k
+        cached = self._cached
+        if cached is None or not cached[0] <= k < cached[1] - 1 and not (k == cached[1] - 1 == self.n - 1):
+            a = min(k, max(self.n - 2, 0))
+            b = min(a + self._chunk, self.n)
+            self._cached = (a, b) + self.values(a, b)
+        a, _, g, t_air = self._cached
+        k -= a
+        if w == 0.0 or k + 1 >= len(g):
+            return float(g[k]), float(t_air[k])
+        return (float(g[k] + (g[k + 1] - g[k]) * w), float(t_air[k] + (t_air[k + 1] - t_air[k]) * w))
+
+
+class Resampler(_Series):
+    """
+    Lazily resampled TMY slice
+    """
+
+    def __init__(self, tmy_slice, step=1.0, start=None, end=None, clouds=None, preserve_mean=True,
+                 chunk=DEFAULT_CHUNK):
+        """
+        :param tmy_slice: hourly DataFrame with ghi and temp_air and a timezone aware index
+        :param step: seconds between samples
+        :param start: epoch seconds of the first sample, the start of the slice if None
+        :param end: epoch seconds the samples run up to, the end of the slice if None
+        :param clouds: Clouds, or a seed to use Clouds with its defaults, None for no clouds
+        :param preserve_mean: scale the clouds to keep the hourly mean irradiance, clear samples may then exceed the
+            hourly value, see the module docstring
+        :param chunk: seconds of series produced at a time, rounded to whole hours
+        """
+        self._times = tmy_slice.index.asi8 / 1e9
+        self._ghi = tmy_slice['ghi'].to_numpy(dtype=float)
+        self._temp_air = tmy_slice['temp_air'].to_numpy(dtype=float)
+        self.step = float(step)
+        self.start = float(self._times[0] if start is None else start)
+        end = float(self._times[-1] if end is None else end)
+        self.n = int((end - self.start) // self.step) + 1
+        if clouds is not None and not isinstance(clouds, Clouds):
+            clouds = Clouds(seed=clouds)
+        self.clouds = clouds
+        self.preserve_mean = preserve_mean
+        self._chunk = max(max(int(round(chunk / HOUR)), 1) * int(HOUR // self.step), 2)
+        self._cached = None
+
+    def values(self, a, b):
+        """
+        :return: g_eff and t_air arrays of samples a to b
+        """
+        t = self.times(a, b)
+        g = np.interp(t, self._times, self._ghi)
+        t_air = np.interp(t, self._times, self._temp_air)
+        if self.clouds is not None and len(t):
+            g *= self._cloud_factor(t)
+        return g, t_air
+
+    def _cloud_factor(self, t):
+        if not self.preserve_mean:
+            return self.clouds.factor(t)
+        # the mean is taken over whole clock hours, whatever part of them is asked for, weighted by the irradiance
+        # so the energy of every hour is kept exactly
+        h0 = np.floor(t[0] / HOUR) * HOUR
+        h1 = np.floor(t[-1] / HOUR) * HOUR + HOUR
+        full = np.arange(h0, h1, min(self.step, HOUR))
+        factor = self.clouds.factor(full)
+        g = np.interp(full, self._times, self._ghi)
+        hour = ((full - h0) // HOUR).astype(int)
+        clear = np.bincount(hour, g)
+        clouded = np.bincount(hour, g * factor)
+        mean = np.where(clouded > 0, clouded / np.where(clear > 0, clear, 1.0), 1.0)
+        return np.interp(t, full, factor) / mean[((t - h0) // HOUR).astype(int)]
+
+    def chunks(self):
+        """ :return: generator of (times, g_eff, t_air) arrays, a chunk at a time from start to end """
+        for a in range(0, self.n, self._chunk):
+            b = min(a + self._chunk, self.n)
+            yield (self.times(a, b),) + self.values(a, b)
+
+    def save(self, path):
+        """
+        Writes the whole series to a directory of .npy files, one chunk in memory at a time
+        :return: Timeline of the files
+        """
+        from numpy.lib.format import open_memmap
+
+        os.makedirs(path, exist_ok=True)
+        g_file = open_memmap(os.path.join(path, 'g_eff.npy'), mode='w+', dtype=np.float32, shape=(self.n,))
+        t_file = open_memmap(os.path.join(path, 't_air.npy'), mode='w+', dtype=np.float32, shape=(self.n,))
+        a = 0
+        for _, g, t_air in self.chunks():
+            g_file[a:a + len(g)] = g
+            t_file[a:a + len(g)] = t_air
+            a += len(g)
+        g_file.flush()
+        t_file.flush()
+        del g_file, t_file
+        meta = {'start': self.start, 'step': self.step, 'n': self.n,
+                'clouds': self.clouds.as_dict() if self.clouds is not None else None,
+                'preserve_mean': self.preserve_mean}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return Timeline.open(path)
+
+
+class Timeline(_Series):
+    """
+    A series saved by Resampler.save(), memory mapped
+    """
+
+    def __init__(self, g_eff, t_air, start, step, chunk=DEFAULT_CHUNK):
+        self.g_eff = g_eff
+        self.t_air = t_air
+        self.start = float(start)
+        self.step = float(step)
+        self.n = len(g_eff)
+        self._chunk = max(int(chunk // self.step), 2)
+        self._cached = None
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(path, 'g_eff.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 't_air.npy'), mmap_mode='r'), meta['start'], meta['step'])
+
+    def values(self, a, b):
+        return np.asarray(self.g_eff[a:b], dtype=float), np.asarray(self.t_air[a:b], dtype=float)
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    from sg_solarsim.main import parse_date
+
+    parser = argparse.ArgumentParser(description='resample the TMY data of a site to a high resolution timeline')
+    parser.add_argument('--lat', type=float, default=39.13)
+    parser.add_argument('--lng', type=float, default=-77.21)
+    parser.add_argument('--start', type=parse_date, default=None, help='start date MM-DD')
+    parser.add_argument('--end', type=parse_date, default=None, help='end date MM-DD')
+    parser.add_argument('--step', type=float, default=1.0, help='seconds between samples')
+    parser.add_argument('--clouds', type=int, default=None, help='seed of the cloud pattern, no clouds if not given')
+    parser.add_argument('--save', default=None, help='write the timeline to this directory')
+    args = parser.parse_args()
+
+    from sg_solarsim.engine import SimulationEngine
+    engine = SimulationEngine(lat=args.lat, lng=args.lng, starttime=args.start, endtime=args.end)
+    resampler = Resampler(engine.tmy_slice, step=args.step, start=engine.starttime.timestamp(),
+                          end=engine.endtime.timestamp(), clouds=args.clouds)
+    began = time.perf_counter()
+    if args.save:
+        timeline = resampler.save(args.save)
+        energy = float(np.sum(timeline.g_eff, dtype=float))
+    else:
+        energy = sum(float(g.sum()) for _, g, _ in resampler.chunks())
+    print('{} samples, {:.1f} kWh/m^2, {:.2f} s'.format(len(resampler), energy * args.step / 3.6e6,
+                                                      time.perf_counter() - began))
@@ -0,0 +1,145 @@
+""" scheduler.py
+    Fixed rate tick scheduler for the real time loop.
+
+    Deadlines are kept as start + k * period so the rate does not drift however late a single tick runs.  Each tick
+    also carries a virtual time, ticks executed * period, and the simulation is advanced to that time rather than to
+    the wall clock: the simulated time after n ticks is always n * period * speed whatever the jitter was.
+
+    When the loop falls behind by more than a period the policy decides what happens to the missed ticks:
+        catch_up  run them back to back, at most max_catch_up at once, the rest are skipped
+        skip      run one tick and drop the rest, the schedule moves on to the next future deadline
+
+    The lateness of every tick (jitter), the number of overruns (a deadline found more than a period late) and the
+    number of skipped ticks are kept for stats().
+"""
+
+import time
+
+import numpy as np
+
+POLICIES = ('catch_up', 'skip')
+
+
+class Scheduler:
+    """
+    Fixed rate scheduler, used either blocking with wait() / run() or polled with due() from a loop that blocks
+    elsewhere, e.g. in a GUI event read with a timeout of remaining().
+    """
+
+    def __init__(self, period=0.05, policy='catch_up', max_catch_up=5, clock=time.monotonic, sleep=time.sleep,
+                 window=1024):
+        """
+        :param period: seconds between ticks
+        :param policy: 'catch_up' or 'skip', see the module docstring
+        :param max_catch_up: most missed ticks run at once under catch_up
+        :param clock: wall clock in seconds
+        :param sleep: function sleeping for a number of seconds
+        :param window: number of recent jitter samples kept for the statistics
+        """
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of {}'.format(POLICIES))
+        self.period = float(period)
+        self.policy = policy
+        self.max_catch_up = max(int(max_catch_up), 1)
+        self.clock = clock
+        self.sleep = sleep
+
+        self.ticks = 0          # ticks executed
+        self.skipped = 0        # ticks dropped
+        self.overruns = 0       # times the schedule was found more than a period behind
+        self._jitter = np.zeros(window)
+        self._jitter_n = 0
+        self._start = None
+        self._next = None
+
+    @property
+    def time(self):
+        """ virtual time of the latest tick, ticks * period """
+        return self.ticks * self.period
+
+    def start(self):
+        self._start = self.clock()
+        self._next = self._start + self.period
+        return self
+
+    def remaining(self):
+        """ :return: seconds until the next deadline, 0 if it has passed """
+        if self._next is None:
+            self.start()
+        return max(self._next - self.clock(), 0.0)
+
+    def due(self):
+        """
+        Non blocking: the ticks to run now
+        :return: list of the virtual times of the ticks due, empty if the next deadline has not come
+        """
+        if self._next is None:
+            self.start()
+        now = self.clock()
+        late = now - self._next
+        if late < 0:
+            return []
+        missed = int(late // self.period) + 1
+        if missed > 1:
+            self.overruns += 1
+        n = min(missed, self.max_catch_up) if self.policy == 'catch_up' else 1
+        self.skipped += missed - n
+        self._jitter[self._jitter_n % len(self._jitter)] = late
+        self._jitter_n += 1
+
+        # stay on the original grid of deadlines, skipped ones included
+        self._next += missed * self.period
+        first = self.ticks + 1
+        self.ticks += n
+        return [k * self.period for k in range(first, self.ticks + 1)]
+
+    def wait(self):
+        """
+        Blocks until the next deadline
+        :return: list of the virtual times of the ticks due, at least one
+        """
+        self.sleep(self.remaining())
+        ticks = self.due()
+        while not ticks:
+            # the sleep returned a little early
+            self.sleep(self.remaining())
+            ticks = self.due()
+        return ticks
+
+    def run(self, callback, ticks=None, until=None):
+        """
+        Calls callback(virtual time) once per tick
+        :param ticks: stop after this many ticks, None for no limit
+        :param until: stop once this returns True, checked before each wait
+        """
+        if self._next is None:
+            self.start()
+        while (ticks is None or self.ticks < ticks) and not (until is not None and until()):
+            for t in self.wait():
+                callback(t)
+                if ticks is not None and self.ticks >= ticks:
+                    break
+
+    def stats(self):
+        """
+        :return: dict with tick counts, the achieved tick rate and jitter (lateness) statistics in seconds over the
+                 recent ticks
+        """
+        n = min(self._jitter_n, len(self._jitter))
+        jitter = self._jitter[:n]
+        elapsed = self.clock() - self._start if self._start is not None else 0.0
+        return {
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'overruns': self.overruns,
+            'rate': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'jitter_mean': float(jitter.mean()) if n else float('nan'),
+            'jitter_p99': float(np.percentile(jitter, 99)) if n else float('nan'),
+            'jitter_max': float(jitter.max()) if n else float('nan'),
+        }
+
+
+def format_stats(stats):
+    return ('{ticks} ticks at {rate:.1f}/s, {skipped} skipped, {overruns} overruns, jitter mean {mean:.2f} ms, '
+            'p99 {p99:.2f} ms, max {max:.2f} ms').format(
+        mean=stats['jitter_mean'] * 1e3, p99=stats['jitter_p99'] * 1e3, max=stats['jitter_max'] * 1e3, **stats)
@@ -5,19 +5,26 @@
 # third party imports
 # pvlib-python
 import PySimpleGUI as sg
-import pvlib.pvsystem as pvsys
 from pvlib.location import Location
 
 from datetime import datetime, timedelta
 
-import pandas as pd
-import matplotlib.pyplot as plt
 
 # package resources
-from pkg_resources import resource_stream, resource_filename
+from pkg_resources import resource_filename
 
 # local modules and classes
 from sg_solarsim.tmy_clock import tmy_clock
+from sg_solarsim import pvmodel
+from sg_solarsim.ivtable import IVTable
+from sg_solarsim.array_model import ArrayModel
+from sg_solarsim.cities import get_index
+from sg_solarsim.moduledb import get_modules
+from sg_solarsim.liveplot import LivePlot
+from sg_solarsim.profiling import profiler
+
+
+SEEK_STEPS = 1000   # positions of the seek slider over the run
 
 
 class SSTopGui:
@@ -34,8 +41,16 @@ class SSTopGui:
         :type iv_plot: boolean
         """
 
-        self.modules = pvsys.retrieve_sam(modlistname)
-        module_names = self.modules.columns.values.tolist()
+        # memory mapped parameter store, converted from the pvlib module list once
+        self.modules = get_modules(modlistname)
+        self.ivtables = {}          # IVTable per module name, built or loaded when first used
+        self.arrays = {}            # ArrayModel per (module name, series, parallel)
+        self.shading = None         # per module irradiance factors of shape (series, parallel), uniform if None
+        self._op = None             # array point of the latest operating condition
+        self._op_key = None
+        self.worker = None          # worker.SimulationWorker running the clock's engine, if the simulation is threaded
+        self._worker_model = None   # (array, shading) last sent to the worker
+        module_names = self.modules.names
         combo_modules = sg.DD(module_names,
                               default_value=module_names[0],
                               key='-MODULES-',
@@ -67,14 +82,13 @@ class SSTopGui:
             [sg.Input(today, key='-START-', size=(14, 1), disabled=True, disabled_readonly_background_color='', justification='center'), sg.Input(tomorrow, key='-END-', size=(14,1), disabled=True, disabled_readonly_background_color='', justification='center')],
             [sg.CalendarButton('Start Date', close_when_date_chosen=True, target='-START-', no_titlebar=True, format='%B %d'), sg.CalendarButton('End Date', close_when_date_chosen=True, target='-END-', no_titlebar=True, format='%B %d')],
             [sg.Slider(range=(0,15),orientation='h', disable_number_display=True,enable_events=True, key='-SLIDER-'),sg.Text('Speed x'),sg.Input(1, key='-SPEED-',size=(4,1), disabled=True, disabled_readonly_background_color='')],
+            [sg.Slider(range=(0, SEEK_STEPS), orientation='h', disable_number_display=True, enable_events=True, key='-SEEK-'), sg.Text('', key='-SEEKTIME-', size=(14, 1))],
             [sg.Button(image_filename=button_images[0], image_subsample=5, key='-PLAY-', disabled=False), sg.Button(image_filename=button_images[1], image_subsample=5, key='-PAUSE-', disabled=True), sg.Button(image_filename=button_images[2], image_subsample=5, key='-STOP-', disabled=True)],
             [sg.Cancel("Close")]
         ]
         # will there be a plot for the i-v curve?
         self.iv_plot = iv_plot
-        self.fig = None
-        self.ax = None
-        self.line = None
+        self.plot = None    # LivePlot of the i-v curve
         #if self.iv_plot:
         #    self.fig, self.ax = plt.subplots()
 
@@ -87,22 +101,27 @@ class SSTopGui:
             self.clk = tmy_clock(speed=int(self.window.Element("-SPEED-").get()), starttime=starttime, endtime=endtime, nosecond=False)
             if self.iv_plot:
                 # plot a default i-v curve
-                IL, I0, Rs, Rsh, nNsVth = self.calcparams_desoto(g_eff=1000, t_eff=self.clk.t_air)
-                curve_info = self.singleDiode(IL, I0, Rs, Rsh, nNsVth)
-                self.fig = plt.figure()
-                self.ax = self.fig.add_subplot(111)
-                self.line = self.ax.plot(curve_info['v'], curve_info['i'])
-                self.fig.show()
-        self.clk.pause = False
+                curve_info = self.operating_point(g_eff=1000, t_eff=self.clk.t_cell).curve()
+                self.plot = LivePlot(trajectory=0, fps=20, title='i-v curve')
+                self.plot.set_curve(curve_info['v'], curve_info['i'])
+                self.plot.show()
+        if self.worker is not None:
+            self.worker.resume()
+        else:
+            self.clk.pause = False
 
 
     def start_gui(self):
         self.window = sg.Window('NIST Solar Simulation', self.layout, element_justification='center', finalize=True)
 
-    def run_gui(self):
-        """ looks for element events """
+    def run_gui(self, timeout=100, now=None):
+        """ looks for element events
+        :param timeout: milliseconds to wait for an event
+        :param now: time the clock advances to, see tmy_clock.update_class()
+        """
 
-        event, values = self.window.Read(timeout = 100)
+        with profiler.phase('gui.read'):
+            event, values = self.window.Read(timeout = timeout)
         if event in (sg.WIN_CLOSED, 'Close'):
             self.window.close()
             self.state="CLOSED"
@@ -112,7 +131,9 @@ class SSTopGui:
             self.cp.citychanged(values['-CITY-'])
         if event == '-SLIDER-':
             self.window.Element('-SPEED-').Update(2**int(values['-SLIDER-']))
-            if type(self.clk) == tmy_clock:
+            if self.worker is not None:
+                self.worker.set_speed(int(self.window.Element("-SPEED-").get()))
+            elif type(self.clk) == tmy_clock:
                 self.clk.speed = int(self.window.Element("-SPEED-").get())
         if event == '-PLAY-':
             self.window['-PLAY-'].update(disabled=True)
@@ -123,73 +144,159 @@ class SSTopGui:
             self.window['-PLAY-'].update(disabled=False)
             self.window['-PAUSE-'].update(disabled=True)
             self.window['-STOP-'].update(disabled=True)
+            self.stop_worker()
             self.clk.destroy()
             self.clk = []
-            if self.iv_plot:
-                plt.close(self.fig)
+            if self.plot is not None:
+                self.plot.close()
+                self.plot = None
+        if event == '-SEEK-' and type(self.clk) == tmy_clock:
+            # straight to that point of the run, nothing in between is replayed
+            fraction = values['-SEEK-'] / SEEK_STEPS
+            if self.worker is not None:
+                self.worker.seek(fraction)
+            else:
+                self.clk.seek(fraction)
+            when = self.clk.starttime + (self.clk.endtime - self.clk.starttime) * fraction
+            self.window['-SEEKTIME-'].update(when.strftime('%b %d %H:%M'))
         if event == '-PAUSE-':
             self.window['-PLAY-'].update(disabled=False)
             self.window['-PAUSE-'].update(disabled=True)
             self.window['-STOP-'].update(disabled=False)
-            self.clk.pause = True
+            if self.worker is not None:
+                self.worker.pause()
+            else:
+                self.clk.pause = True
 
         # if the clock is running
         if type(self.clk) == tmy_clock:
-            self.clk.update()
-            self.clk.update_idletasks()
-            self.clk.update_class()
+            snapshot = None
+            if self.worker is not None:
+                # the worker advances the engine, the clock only draws its latest state
+                self.send_model()
+                snapshot = self.worker.latest()
+            with profiler.phase('clock.update'):
+                self.clk.update()
+                self.clk.update_idletasks()
+            with profiler.phase('clock.update_class'):
+                if self.worker is None:
+                    self.clk.update_class(now)
+                elif snapshot is not None:
+                    self.clk.show(snapshot)
 
             # update the i-v curve if drawn
             if self.state != 'CLOSED':
-                if self.iv_plot:
-                    IL, I0, Rs, Rsh, nNsVth = self.calcparams_desoto(g_eff=self.clk.g_eff, t_eff=self.clk.t_air)
-                    curve_info = self.singleDiode(IL, I0, Rs, Rsh, nNsVth)
-                    self.line[0].set(xdata=curve_info['v'], ydata=curve_info['i'])
-                    self.fig.canvas.draw()
-                    self.fig.canvas.flush_events()
+                if self.plot is not None:
+                    g_eff, t_cell = (self.clk.g_eff, self.clk.t_cell) if snapshot is None else (snapshot.g_eff,
+                                                                                                 snapshot.t_cell)
+                    # only the curve is redrawn, at most at the plot's frame rate
+                    with profiler.phase('curve.compute'):
+                        curve_info = self.operating_point(g_eff=g_eff, t_eff=t_cell).curve()
+                    self.plot.set_curve(curve_info['v'], curve_info['i'])
+                    with profiler.phase('curve.draw'):
+                        if self.plot.draw():
+                            profiler.count('curve.frames')
+
+    def start_worker(self, **kwargs):
+        """
+        Runs the clock's engine and an mppt tracker on a worker.SimulationWorker, the gui then only draws its snapshots
+        :param kwargs: passed to SimulationWorker
+        :return: the worker
+        """
+        from sg_solarsim.worker import SimulationWorker
+
+        self.stop_worker()
+        self._worker_model = (self.array_model(), self.shading)
+        self.worker = SimulationWorker(self.clk.engine, self._worker_model[0], shading=self.shading, **kwargs).start()
+        return self.worker
+
+    def stop_worker(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def worker_failed(self):
+        """
+        Shows why the worker thread died, if it did, and closes the window
+        :return: the exception that ended the worker, None while it is running or was stopped
+        """
+        worker = self.worker
+        if worker is None or worker.alive or worker.error is None:
+            return None
+        sg.popup_error('The simulation stopped:\n{}: {}'.format(type(worker.error).__name__, worker.error),
+                       title='NIST Solar Simulation')
+        self.window.close()
+        self.state = 'CLOSED'
+        return worker.error
+
+    def send_model(self):
+        """ hands the worker the array selected in the gui when it changes """
+        model = (self.array_model(), self.shading)
+        if model[0] is not self._worker_model[0] or model[1] is not self._worker_model[1]:
+            self._worker_model = model
+            self.worker.set_model(*model)
 
     def get_module_info(self):
         return {'type': self.window.Element('-MODULES-').get(), 'series': self.window.Element('-SERIES-').get(), 'parallel': self.window.Element('-PARALLEL-').get(),}
 
+    def ivtable(self, name=None):
+        """
+        :param name: module name, the module selected in the gui if None
+        :return: IVTable of the module
+        """
+        if name is None:
+            name = self.get_module_info()['type']
+        if name not in self.ivtables:
+            self.ivtables[name] = IVTable.for_module(self.modules[name], name=name)
+        return self.ivtables[name]
+
+    def array_model(self):
+        """
+        :return: ArrayModel of the module, series and parallel selected in the gui
+        """
+        info = self.get_module_info()
+        key = (info['type'], int(info['series']), int(info['parallel']))
+        if key not in self.arrays:
+            self.arrays[key] = ArrayModel(self.ivtable(key[0]), series=key[1], parallel=key[2])
+        return self.arrays[key]
+
+    def operating_point(self, g_eff=500, t_eff=25):
+        """
+        Looks up the selected array at an operating condition, each module at g_eff scaled by its shading factor if
+        shading is set.
+        The point is reused while the array and condition are unchanged so the i-v curve plot and the mppt loop
+        share one lookup per tick.
+        :return: ArrayPoint, or ArrayCurve under partial shading
+        """
+        array = self.array_model()
+        shading = self.shading
+        key = (array, g_eff, t_eff, None if shading is None else id(shading))
+        if self._op is None or key != self._op_key:
+            if shading is None or array.shape != shading.shape:
+                self._op = array.point(g_eff, t_eff)
+            else:
+                self._op = array.evaluate(g_eff * shading, t_eff)
+            self._op_key = key
+        return self._op
+
+    @profiler.timed('model.calcparams_desoto')
     def calcparams_desoto(self, g_eff=500, t_eff=25, module_params=None):
         # adjust the reference parameters according to the operating
         # conditions using the DeSoto model
 
-        if module_params == None:
+        if module_params is None:
             module_params = self.modules[self.get_module_info()['type']]
 
-        IL, I0, Rs, Rsh, nNsVth = pvsys.calcparams_desoto(
-             g_eff,
-             t_eff,
-             module_params['alpha_sc'],
-             module_params['a_ref'],
-             module_params['I_L_ref'],
-             module_params['I_o_ref'],
-             module_params['R_sh_ref'],
-             module_params['R_s'],
-             EgRef=1.121,
-             dEgdT=-0.0002677
-            )
-        return IL, I0, Rs, Rsh, nNsVth
+        return pvmodel.calcparams_desoto(module_params, g_eff, t_eff)
 
 
+    @profiler.timed('model.singleDiode')
     def singleDiode(self, IL, I0, Rs, Rsh, nNsVth, pnts=100, method='lambertw'):
-        curve_info = []
-        if IL <= 0:
-            IL = 0.001
-        curve_info = pvsys.singlediode(
-            photocurrent=IL,
-            saturation_current=I0,
-            resistance_series=Rs,
-            resistance_shunt=Rsh,
-            nNsVth=nNsVth,
-            ivcurve_pnts=pnts,
-            method=method
-        )
-        return curve_info
+        return pvmodel.singlediode(IL, I0, Rs, Rsh, nNsVth, pnts=pnts, method=method)
 
+    @profiler.timed('model.i_from_v')
     def i_from_v(self,Rsh, Rs, nNsVth, v, I0, IL):
-        return pvsys.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)
+        return pvmodel.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)
 
 class CityPicker:
     """ A pair of drop down controls populated with country and city
@@ -208,18 +315,14 @@ class CityPicker:
                                         Must match city_ascii - admin_name fields from corldcities.csv
         :type default_city:             string
         """
-        worldcities_stream = resource_stream('sg_solarsim.resources.data','worldcities.csv')
-        self.worldcities = pd.read_csv(worldcities_stream, usecols=['country', 'city_ascii', 'admin_name', 'lat', 'lng'])
-        #self.worldcities = pd.read_csv('worldcities.csv', usecols=['country', 'city_ascii', 'admin_name', 'lat', 'lng'])
-        self.worldcities = self.worldcities.sort_values(by=['country', 'city_ascii'])
-        countrylist = self.worldcities['country'].drop_duplicates()
-        self.ddCountry = sg.DD(countrylist.values.tolist(),
-                               default_value='United States',
+        # the city index is loaded once, city lists are slices and locations hashed lookups rather than table scans
+        self.cities = get_index()
+        self.country = default_country
+        self.ddCountry = sg.DD(self.cities.countries,
+                               default_value=default_country,
                                key='-COUNTRY-',
                                enable_events=True)
-        citylist = self.worldcities.loc[self.worldcities['country'] == default_country]
-        city_admin = citylist['city_ascii'] + ' - ' + citylist['admin_name']
-        self.ddCity = sg.DD(city_admin.values.tolist(),
+        self.ddCity = sg.DD(self.cities.cities(default_country),
                             default_value=default_city,
                             key='-CITY-',
                             enable_events=True)
@@ -235,14 +338,10 @@ class CityPicker:
             :param key
             :type  string
             """
-        citylist = self.worldcities.loc[self.worldcities['country'] == key]
-        city_admin = citylist['admin_name']
-        if isinstance(city_admin.values[0],str): # some data entries have no admin_name
-            city_admin = citylist['city_ascii'] + ' - ' + citylist['admin_name']
-        else:
-            city_admin = citylist['city_ascii'] + ' - ' + ""
-        self.ddCity.update(values=city_admin.values.tolist(), set_to_index=0)
-        self.update_loc(city_admin.values[0])
+        self.country = key
+        city_admin = self.cities.cities(key)
+        self.ddCity.update(values=city_admin, set_to_index=0)
+        self.update_loc(city_admin[0])
         self.txt_lat.update(self.loc.latitude)
         self.txt_lng.update(self.loc.longitude)
 
@@ -255,6 +354,20 @@ class CityPicker:
         self.txt_lat.update(self.loc.latitude)
         self.txt_lng.update(self.loc.longitude)
 
+    def select_nearest(self, lat, lng):
+        """
+        Selects the city nearest a coordinate, e.g. one typed in or from a weather file
+        :return: country, "city - admin" label of the city
+        """
+        country, label = self.cities.nearest(lat, lng)[0][:2]
+        if country != self.country:
+            self.country = country
+            self.ddCountry.update(value=country)
+            self.ddCity.update(values=self.cities.cities(country))
+        self.ddCity.update(value=label)
+        self.citychanged(label)
+        return country, label
+
     def update_loc(self,key):
         """
             Update the location to the new location
@@ -262,13 +375,8 @@ class CityPicker:
         :return:
         """
         # latitude and longitude
-        [city, state] = key.split(' - ')
-        if state != '':    # some data entries have no admin_name
-            row = self.worldcities[((self.worldcities['city_ascii'] == city) & (self.worldcities['admin_name'] == state))]
-        else:
-            row = self.worldcities[((self.worldcities['city_ascii'] == city))]
-        lat = float(row['lat'].to_numpy()[0])
-        lng = longitude = float(row['lng'].to_numpy()[0])
+        city = key.split(' - ')[0]
+        lat, lng = self.cities.location(key, self.country)
         self.loc = Location(latitude=lat, longitude=lng, name=city)
 
 
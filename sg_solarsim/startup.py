@@ -0,0 +1,119 @@
+""" startup.py
+    Import time budget for the package.
+
+    Each module is imported in a fresh interpreter with python -X importtime.  The wall time of the import, the
+    heaviest modules it pulled in and any modules that a headless import must not load (GUI toolkits, the timezone
+    database) are reported, and the run fails if a budget is exceeded or a forbidden module is loaded.
+
+        python -m sg_solarsim.startup
+        python -m sg_solarsim.startup --module sg_solarsim.mppt --budget 150
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+# modules that must stay out of a headless import
+HEADLESS_FORBIDDEN = ('tkinter', 'PySimpleGUI', 'matplotlib', 'timezonefinder')
+
+# module: (budget in milliseconds, forbidden modules)
+BUDGETS = {
+    'sg_solarsim': (25.0, HEADLESS_FORBIDDEN + ('numpy', 'pandas', 'pvlib')),
+    'sg_solarsim.mppt': (200.0, HEADLESS_FORBIDDEN + ('pandas', 'pvlib')),
+    'sg_solarsim.engine': (100.0, HEADLESS_FORBIDDEN),
+}
+
+# runs in the child interpreter, prints the import wall time and the modules it added
+_PROBE = '''
+import sys, time, json
+before = set(sys.modules)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(set(sys.modules) - before)}}))
+'''
+
+
+def parse_importtime(text):
+    """
+    :param text: stderr of python -X importtime
+    :return: dict of module name to (self us, cumulative us)
+    """
+    times = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue    # the header line
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def profile_import(module, python=None):
+    """
+    Imports a module in a fresh interpreter
+    :param module: dotted module name
+    :param python: interpreter to run, this one if None
+    :return: dict with elapsed seconds, the list of modules the import loaded and the importtime self times of those
+    """
+    proc = subprocess.run([python or sys.executable, '-X', 'importtime', '-c', _PROBE.format(module=module)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError('importing {} failed:\n{}'.format(module, proc.stderr[-2000:]))
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    times = parse_importtime(proc.stderr)
+    result['self_us'] = {m: times[m][0] for m in result['modules'] if m in times}
+    return result
+
+
+def check(module, budget_ms, forbidden=(), repeat=3, python=None):
+    """
+    :param repeat: number of fresh interpreters, the fastest import counts
+    :return: dict of results with ok False if the budget is exceeded or a forbidden module was loaded
+    """
+    runs = [profile_import(module, python=python) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r['elapsed'])
+    loaded = set(best['modules'])
+    bad = sorted(f for f in forbidden if f in loaded)
+    heaviest = sorted(best['self_us'].items(), key=lambda kv: -kv[1])[:5]
+    elapsed_ms = best['elapsed'] * 1e3
+    return {
+        'module': module,
+        'elapsed_ms': elapsed_ms,
+        'budget_ms': budget_ms,
+        'forbidden': bad,
+        'heaviest': heaviest,
+        'modules': len(loaded),
+        'ok': elapsed_ms <= budget_ms and not bad,
+    }
+
+
+def format_result(r):
+    lines = ['{:<24}{:>8.1f} ms  budget {:>6.1f} ms  {:>4d} modules  {}'.format(
+        r['module'], r['elapsed_ms'], r['budget_ms'], r['modules'], 'ok' if r['ok'] else 'FAIL')]
+    if r['forbidden']:
+        lines.append('    loaded forbidden modules: ' + ', '.join(r['forbidden']))
+    for name, us in r['heaviest']:
+        lines.append('    {:>8.1f} ms  {}'.format(us / 1e3, name))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the import time of the package against a budget')
+    parser.add_argument('--module', default=None, help='module to check, every module in BUDGETS if None')
+    parser.add_argument('--budget', type=float, default=None, help='milliseconds')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies every budget, for slow machines')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.module:
+        budget, forbidden = BUDGETS.get(args.module, (float('inf'), ()))
+        targets = {args.module: (args.budget or budget, forbidden)}
+    else:
+        targets = BUDGETS
+    results = [check(m, budget * args.scale, forbidden, repeat=args.repeat) for m, (budget, forbidden) in targets.items()]
+    for r in results:
+        print(format_result(r))
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
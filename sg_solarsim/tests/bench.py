@@ -0,0 +1,341 @@
+""" bench.py
+    Performance benchmarks of the hot paths, on the synthetic weather of synthetic.py so they never reach PVGIS.
+
+    Each benchmark times the median and best of repeat rounds of number calls, in seconds per call.  The results are
+    written as json and compared against a saved baseline, benchmark_baseline.json next to this file: a benchmark
+    regresses when its best time is more than threshold times the baseline's (1.5 unless the baseline lists its own
+    threshold for it under "thresholds").  Benchmarks that cannot run here, e.g. the Tk clock without a display, are
+    recorded as skipped.
+
+        python -m sg_solarsim.tests.bench                      run all and compare with the baseline
+        python -m sg_solarsim.tests.bench --only 'cities.*'    a subset, fnmatch patterns
+        python -m sg_solarsim.tests.bench --save-baseline      make the results the new baseline
+
+    The lookups behind CityPicker are benchmarked on the CityIndex it delegates to, so no window is needed.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import platform
+import tempfile
+import itertools
+from datetime import datetime
+
+import numpy as np
+
+from sg_solarsim.tests import synthetic
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_THRESHOLD = 1.5
+
+BENCHMARKS = {}     # name -> (setup, number, repeat), in order of registration
+
+
+class SkipBenchmark(Exception):
+    """ raised by a setup that cannot run in this environment """
+
+
+def benchmark(name, number=100, repeat=5):
+    """
+    Registers a benchmark.  The decorated setup gets the Fixture and returns the function to time, called without
+    arguments number times per round.
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, number, repeat)
+        return setup
+    return register
+
+
+class Fixture:
+    """ data shared by the benchmarks, made when first asked for and removed by close() """
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix='sg_solarsim_bench_')
+        self._cleanups = []
+        self._cache = None
+        self._cities = None
+        self.start = datetime(2000, 6, 1, 12)
+        self.end = datetime(2000, 6, 15, 12)
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = synthetic.synthetic_cache(os.path.join(self.dir, 'tmy'))
+        return self._cache
+
+    @property
+    def cities(self):
+        if self._cities is None:
+            from sg_solarsim.cities import CityIndex
+            csv_path = synthetic.synthetic_cities(os.path.join(self.dir, 'worldcities.csv'))
+            self._cities = CityIndex.open(csv_path, cache_dir=os.path.join(self.dir, 'cities'))
+        return self._cities
+
+    def engine(self, speed=60, timestep=1.0):
+        from sg_solarsim.engine import SimulationEngine
+        return SimulationEngine(lat=synthetic.LAT, lng=synthetic.LNG, speed=speed, starttime=self.start,
+                                endtime=self.end, timestep=timestep, tz=synthetic.TZ, cache=self.cache)
+
+    def on_close(self, func):
+        self._cleanups.append(func)
+
+    def close(self):
+        for func in reversed(self._cleanups):
+            func()
+        self._cleanups = []
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _model_gui():
+    """ an SSTopGui without a window, the model methods only need the module parameters passed in """
+    try:
+        from sg_solarsim.ss_gui import SSTopGui
+    except ImportError as e:
+        raise SkipBenchmark('no gui toolkit: {}'.format(e))
+    return SSTopGui.__new__(SSTopGui)
+
+
+@benchmark('tmy.coerce_tmy_year', number=10)
+def bench_coerce_tmy_year(fixture):
+    from sg_solarsim.tmy import tmy
+    tmydata = (synthetic.synthetic_tmy(year=2005),)
+    return lambda: tmy.coerce_tmy_year(tmydata)
+
+
+@benchmark('tmy.round_to_nearest_hour', number=20)
+def bench_round_to_nearest_hour(fixture):
+    from sg_solarsim.tmy import tmy
+    index = synthetic.synthetic_tmy().index.tz_convert(synthetic.TZ) + np.timedelta64(35, 'm')
+    return lambda: tmy.round_to_nearest_hour(index)
+
+
+@benchmark('tmy.slice', number=10)
+def bench_tmy_slice(fixture):
+    from sg_solarsim.tmy import tmy
+    cache = fixture.cache
+    daterange = [fixture.start, fixture.end]
+    return lambda: tmy(lat=synthetic.LAT, lng=synthetic.LNG, tz=synthetic.TZ, daterange=daterange, cache=cache)
+
+
+@benchmark('engine.update', number=2000)
+def bench_engine_update(fixture):
+    # 50 ms ticks at 60x, three one second steps per update
+    engine = fixture.engine(speed=60)
+    ticks = itertools.count(0, 0.05)
+    return lambda: engine.update(next(ticks))
+
+
+@benchmark('tmy_clock.update_class', number=200)
+def bench_update_class(fixture):
+    try:
+        import tkinter
+        from sg_solarsim.tmy_clock import tmy_clock
+    except ImportError as e:
+        raise SkipBenchmark('no gui toolkit: {}'.format(e))
+    try:
+        clock = tmy_clock(engine=fixture.engine(speed=600))
+    except tkinter.TclError as e:
+        raise SkipBenchmark('no display: {}'.format(e))
+    fixture.on_close(clock.destroy)
+    ticks = itertools.count(0, 0.05)
+    return lambda: clock.update_class(next(ticks))
+
+
+@benchmark('SSTopGui.calcparams_desoto', number=500)
+def bench_calcparams_desoto(fixture):
+    gui = _model_gui()
+    params = synthetic.MODULE_PARAMS
+    return lambda: gui.calcparams_desoto(800.0, 35.0, module_params=params)
+
+
+@benchmark('SSTopGui.singleDiode', number=100)
+def bench_single_diode(fixture):
+    gui = _model_gui()
+    IL, I0, Rs, Rsh, nNsVth = gui.calcparams_desoto(800.0, 35.0, module_params=synthetic.MODULE_PARAMS)
+    return lambda: gui.singleDiode(IL, I0, Rs, Rsh, nNsVth, pnts=100)
+
+
+@benchmark('SSTopGui.i_from_v', number=500)
+def bench_i_from_v(fixture):
+    gui = _model_gui()
+    IL, I0, Rs, Rsh, nNsVth = gui.calcparams_desoto(800.0, 35.0, module_params=synthetic.MODULE_PARAMS)
+    return lambda: gui.i_from_v(Rsh, Rs, nNsVth, 28.0, I0, IL)
+
+
+@benchmark('MPPT.inc_cond', number=5000)
+def bench_inc_cond(fixture):
+    from sg_solarsim import pvmodel
+    from sg_solarsim.mppt import MPPT
+    # points along a real curve so every branch of the algorithm is taken
+    IL, I0, Rs, Rsh, nNsVth = pvmodel.calcparams_desoto(synthetic.MODULE_PARAMS, 800.0, 35.0)
+    curve = pvmodel.singlediode(IL, I0, Rs, Rsh, nNsVth, pnts=200)
+    points = itertools.cycle(list(zip(np.asarray(curve['v']).tolist(), np.asarray(curve['i']).tolist())))
+    tracker = MPPT()
+    return lambda: tracker.inc_cond(*next(points))
+
+
+@benchmark('cities.open', number=20)
+def bench_cities_open(fixture):
+    from sg_solarsim.cities import CityIndex
+    path = fixture.cities.path
+    return lambda: CityIndex(path)
+
+
+@benchmark('cities.cities', number=2000)
+def bench_cities(fixture):
+    index = fixture.cities
+    countries = itertools.cycle(['United States', 'India', 'France', 'Brazil'])
+    return lambda: index.cities(next(countries))
+
+
+@benchmark('cities.location', number=2000)
+def bench_location(fixture):
+    index = fixture.cities
+    labels = itertools.cycle([(label, 'United States') for label in index.cities('United States')[::97]])
+    return lambda: index.location(*next(labels))
+
+
+@benchmark('cities.nearest', number=500)
+def bench_nearest(fixture):
+    index = fixture.cities
+    rng = np.random.RandomState(0)
+    sites = itertools.cycle(list(zip(rng.uniform(-60, 70, 100).tolist(), rng.uniform(-180, 180, 100).tolist())))
+    return lambda: index.nearest(*next(sites))
+
+
+def measure(func, number, repeat):
+    """ :return: list of seconds per call of each round """
+    rounds = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - began) / number)
+    return rounds
+
+
+def run_benchmarks(patterns=None, number=None, repeat=None, progress=None):
+    """
+    :param patterns: fnmatch patterns of the benchmarks to run, all if None
+    :param number: calls per round, overrides each benchmark's own
+    :param repeat: rounds, overrides each benchmark's own
+    :param progress: called with each name and result as it finishes
+    :return: dict of the environment and the results
+    """
+    results = {}
+    fixture = Fixture()
+    try:
+        for name, (setup, bench_number, bench_repeat) in BENCHMARKS.items():
+            if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+                continue
+            try:
+                func = setup(fixture)
+            except SkipBenchmark as e:
+                result = {'skipped': str(e)}
+            else:
+                n = number or bench_number
+                r = repeat or bench_repeat
+                func()      # warm up caches and lazy imports
+                rounds = measure(func, n, r)
+                result = {'min': min(rounds), 'median': float(np.median(rounds)), 'mean': float(np.mean(rounds)),
+                          'number': n, 'repeat': r}
+            results[name] = result
+            if progress is not None:
+                progress(name, result)
+    finally:
+        fixture.close()
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'environment': environment(),
+            'benchmarks': results}
+
+
+def environment():
+    import pandas
+    import pvlib
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+            'system': platform.system(), 'cpus': os.cpu_count(), 'numpy': np.__version__,
+            'pandas': pandas.__version__, 'pvlib': pvlib.__version__}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    :param results: as returned by run_benchmarks()
+    :param baseline: saved results, optionally with a "thresholds" dict of name -> ratio
+    :param threshold: allowed ratio of the best time to the baseline's for benchmarks without their own
+    :return: list of dicts of name, baseline, now, ratio, threshold and regressed for the benchmarks in both
+    """
+    limits = baseline.get('thresholds', {})
+    rows = []
+    for name, now in results['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if base is None or 'min' not in base or 'min' not in now:
+            continue
+        ratio = now['min'] / base['min']
+        limit = limits.get(name, threshold)
+        rows.append({'name': name, 'baseline': base['min'], 'now': now['min'], 'ratio': ratio, 'threshold': limit,
+                     'regressed': ratio > limit})
+    return rows
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path, thresholds=None):
+    if thresholds:
+        results = dict(results, thresholds=thresholds)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def format_result(name, result):
+    if 'skipped' in result:
+        return '{:<28} skipped, {}'.format(name, result['skipped'])
+    return '{:<28} {:>12.2f} us  (median {:.2f} us, {} x {})'.format(
+        name, result['min'] * 1e6, result['median'] * 1e6, result['repeat'], result['number'])
+
+
+def format_comparison(rows):
+    lines = []
+    for row in rows:
+        lines.append('{:<28} {:>12.2f} us  {:>12.2f} us  {:>6.2f}x  {}'.format(
+            row['name'], row['baseline'] * 1e6, row['now'] * 1e6, row['ratio'],
+            'REGRESSED (limit {:.2f}x)'.format(row['threshold']) if row['regressed'] else 'ok'))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='sg_solarsim benchmarks on synthetic TMY data')
+    parser.add_argument('--only', nargs='*', default=None, help='fnmatch patterns of the benchmarks to run')
+    parser.add_argument('--number', type=int, default=None, help='calls per round for every benchmark')
+    parser.add_argument('--repeat', type=int, default=None, help='rounds for every benchmark')
+    parser.add_argument('--out', default=None, help='write the results to this json file')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline json to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown against the baseline, as a ratio')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results over the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.number, args.repeat, progress=lambda n, r: print(format_result(n, r)))
+    if args.out:
+        save(results, args.out)
+
+    if args.save_baseline:
+        # keep hand tuned thresholds
+        thresholds = load(args.baseline).get('thresholds') if os.path.exists(args.baseline) else None
+        save(results, args.baseline, thresholds)
+        print('baseline written to', args.baseline)
+    elif os.path.exists(args.baseline):
+        rows = compare(results, load(args.baseline), args.threshold)
+        print()
+        print(format_comparison(rows))
+        if any(row['regressed'] for row in rows):
+            sys.exit(1)
+    else:
+        print('no baseline at', args.baseline)
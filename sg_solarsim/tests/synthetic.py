@@ -0,0 +1,103 @@
+""" synthetic.py
+    Deterministic synthetic weather for tests and benchmarks, no PVGIS access.
+
+    synthetic_tmy() makes a year of hourly data with the layout of a TMY cache entry: a UTC index, ghi from a simple
+    clear sky model (solar elevation from the declination and hour angle) times a seeded daily cloudiness, dni and dhi
+    split from it, and a seasonal plus diurnal air temperature.  The same seed always gives the same frame.
+
+    synthetic_cities() writes a worldcities.csv of about the size of the real one, which is not kept in the repository.
+"""
+
+import numpy as np
+import pandas as pd
+from pytz import timezone
+
+# site of the fixture, the default location of the GUI
+LAT = 39.13
+LNG = -77.21
+TZ = timezone('America/New_York')
+
+# parameters of a 60 cell CEC module (Canadian Solar CS6P-250P), fixed here so results do not depend on the pvlib
+# module list that happens to be installed
+MODULE_PARAMS = {
+    'alpha_sc': 0.003459, 'a_ref': 1.488217, 'I_L_ref': 8.882007, 'I_o_ref': 1.216203e-10, 'R_sh_ref': 237.464966,
+    'R_s': 0.321434, 'N_s': 60.0, 'I_sc_ref': 8.87, 'V_oc_ref': 37.2, 'I_mp_ref': 8.3, 'V_mp_ref': 30.1,
+    'beta_oc': -0.111972, 'gamma_r': -0.424, 'T_NOCT': 43.6, 'STC': 249.83,
+}
+
+
+def synthetic_tmy(lat=LAT, lng=LNG, year=2000, seed=0):
+    """
+    :param year: year of the index, TMY cache entries are in 2000, other years exercise coerce_tmy_year()
+    :param seed: seed of the cloudiness
+    :return: DataFrame of ghi, dni, dhi, temp_air, wind_speed indexed hourly in UTC over the year
+    """
+    index = pd.date_range('{}-01-01'.format(year), '{}-12-31 23:00'.format(year), freq='H', tz='UTC')
+    doy = index.dayofyear.to_numpy()
+    hour = index.hour.to_numpy() + index.minute.to_numpy() / 60.0
+
+    # solar elevation, good to a degree or two which is plenty for a fixture
+    decl = np.radians(23.45) * np.sin(2 * np.pi * (284 + doy) / 365.0)
+    hour_angle = np.radians(15.0 * (hour + lng / 15.0 - 12.0))
+    phi = np.radians(lat)
+    sin_elev = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    sin_elev = np.clip(sin_elev, 0.0, None)
+
+    # one cloudiness per day, with a little hourly noise on top
+    rng = np.random.RandomState(seed)
+    days = int(doy.max())
+    daily = rng.beta(4.0, 1.5, size=days + 1)
+    clear = np.clip(daily[doy] + rng.normal(0.0, 0.05, size=len(index)), 0.05, 1.0)
+
+    ghi = 1050.0 * sin_elev ** 1.15 * clear
+    dhi = ghi * (1.0 - 0.8 * clear)
+    dni = np.where(sin_elev > 0.05, (ghi - dhi) / np.maximum(sin_elev, 0.05), 0.0)
+
+    season = -np.cos(2 * np.pi * (doy - 15) / 365.0)
+    diurnal = np.sin(2 * np.pi * (hour + lng / 15.0 - 9.0) / 24.0)
+    temp_air = 13.0 + 11.0 * season + 5.0 * diurnal + rng.normal(0.0, 0.5, size=len(index))
+    wind_speed = np.abs(rng.normal(3.0, 1.5, size=len(index)))
+
+    data = pd.DataFrame({'ghi': ghi, 'dni': dni, 'dhi': dhi, 'temp_air': temp_air, 'wind_speed': wind_speed},
+                        index=index)
+    return data.astype('float32')
+
+
+COUNTRIES = ('United States', 'India', 'France', 'Brazil', 'China', 'Russia', 'Germany', 'Japan', 'Mexico',
+             'Philippines', 'Italy', 'Spain', 'Nigeria', 'Canada', 'Australia', 'Argentina')
+
+
+def synthetic_cities(path, n=44000, seed=0):
+    """
+    Writes a worldcities.csv of n random cities spread over COUNTRIES, plus Gaithersburg - Maryland
+    :return: path
+    """
+    rng = np.random.RandomState(seed)
+    # a few countries hold most of the cities like the real list
+    weights = 1.0 / np.arange(1, len(COUNTRIES) + 1)
+    country = rng.choice(len(COUNTRIES), size=n, p=weights / weights.sum())
+    names = ['City{}'.format(k) for k in range(n)]
+    data = pd.DataFrame({
+        'city': names,
+        'city_ascii': names,
+        'lat': np.round(np.degrees(np.arcsin(rng.uniform(-0.9, 0.95, n))), 4),
+        'lng': np.round(rng.uniform(-180, 180, n), 4),
+        'country': np.array(COUNTRIES)[country],
+        'admin_name': ['Region{}'.format(k) for k in rng.randint(0, 50, n)],
+    })
+    gaithersburg = pd.DataFrame({'city': ['Gaithersburg'], 'city_ascii': ['Gaithersburg'], 'lat': [39.1346],
+                                 'lng': [-77.2132], 'country': ['United States'], 'admin_name': ['Maryland']})
+    pd.concat([gaithersburg, data]).to_csv(path, index=False)
+    return path
+
+
+def synthetic_cache(cache_dir, lat=LAT, lng=LNG, seed=0):
+    """
+    Stores the synthetic year in an offline TmyCache so tmy() and SimulationEngine run without the network
+    :return: TmyCache
+    """
+    from sg_solarsim.tmy_cache import TmyCache
+
+    cache = TmyCache(cache_dir, offline=True)
+    cache.store(lat, lng, synthetic_tmy(lat, lng, seed=seed), source='synthetic seed {}'.format(seed))
+    return cache
@@ -0,0 +1,116 @@
+""" test_array_model.py
+    The array model of a single module, and of parallel strings under different conditions, against the exact single
+    diode solution.
+"""
+
+import numpy as np
+import pytest
+
+from sg_solarsim import pvmodel
+from sg_solarsim.array_model import ArrayModel
+from sg_solarsim.ivtable import IVTable, DEFAULT_TOLERANCE
+from sg_solarsim.tests import synthetic
+
+# the table interpolates within DEFAULT_TOLERANCE of I_L_ref
+ATOL = 2 * DEFAULT_TOLERANCE * synthetic.MODULE_PARAMS['I_L_ref']
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    return IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic',
+                              cache_dir=str(tmp_path_factory.mktemp('ivtable')))
+
+
+def _exact(g_eff, t_eff):
+    params = pvmodel.calcparams_desoto(synthetic.MODULE_PARAMS, g_eff=g_eff, t_eff=t_eff)
+    return params, pvmodel.singlediode(*params, pnts=None)
+
+
+@pytest.mark.parametrize('g_eff, t_eff', [(1000.0, 25.0), (620.0, 48.0), (140.0, 5.0)])
+def test_single_module_matches_singlediode(table, g_eff, t_eff):
+    model = ArrayModel(table)
+    (IL, I0, Rs, Rsh, nNsVth), exact = _exact(g_eff, t_eff)
+    for op in (model.point(g_eff, t_eff), model.evaluate(g_eff, t_eff)):
+        assert op.v_oc == pytest.approx(float(exact['v_oc']), rel=1e-3)
+        assert op.i_sc == pytest.approx(float(exact['i_sc']), abs=ATOL)
+        assert op.p_mp == pytest.approx(float(exact['p_mp']), abs=ATOL * float(exact['v_mp']))
+        for v in np.linspace(0, float(exact['v_oc']), 25):
+            assert op.i_from_v(v) == pytest.approx(float(pvmodel.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)), abs=ATOL)
+
+
+def test_parallel_strings_add_currents(table):
+    # one module per string, so the array current is the sum of the module currents at the array voltage
+    g_eff, t_eff = np.array([[900.0, 450.0, 200.0]]), np.array([[40.0, 30.0, 20.0]])
+    curve = ArrayModel(table, series=1, parallel=3, points=400).evaluate(g_eff, t_eff)
+    exact = [_exact(g, t)[0] for g, t in zip(g_eff.ravel(), t_eff.ravel())]
+    for v in np.linspace(0, curve.v_oc * 0.98, 25):
+        expected = sum(max(float(pvmodel.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)), 0.0)
+                       for IL, I0, Rs, Rsh, nNsVth in exact)
+        assert curve.i_from_v(v) == pytest.approx(expected, abs=3 * ATOL + 0.01 * expected)
+
+
+def _local_maxima(curve):
+    p = curve.v * curve.i
+    return np.nonzero((p[1:-1] > p[:-2]) & (p[1:-1] >= p[2:]))[0] + 1
+
+
+# a string of three modules, the last one shaded
+SHADED = np.array([[1000.0], [1000.0], [300.0]])
+
+
+def test_shaded_string_with_bypass(table):
+    bright, shaded = table.point(1000.0, 25.0), table.point(300.0, 25.0)
+    curve = ArrayModel(table, series=3, parallel=1).evaluate(SHADED, 25.0)
+
+    # one maximum with the shaded module bypassed, one with it carrying the string current
+    peaks = _local_maxima(curve)
+    assert len(peaks) == 2
+    low, high = curve.v[peaks]
+    assert low < 2 * bright.v_oc < high
+    assert curve.v_mp == pytest.approx(low)
+    # the two bright modules less the diode drop
+    assert curve.p_mp == pytest.approx(2 * bright.p_mp, rel=0.03)
+    assert curve.p_mp > curve.v[peaks[1]] * curve.i[peaks[1]]
+
+    # at low voltage the bypass diode carries the bright modules' current past the shaded one
+    assert curve.i_from_v(1.0) == pytest.approx(bright.i_sc, rel=0.01)
+    assert curve.i_sc > 3 * shaded.i_sc
+
+
+def test_shaded_string_without_bypass(table):
+    bright, shaded = table.point(1000.0, 25.0), table.point(300.0, 25.0)
+    with_bypass = ArrayModel(table, series=3, parallel=1).evaluate(SHADED, 25.0)
+    curve = ArrayModel(table, series=3, parallel=1, bypass=False).evaluate(SHADED, 25.0)
+
+    # the shaded module limits the string, only its shunt lets a little more through
+    assert len(_local_maxima(curve)) == 1
+    assert curve.i.max() == pytest.approx(shaded.i_sc, rel=0.05)
+    assert curve.i.max() < 0.35 * bright.i_sc
+    assert curve.p_mp < 0.6 * with_bypass.p_mp
+    assert curve.v_oc == pytest.approx(with_bypass.v_oc)
+
+
+def test_identical_modules_share_a_curve(table, monkeypatch):
+    model = ArrayModel(table, series=4, parallel=3)
+    looked_up = []
+    module_voltages = model._module_voltages
+
+    def counted(g, t, current):
+        looked_up.append(len(g))
+        return module_voltages(g, t, current)
+
+    monkeypatch.setattr(model, '_module_voltages', counted)
+
+    # uniform conditions are the module curve scaled, no array curve is built
+    assert model.evaluate(800.0, 30.0).p_mp == pytest.approx(12 * table.point(800.0, 30.0).p_mp)
+    assert looked_up == []
+
+    # 12 modules, two conditions: differences below the resolution count as the same condition
+    g = np.array([1000.0, 1000.3, 1000.0, 300.0])[:, np.newaxis] + np.zeros((1, 3))
+    curve = model.evaluate(g, 25.0)
+    assert looked_up == [2]
+
+    # three identical strings carry three times the current of one
+    single = ArrayModel(table, series=4, parallel=1).evaluate(g[:, :1], 25.0)
+    np.testing.assert_allclose(curve.v, single.v)
+    np.testing.assert_allclose(curve.i, 3 * single.i, rtol=1e-12)
@@ -0,0 +1,39 @@
+""" test_batch.py
+    A batch gives the same results inline, on one worker and on a pool, starting from cold module and IV table caches.
+"""
+
+import os
+
+import pandas as pd
+
+from sg_solarsim.batch import Job, run_batch
+from sg_solarsim.tests import synthetic
+
+SITES = (('a', synthetic.LAT, synthetic.LNG, 0), ('b', 45.0, 8.0, 1), ('c', -33.9, 18.4, 2))
+
+
+def test_workers_agree(tmp_path, monkeypatch):
+    for name in ('tmy', 'modules', 'ivtable'):
+        os.makedirs(str(tmp_path / name))
+    monkeypatch.setenv('SG_SOLARSIM_TMY_CACHE', str(tmp_path / 'tmy'))
+    monkeypatch.setenv('SG_SOLARSIM_OFFLINE', '1')
+    monkeypatch.setenv('SG_SOLARSIM_MODULE_CACHE', str(tmp_path / 'modules'))
+    monkeypatch.setenv('SG_SOLARSIM_IVTABLE_CACHE', str(tmp_path / 'ivtable'))
+    for _, lat, lng, seed in SITES:
+        synthetic.synthetic_cache(str(tmp_path / 'tmy'), lat, lng, seed=seed)
+
+    from sg_solarsim.moduledb import ModuleDB
+    modules = ModuleDB.build('CECMod').names[:2]
+    jobs = [Job(site, lat, lng, 'CECMod', module, '06-01', '06-02', series, parallel, 600.0, 'inc_cond')
+            for site, lat, lng, _ in SITES for module in modules for series, parallel in ((1, 1), (10, 2))]
+    os.remove(str(tmp_path / 'modules' / 'CECMod.npy'))     # cold again, the pool run builds it
+
+    pooled = run_batch(jobs, workers=3, chunksize=1, progress=False)
+    single = run_batch(jobs, workers=1, progress=False)
+    inline = run_batch(jobs, workers=0, progress=False)
+    assert (pooled['error'] == '').all(), pooled['error'].tolist()
+    assert (pooled['steps'] > 0).all()
+    for other in (single, inline):
+        pd.testing.assert_frame_equal(pooled.drop(columns='seconds'), other.drop(columns='seconds'))
+    assert not [name for d in ('tmy', 'modules', 'ivtable') for name in os.listdir(str(tmp_path / d))
+                if name.startswith('.tmp')]
@@ -0,0 +1,71 @@
+""" test_benchmarks.py
+    Checks that the synthetic fixtures are deterministic and every benchmark runs.  Timing against the saved baseline
+    is noisy on shared machines so it only runs when SG_SOLARSIM_BENCHMARK is set:
+
+        SG_SOLARSIM_BENCHMARK=1 python -m pytest sg_solarsim/tests
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from sg_solarsim.tests import bench, synthetic
+
+
+def test_synthetic_tmy_is_deterministic():
+    a = synthetic.synthetic_tmy(seed=3)
+    b = synthetic.synthetic_tmy(seed=3)
+    assert a.equals(b)
+    assert not a.equals(synthetic.synthetic_tmy(seed=4))
+    assert len(a) == 366 * 24
+    assert str(a.index.tz) == 'UTC'
+    assert a['ghi'].min() >= 0 and a['ghi'].max() < 1100
+
+
+def test_synthetic_cache_feeds_tmy(tmp_path):
+    from sg_solarsim.tmy import tmy
+
+    cache = synthetic.synthetic_cache(str(tmp_path))
+    fixture = bench.Fixture()
+    try:
+        t = tmy(lat=synthetic.LAT, lng=synthetic.LNG, tz=synthetic.TZ, daterange=[fixture.start, fixture.end],
+                cache=cache)
+    finally:
+        fixture.close()
+    # the two weeks plus three hours either side, on the hour in local time
+    assert len(t.tmy_slice) == 14 * 24 + 7
+    assert (t.tmy_slice.index.minute == 0).all()
+    assert t.tmy_slice['ghi'].max() > 500
+
+
+def test_every_benchmark_runs():
+    results = bench.run_benchmarks(number=2, repeat=1)['benchmarks']
+    assert list(results) == list(bench.BENCHMARKS)
+    for name, result in results.items():
+        if 'skipped' in result:
+            continue
+        assert result['min'] > 0, name
+        assert result['min'] <= result['median'], name
+
+
+def test_compare_flags_regressions():
+    baseline = {'benchmarks': {'a': {'min': 1.0}, 'b': {'min': 1.0}, 'c': {'min': 1.0}, 'd': {'skipped': 'x'}},
+                'thresholds': {'b': 3.0}}
+    results = {'benchmarks': {'a': {'min': 2.0}, 'b': {'min': 2.0}, 'c': {'min': 0.5}, 'd': {'min': 1.0},
+                              'new': {'min': 1.0}}}
+    rows = {row['name']: row for row in bench.compare(results, baseline, threshold=1.5)}
+    assert set(rows) == {'a', 'b', 'c'}
+    assert rows['a']['regressed']
+    assert not rows['b']['regressed']
+    assert not rows['c']['regressed']
+    assert np.isclose(rows['c']['ratio'], 0.5)
+
+
+@pytest.mark.skipif(not os.environ.get('SG_SOLARSIM_BENCHMARK'), reason='set SG_SOLARSIM_BENCHMARK to time')
+def test_against_baseline():
+    if not os.path.exists(bench.BASELINE):
+        pytest.skip('no baseline, make one with python -m sg_solarsim.tests.bench --save-baseline')
+    rows = bench.compare(bench.run_benchmarks(), bench.load(bench.BASELINE))
+    regressed = [row for row in rows if row['regressed']]
+    assert not regressed, '\n' + bench.format_comparison(regressed)
@@ -0,0 +1,29 @@
+""" test_celltemp.py
+    The incremental cell temperature against the batch one, and the module's T_NOCT in the noct model.
+"""
+
+import numpy as np
+import pytest
+
+from sg_solarsim import celltemp
+from sg_solarsim.celltemp import CellTemperature, cell_temperature
+from sg_solarsim.tests import synthetic
+
+
+@pytest.mark.parametrize('model', celltemp.MODELS)
+def test_incremental_matches_batch(model):
+    weather = synthetic.synthetic_tmy().loc['2000-06-01':'2000-06-03']
+    g, t_air, wind = (weather[c].to_numpy(dtype=float) for c in ('ghi', 'temp_air', 'wind_speed'))
+    thermal = CellTemperature.for_module(model, synthetic.MODULE_PARAMS)
+    incremental = [thermal.update(*sample, dt=3600.0) for sample in zip(g, t_air, wind)]
+    batch = cell_temperature(g, t_air, wind, step=3600.0, model=model, t_noct=synthetic.MODULE_PARAMS['T_NOCT'])
+    np.testing.assert_allclose(incremental, batch, rtol=1e-12)
+
+
+def test_module_t_noct():
+    params = synthetic.MODULE_PARAMS
+    assert CellTemperature.for_module('noct', params).t_noct == params['T_NOCT']
+    assert CellTemperature.for_module('noct', dict(params, T_NOCT=float('nan'))).t_noct == celltemp.T_NOCT
+    hotter = CellTemperature.for_module('noct', dict(params, T_NOCT=50.0))
+    assert hotter.steady_state(800.0, 20.0) > CellTemperature.for_module('noct', params).steady_state(800.0, 20.0)
+    assert hotter.steady_state(800.0, 20.0, 1.0) == celltemp.steady_state(800.0, 20.0, 1.0, 'noct', t_noct=50.0)
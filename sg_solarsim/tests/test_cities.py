@@ -0,0 +1,47 @@
+""" test_cities.py
+    Lookups of the binary city index against a plain search of the csv it was built from.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from sg_solarsim.cities import SEPARATOR, CityIndex
+from sg_solarsim.tests import synthetic
+
+
+def test_lookups_match_csv(tmp_path):
+    csv_path = synthetic.synthetic_cities(os.path.join(str(tmp_path), 'worldcities.csv'), n=2000)
+    index = CityIndex.open(csv_path, cache_dir=str(tmp_path / 'cache'))
+    data = pd.read_csv(csv_path, keep_default_na=False)
+    data['label'] = data['city_ascii'] + SEPARATOR + data['admin_name']
+
+    for _, city in data.sample(50, random_state=0).iterrows():
+        assert index.location(city['label'], city['country']) == (round(city['lat'], 4), round(city['lng'], 4))
+        assert city['label'] in index.cities(city['country'])
+    assert index.location('Gaithersburg - Maryland') == (39.1346, -77.2132)
+    assert index.location('Gaithersburg - Maryland', 'Nowhere') == (39.1346, -77.2132)
+
+    with pytest.raises(KeyError):
+        index.location('No such city - Nowhere')
+
+    for country, label, lat, lng, _ in index.nearest(39.13, -77.21, k=5):
+        rows = data[(data['label'] == label) & (data['country'] == country)]
+        assert len(rows) == 1
+    assert os.listdir(str(tmp_path / 'cache')) == ['worldcities.npz']
+
+
+def test_duplicate_labels(tmp_path):
+    csv_path = os.path.join(str(tmp_path), 'worldcities.csv')
+    pd.DataFrame({'city_ascii': ['Springfield', 'Springfield', 'Springfield', 'Paris'],
+                  'admin_name': ['Illinois', 'Illinois', 'Illinois', 'Ile-de-France'],
+                  'country': ['United States', 'United States', 'Canada', 'France'],
+                  'lat': [39.8, 40.0, 45.0, 48.8567], 'lng': [-89.6, -89.0, -75.0, 2.3522]}).to_csv(csv_path, index=False)
+    index = CityIndex.open(csv_path, cache_dir=str(tmp_path / 'cache'))
+
+    # the first row of a duplicate wins, like the old table search
+    assert index.location('Springfield - Illinois') == (45.0, -75.0)
+    assert index.location('Springfield - Illinois', 'United States') == (39.8, -89.6)
+    assert index.location('Springfield - Illinois', 'Canada') == (45.0, -75.0)
+    assert index.location('Paris - Ile-de-France', 'Canada') == (48.8567, 2.3522)
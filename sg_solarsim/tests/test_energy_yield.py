@@ -0,0 +1,122 @@
+""" test_energy_yield.py
+    Yield of the synthetic year: the tracker never beats Pmp, the periods add up, and a TMY without February 29th
+    gives 365 days.
+"""
+
+import os
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sg_solarsim import energy_yield
+from sg_solarsim.tests import synthetic
+from sg_solarsim.tmy_cache import TmyCache
+
+STEP = 300.0
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    monkeypatch.setenv('SG_SOLARSIM_TMY_CACHE', str(tmp_path / 'tmy'))
+    monkeypatch.setenv('SG_SOLARSIM_OFFLINE', '1')
+    monkeypatch.setenv('SG_SOLARSIM_MODULE_CACHE', str(tmp_path / 'modules'))
+    monkeypatch.setenv('SG_SOLARSIM_IVTABLE_CACHE', str(tmp_path / 'ivtable'))
+    return synthetic.synthetic_cache(str(tmp_path / 'tmy'))
+
+
+def _yield(cache, **kwargs):
+    return energy_yield.site_yield(synthetic.LAT, synthetic.LNG, step=STEP, tz=synthetic.TZ, cache=cache, **kwargs)
+
+
+def test_tracked_within_ideal_and_periods_add_up(caches):
+    result = _yield(caches)
+    annual, monthly, daily = result
+    assert len(daily) == 366 and len(monthly) == 12
+    assert 0.8 * annual['ideal_kwh'] < annual['energy_kwh'] <= annual['ideal_kwh']
+    assert (monthly['energy_wh'] <= monthly['ideal_wh']).all()
+    for column, total in (('energy_wh', annual['energy_kwh']), ('ideal_wh', annual['ideal_kwh'])):
+        assert monthly[column].sum() == pytest.approx(total * 1000, rel=1e-9)
+        assert daily[column].sum() == pytest.approx(total * 1000, rel=1e-9)
+
+
+def test_ideal_only(caches, capsys, tmp_path):
+    tracked = _yield(caches)
+    ideal = _yield(caches, track=False)
+    assert np.isnan(ideal.annual['energy_kwh']) and np.isnan(ideal.annual['efficiency'])
+    assert ideal.monthly['energy_wh'].isna().all()
+    assert ideal.annual['ideal_kwh'] == pytest.approx(tracked.annual['ideal_kwh'], rel=1e-12)
+
+    parser = ArgumentParser()
+    energy_yield.add_arguments(parser)
+    output = str(tmp_path / 'annual.csv')
+    args = parser.parse_args(['--lat', str(synthetic.LAT), '--lng', str(synthetic.LNG), '--step', str(STEP),
+                              '--ideal', '--period', 'annual', '--output', output])
+    assert energy_yield.run_cli(args) == 0
+    assert 'kWh/year at Pmp' in capsys.readouterr().out
+    written = pd.read_csv(output)
+    assert len(written) == 1 and np.isnan(written['energy_kwh'][0])
+    assert written['ideal_kwh'][0] == pytest.approx(ideal.annual['ideal_kwh'], rel=1e-9)
+
+
+def test_missing_leap_day(caches, tmp_path):
+    full = _yield(caches)
+    # an 8760 hour TMY coerced to 2000 has no February 29th
+    data = synthetic.synthetic_tmy()
+    data = data[~((data.index.month == 2) & (data.index.day == 29))]
+    cache = TmyCache(str(tmp_path / 'no_leap'), offline=True)
+    cache.store(synthetic.LAT, synthetic.LNG, data)
+    short = _yield(cache)
+
+    assert len(short.daily) == 365
+    assert pd.Timestamp('2000-02-29') not in short.daily.index
+    # the days either side of the gap are the same days as in the full year
+    for day in ('2000-02-27', '2000-03-01', '2000-07-01'):
+        assert short.daily.loc[day, 'ideal_wh'] == pytest.approx(full.daily.loc[day, 'ideal_wh'], rel=1e-3)
+
+
+@pytest.mark.parametrize('step', [0.0, -60.0, 7200.0, 7.0])
+def test_bad_step(step):
+    with pytest.raises(ValueError):
+        energy_yield.site_yield(synthetic.LAT, synthetic.LNG, step=step)
+
+
+def test_thermal_models(caches, monkeypatch):
+    from sg_solarsim import celltemp
+    from sg_solarsim.moduledb import get_modules
+
+    calls = []
+    cell_temperature = celltemp.cell_temperature
+
+    def recorded(*args, **kwargs):
+        calls.append(kwargs)
+        return cell_temperature(*args, **kwargs)
+
+    monkeypatch.setattr(celltemp, 'cell_temperature', recorded)
+    air = _yield(caches, track=False, thermal=None)
+    faiman = _yield(caches, track=False)
+    noct = _yield(caches, track=False, thermal='noct')
+
+    # warm cells give less than cells at air temperature
+    assert faiman.annual['ideal_kwh'] < air.annual['ideal_kwh']
+    assert noct.annual['ideal_kwh'] < air.annual['ideal_kwh']
+    assert noct.annual['ideal_kwh'] != pytest.approx(faiman.annual['ideal_kwh'], rel=1e-6)
+    assert [a.annual['thermal'] for a in (air, faiman, noct)] == [None, 'faiman', 'noct']
+
+    # the noct model runs with the module's own T_NOCT
+    modules = get_modules()
+    assert [c['model'] for c in calls] == ['faiman', 'noct']
+    assert calls[1]['t_noct'] == float(modules[modules.names[0]]['T_NOCT'])
+
+    with pytest.raises(ValueError):
+        _yield(caches, track=False, thermal='sauna')
+
+
+def test_thermal_flag():
+    parser = ArgumentParser()
+    energy_yield.add_arguments(parser)
+    assert parser.parse_args([]).thermal == 'faiman'
+    assert parser.parse_args(['--thermal', 'none']).thermal == 'none'
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--thermal', 'sauna'])
@@ -0,0 +1,55 @@
+""" test_instrument.py
+    SetpointStream against the FakeInstrument SCPI server.
+"""
+
+import math
+import time
+
+import pytest
+
+from sg_solarsim.instrument import Curve, FakeInstrument, Setpoint, SetpointStream, format_stats, format_update
+
+
+def test_stream_coalesces_and_sends_the_last_setpoint():
+    with FakeInstrument(delay=0.001) as fake:
+        stream = SetpointStream(port=fake.port, rate=50.0).start()
+        try:
+            # far faster than the 50 updates/s the stream may send
+            for k in range(400):
+                stream.submit(Setpoint(v=30.0 + k / 100, i=8.0))
+                time.sleep(0.001)
+        finally:
+            stream.stop()
+        assert stream.error is None
+        stats = stream.stats()
+
+        assert stats['submitted'] == 400
+        assert 0 < stats['sent'] < stats['submitted']
+        assert stats['coalesced'] > 0
+        # every update is either sent or replaced by a later one
+        assert stats['sent'] + stats['coalesced'] == stats['submitted']
+        assert fake.settings['VOLT'] == '33.9900'
+        assert fake.settings['CURR'] == '8.0000'
+
+    assert 0 < stats['rate'] <= 60.0
+    for name in ('latency_mean', 'latency_p50', 'latency_p99', 'latency_max'):
+        assert math.isfinite(stats[name]) and stats[name] > 0, name
+    assert stats['latency_p50'] <= stats['latency_p99'] <= stats['latency_max']
+    assert 'coalesced' in format_stats(stats)
+
+
+def test_curve_update():
+    with FakeInstrument() as fake:
+        with SetpointStream(port=fake.port, rate=100.0) as stream:
+            stream.submit(Curve(v_oc=37.2, i_sc=8.87, v_mp=30.1, i_mp=8.3))
+        assert stream.sent == 1
+        assert fake.settings == {'CURR:SAS:ISC': '8.8700', 'VOLT:SAS:VOC': '37.2000', 'CURR:SAS:IMP': '8.3000',
+                                 'VOLT:SAS:VMP': '30.1000'}
+    assert format_update(Setpoint(1, 2)) == 'VOLT 1.0000;:CURR 2.0000'
+
+
+def test_start_fails_without_instrument():
+    with FakeInstrument() as fake:
+        port = fake.port
+    with pytest.raises(OSError):
+        SetpointStream(port=port).start()
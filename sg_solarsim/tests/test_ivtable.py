@@ -0,0 +1,56 @@
+""" test_ivtable.py
+    The interpolated i-v surface against the exact single diode solution.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from sg_solarsim import pvmodel
+from sg_solarsim.ivtable import IVTable, DEFAULT_TOLERANCE
+from sg_solarsim.tests import synthetic
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    return IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic',
+                              cache_dir=str(tmp_path_factory.mktemp('ivtable')))
+
+
+def test_error_within_tolerance(table):
+    max_error = DEFAULT_TOLERANCE * synthetic.MODULE_PARAMS['I_L_ref']
+    assert table.max_error <= max_error
+
+    # random conditions off the grid, short circuit to Voc
+    rng = np.random.default_rng(0)
+    for g_eff, t_eff in zip(rng.uniform(50, 1200, 40), rng.uniform(-10, 70, 40)):
+        IL, I0, Rs, Rsh, nNsVth = pvmodel.calcparams_desoto(synthetic.MODULE_PARAMS, g_eff, t_eff)
+        v_oc = float(pvmodel.singlediode(IL, I0, Rs, Rsh, nNsVth, pnts=None)['v_oc'])
+        v = np.linspace(0, v_oc, 50)
+        exact = pvmodel.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)
+        assert np.max(np.abs(table.i_from_v(g_eff, t_eff, v) - exact)) <= max_error
+        assert abs(table.point(g_eff, t_eff).i_from_v(v[25]) - exact[25]) <= max_error
+
+
+def test_cached_table_is_reloaded(tmp_path):
+    a = IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic', cache_dir=str(tmp_path))
+    # no temporary file left behind
+    assert len(os.listdir(str(tmp_path))) == 1
+    b = IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic', cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(a.i, b.i)
+
+
+def test_build_warns_when_refinement_runs_out():
+    with pytest.warns(RuntimeWarning):
+        IVTable.build(synthetic.MODULE_PARAMS, tolerance=1e-9, max_refine=0)
+
+
+@pytest.mark.parametrize('g_eff, t_eff', [(800.0, 40.0), (1000.0, 25.0), (120.0, -5.0), (0.0, 20.0)])
+def test_scalar_matches_vector(table, g_eff, t_eff):
+    # past open circuit and below zero too, where both hold the end of the curve
+    point = table.point(g_eff, t_eff)
+    v = np.linspace(-1.0, 1.5 * max(point.v_oc, 1.0), 301)
+    vector = table.i_from_v(g_eff, t_eff, v)
+    scalar = np.array([point.i_from_v(x) for x in v])
+    np.testing.assert_allclose(scalar, vector, rtol=1e-9, atol=1e-9)
@@ -0,0 +1,116 @@
+""" test_liveplot.py
+    LivePlot frames on the Agg canvas, no display needed.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from sg_solarsim.liveplot import LivePlot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def live():
+    fig = Figure(figsize=(4, 3), dpi=50)
+    FigureCanvasAgg(fig)
+    clock = FakeClock()
+    plot = LivePlot(fig=fig, trajectory=5, fps=10.0, clock=clock)
+    full = []
+    fig.canvas.mpl_connect('draw_event', full.append)
+    return plot, clock, full
+
+
+def test_draws_only_changes(live):
+    plot, clock, full = live
+    assert not plot.draw()
+    plot.set_curve(np.linspace(0, 37, 50), np.linspace(8.8, 0, 50))
+    plot.add_point(30.0, 8.0)
+    assert plot.draw()
+    assert not plot.draw()
+    clock.now += 1.0
+    assert not plot.draw(force=True)
+    plot.add_point(30.5, 7.9)
+    assert plot.draw()
+    assert plot.frames == 2
+
+
+def test_frame_rate_cap(live):
+    plot, clock, full = live
+    plot.add_point(30.0, 8.0)
+    assert plot.draw()
+    plot.add_point(30.5, 7.9)
+    # within a tenth of a second of the last frame
+    clock.now += 0.05
+    assert not plot.draw()
+    assert plot.draw(force=True)
+    plot.add_point(31.0, 7.8)
+    clock.now += 0.1
+    assert plot.draw()
+
+
+def test_background_is_cached(live):
+    plot, clock, full = live
+    plot.add_point(30.0, 8.0)
+    plot.draw()
+    # the first frame is a full draw that caches the background, then only the artists are blitted
+    assert len(full) == 1
+    background = plot._background
+    assert background is not None
+    for k in range(10):
+        clock.now += 1.0
+        plot.add_point(30.0 + k / 10, 8.0)
+        assert plot.draw()
+    assert len(full) == 1
+    assert plot._background is background
+
+
+def test_limit_change_recaptures_background(live):
+    plot, clock, full = live
+    plot.add_point(30.0, 8.0)
+    plot.draw()
+    background = plot._background
+
+    clock.now += 1.0
+    plot.add_point(60.0, 8.0)
+    assert plot.ax.get_xlim() == (0, 90.0)
+    assert plot._background is None
+    assert plot.draw()
+    assert len(full) == 2
+    assert plot._background is not None and plot._background is not background
+
+
+def test_resize_recaptures_background(live):
+    plot, clock, full = live
+    plot.add_point(30.0, 8.0)
+    plot.draw()
+    assert plot._background.get_extents() == (0, 0, 200, 150)
+
+    # a backend redraws the whole figure after a resize
+    plot.fig.set_size_inches(6, 4)
+    plot.redraw()
+    assert len(full) == 2
+    assert plot._background.get_extents() == (0, 0, 300, 200)
+    clock.now += 1.0
+    plot.add_point(31.0, 8.0)
+    assert plot.draw()
+    assert len(full) == 2
+
+
+def test_trajectory_ring(live):
+    plot, clock, full = live
+    for k in range(8):
+        plot.add_point(float(k), 1.0)
+    v, i = plot.trajectory()
+    assert v.tolist() == [3.0, 4.0, 5.0, 6.0, 7.0]
@@ -0,0 +1,63 @@
+""" test_moduledb.py
+    The module store built from a small SAM format csv.
+"""
+
+import os
+
+import pytest
+
+from sg_solarsim import moduledb, pvmodel
+from sg_solarsim.moduledb import PARAMETERS, ModuleDB, get_modules
+from sg_solarsim.tests import synthetic
+
+
+def write_modules(path, modules):
+    """ writes a csv like the SAM library, a name column then one row per module after a units and a labels row """
+    params = sorted(synthetic.MODULE_PARAMS)
+    lines = [','.join(['Name'] + params), ',' * len(params), ',' * len(params)]
+    for name, values in modules.items():
+        lines.append(','.join([name] + [repr(values[p]) for p in params]))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+@pytest.fixture
+def builds(tmp_path, monkeypatch):
+    monkeypatch.setenv('SG_SOLARSIM_MODULE_CACHE', str(tmp_path / 'modules'))
+    monkeypatch.setattr(moduledb, '_stores', {})
+    calls = []
+    retrieve = pvmodel.retrieve_modules
+
+    def counted(modlistname):
+        calls.append(modlistname)
+        return retrieve(modlistname)
+
+    monkeypatch.setattr(pvmodel, 'retrieve_modules', counted)
+    return calls
+
+
+def test_store_matches_source(tmp_path, builds):
+    other = dict(synthetic.MODULE_PARAMS, I_L_ref=5.5, STC=180.0)
+    csv_path = write_modules(str(tmp_path / 'small.csv'), {'Synthetic_250P': synthetic.MODULE_PARAMS,
+                                                          'Synthetic_180P': other})
+    modules = get_modules(csv_path)
+    assert modules.names == ['Synthetic_250P', 'Synthetic_180P']
+    for name, source in (('Synthetic_250P', synthetic.MODULE_PARAMS), ('Synthetic_180P', other)):
+        assert modules[name].name == name
+        assert {p: float(modules[name][p]) for p in PARAMETERS} == source
+    assert list(modules.column('I_L_ref')) == [synthetic.MODULE_PARAMS['I_L_ref'], 5.5]
+    assert len(builds) == 1
+
+    # unchanged, opened from the store
+    assert ModuleDB.open(csv_path).names == modules.names
+    assert len(builds) == 1
+
+    # a changed csv is rebuilt
+    st = os.stat(csv_path)
+    write_modules(csv_path, {'Synthetic_250P': dict(synthetic.MODULE_PARAMS, I_L_ref=9.0)})
+    os.utime(csv_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    rebuilt = ModuleDB.open(csv_path)
+    assert len(builds) == 2
+    assert rebuilt.names == ['Synthetic_250P']
+    assert rebuilt['Synthetic_250P']['I_L_ref'] == 9.0
@@ -0,0 +1,58 @@
+""" test_mppt.py
+    The vectorized tracker bank against the scalar trackers.
+"""
+
+import numpy as np
+import pytest
+
+from sg_solarsim.mppt import MPPT, MPPTBank, Tracker, TRACKERS
+from sg_solarsim.ivtable import IVTable
+from sg_solarsim.tests import synthetic
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    return IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic', cache_dir=str(tmp_path_factory.mktemp('ivtable')))
+
+
+def test_bank_matches_scalar_trackers(table):
+    n = 300
+    rng = np.random.default_rng(0)
+    steps = rng.uniform(0.1, 1.0, n)
+    g_eff = rng.uniform(0, 1100, n)
+    t_eff = rng.uniform(0, 60, n)
+
+    bank = MPPTBank(n, step=steps)
+    trackers = [MPPT(step=s) for s in steps]
+    v_bank = bank.v_ref.copy()
+    v_scalar = [t.v_ref for t in trackers]
+    for k in range(200):
+        # the conditions drift so every branch of the algorithm is taken
+        g = np.clip(g_eff + 200 * np.sin(k / 15 + np.arange(n)), 0, None)
+        v_bank = bank.inc_cond(v_bank, table.i_from_v(g, t_eff, v_bank)).copy()
+        v_scalar = [t.inc_cond(v, table.point(gk, tk).i_from_v(v))
+                    for t, v, gk, tk in zip(trackers, v_scalar, g, t_eff)]
+        np.testing.assert_allclose(v_bank, v_scalar, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('name', sorted(TRACKERS))
+@pytest.mark.parametrize('g_eff, t_eff', [(800.0, 40.0), (1000.0, 25.0)])
+def test_tracker_converges(table, name, g_eff, t_eff):
+    op = table.point(g_eff, t_eff)
+    tracker = TRACKERS[name]()
+    tracker.sample_voc(op.v_oc)
+    v = tracker.v_ref
+    power = []
+    for k in range(400):
+        v = tracker.track(v, op.i_from_v(v))
+        power.append(v * op.i_from_v(v))
+    # the hill climbers keep stepping around the maximum, the mean over the last steps is what gets delivered
+    assert np.mean(power[-50:]) == pytest.approx(op.p_mp, rel=0.03)
+
+
+def test_incomplete_tracker_fails_on_creation():
+    class NoTrack(Tracker):
+        pass
+
+    with pytest.raises(TypeError):
+        NoTrack()
@@ -0,0 +1,38 @@
+""" test_mppt_bench.py
+    The tracker benchmark harness on the synthetic profiles.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sg_solarsim import mppt_bench
+from sg_solarsim.ivtable import IVTable
+from sg_solarsim.tests import synthetic
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    return IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic', cache_dir=str(tmp_path_factory.mktemp('ivtable')))
+
+
+def test_ramp_benchmark(table):
+    g_eff, t_eff = mppt_bench.ramp()
+    results = mppt_bench.benchmark(table, g_eff, t_eff)
+    for name, r in results.items():
+        assert 0 < r['efficiency'] <= 1, name
+        assert r['energy'] <= r['ideal_energy']
+        assert r['steps'] == len(g_eff)
+    assert results['vs_inc_cond']['efficiency'] >= results['inc_cond']['efficiency']
+    assert results['vs_inc_cond']['convergence_time'] <= results['inc_cond']['convergence_time']
+
+
+def test_solar_days():
+    data = synthetic.synthetic_tmy()
+    days = mppt_bench.solar_days(data, synthetic.LNG, '06-21', '06-22')
+    assert len(days) == 48
+    # solar midnight at 77.21 W is 05:09 UTC, the first hour starting after it is 06:00
+    assert days.index[0] == pd.Timestamp('2000-06-21 06:00', tz='UTC')
+    assert days.index[-1] == pd.Timestamp('2000-06-23 05:00', tz='UTC')
+    # dark at both ends
+    assert np.all(days['ghi'].to_numpy()[[0, -1]] == 0)
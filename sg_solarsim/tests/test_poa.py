@@ -0,0 +1,22 @@
+""" test_poa.py
+    The plane of array cache hits for the same weather and misses for different weather over the same hours.
+"""
+
+import numpy as np
+
+from sg_solarsim.poa import PoaCache
+from sg_solarsim.tests import synthetic
+
+
+def test_cache_keyed_on_weather():
+    cache = PoaCache()
+    weather = synthetic.synthetic_tmy().loc['2000-06-01':'2000-06-07']
+    first = cache.get(weather, synthetic.LAT, synthetic.LNG, 30.0)
+    assert cache.get(weather.copy(), synthetic.LAT, synthetic.LNG, 30.0) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # same site, hours and orientation, other irradiance
+    cloudier = synthetic.synthetic_tmy(seed=5).loc['2000-06-01':'2000-06-07']
+    other = cache.get(cloudier, synthetic.LAT, synthetic.LNG, 30.0)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert not np.array_equal(other, first)
@@ -0,0 +1,125 @@
+""" test_profiling.py
+    Phase statistics and reporting on an injected clock.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from sg_solarsim.profiling import BIN_EDGES, PhaseStats, Profiler
+
+
+class FakeClock:
+    """ advances only when told, counts the reads """
+
+    def __init__(self):
+        self.now = 0.0
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        return self.now
+
+
+def test_percentiles_of_known_durations():
+    s = PhaseStats('known')
+    for _ in range(90):
+        s.add(3e-6)
+    for _ in range(10):
+        s.add(2e-3)
+    assert (s.count, s.min, s.max) == (100, 3e-6, 2e-3)
+    assert s.mean == pytest.approx((90 * 3e-6 + 10 * 2e-3) / 100)
+    # 3 us is in the bin up to 10^-5.5 s, 2 ms in the one up to 10^-2.5 s which is capped at the maximum
+    assert s.percentile(50) == pytest.approx(10 ** -5.5)
+    assert s.percentile(90) == pytest.approx(10 ** -5.5)
+    assert s.percentile(91) == 2e-3
+    assert s.percentile(99) == 2e-3
+    assert sum(s.bins) == 100
+    assert PhaseStats('empty').percentile(50) == 0.0
+
+
+def test_percentiles_within_a_bin():
+    durations = np.random.default_rng(0).lognormal(np.log(1e-4), 1.5, 5000)
+    s = PhaseStats('lognormal')
+    for d in durations:
+        s.add(float(d))
+    for q in (10, 50, 90, 99):
+        exact = np.percentile(durations, q, method='inverted_cdf')
+        # never below the true value and at most one bin, a quarter decade, above it
+        assert exact <= s.percentile(q) <= exact * 10 ** 0.25
+
+
+def test_overflow_bin():
+    s = PhaseStats('slow')
+    s.add(30.0)
+    assert s.bins[len(BIN_EDGES)] == 1
+    assert s.percentile(50) == 30.0
+
+
+def test_phases_on_the_clock():
+    clock = FakeClock()
+    p = Profiler(enabled=True, clock=clock)
+    for seconds in (0.001, 0.003):
+        with p.phase('step'):
+            clock.now += seconds
+    p.count('frames', 3)
+    stats = p.stats()['phases']['step']
+    assert stats['count'] == 2
+    assert stats['total'] == pytest.approx(0.004)
+    assert stats['min'] == pytest.approx(0.001)
+    assert stats['max'] == pytest.approx(0.003)
+    assert p.counters == {'frames': 3}
+    assert 'step' in p.report() and 'frames' in p.report()
+
+
+def test_disabled_is_a_no_op():
+    clock = FakeClock()
+    p = Profiler(clock=clock)
+    reads = clock.reads
+
+    @p.timed()
+    def work(x):
+        return 2 * x
+
+    # one shared do nothing context manager, the clock is never read
+    assert p.phase('a') is p.phase('b')
+    with p.phase('a'):
+        clock.now += 1.0
+    assert work(3) == 6
+    p.count('frames')
+    assert clock.reads == reads
+    assert p.phases == {} and p.counters == {}
+
+    p.enable()
+    assert work(3) == 6
+    assert list(p.phases) == [work.__qualname__]
+
+
+def test_maybe_report_interval():
+    clock = FakeClock()
+    p = Profiler(clock=clock)
+    reports = []
+    clock.now = 20.0
+    assert not p.maybe_report(10.0, out=reports.append)
+
+    p.enable()
+    p.reset()
+    for now, expected in ((5.0, False), (30.0, True), (35.0, False), (39.9, False), (40.0, True), (41.0, False)):
+        clock.now = now
+        assert p.maybe_report(10.0, out=reports.append) == expected, now
+    assert len(reports) == 2
+
+
+def test_dump(tmp_path):
+    clock = FakeClock()
+    p = Profiler(enabled=True, clock=clock)
+    with p.phase('step'):
+        clock.now += 0.5
+    path = str(tmp_path / 'profile.json')
+    p.dump(path)
+    with open(path) as f:
+        data = json.load(f)
+    assert data['bin_edges'] == BIN_EDGES
+    assert data['phases']['step']['count'] == 1
+    assert sum(data['phases']['step']['bins']) == 1
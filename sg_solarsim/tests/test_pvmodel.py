@@ -0,0 +1,31 @@
+""" test_pvmodel.py
+    The vectorized operating points against one pvlib call per condition.
+"""
+
+import numpy as np
+import pytest
+from pvlib import pvsystem
+
+from sg_solarsim import pvmodel
+from sg_solarsim.tests import synthetic
+
+KEYS = ('i_sc', 'v_oc', 'i_mp', 'v_mp', 'p_mp')
+
+
+def test_batch_matches_per_point():
+    # g=0 gives an infinite shunt resistance
+    g, t = np.meshgrid([0.0, 1.0, 50.0, 400.0, 1000.0, 1200.0], [-10.0, 25.0, 60.0])
+    batch = pvmodel.batch_operating_points(synthetic.MODULE_PARAMS, g, t, ivcurve_pnts=11)
+    assert np.isinf(batch['Rsh'][:, 0]).all()
+    assert batch['v'].shape == batch['i'].shape == g.shape + (11,)
+
+    for index in np.ndindex(g.shape):
+        IL, I0, Rs, Rsh, nNsVth = pvmodel.calcparams_desoto(synthetic.MODULE_PARAMS, g[index], t[index])
+        IL = max(float(IL), 0.001)
+        for name, value in zip(('IL', 'I0', 'Rs', 'Rsh', 'nNsVth'), (IL, I0, Rs, Rsh, nNsVth)):
+            assert batch[name][index] == pytest.approx(float(value), rel=1e-12)
+        exact = pvsystem.singlediode(IL, I0, Rs, Rsh, nNsVth)
+        for key in KEYS:
+            assert batch[key][index] == pytest.approx(float(exact[key]), rel=1e-9, abs=1e-12)
+        for v, i in zip(batch['v'][index], batch['i'][index]):
+            assert i == pytest.approx(float(pvsystem.i_from_v(Rsh, Rs, nNsVth, v, I0, IL)), rel=1e-9, abs=1e-12)
@@ -0,0 +1,90 @@
+""" test_resample.py
+    The lazily resampled timeline: hourly means, chunk order, saved timelines and point samples.
+"""
+
+import numpy as np
+import pytest
+
+from sg_solarsim.resample import HOUR, Resampler, Timeline
+from sg_solarsim.tests import synthetic
+
+STEP = 10.0
+
+
+@pytest.fixture(scope='module')
+def tmy_slice():
+    return synthetic.synthetic_tmy().loc['2000-06-01':'2000-06-02']
+
+
+def resampler(tmy_slice, clouds=7, **kwargs):
+    # three hour chunks so two days make many of them
+    return Resampler(tmy_slice, step=STEP, clouds=clouds, chunk=3 * HOUR, **kwargs)
+
+
+def test_preserve_mean_keeps_hourly_irradiation(tmy_slice):
+    clouded = resampler(tmy_slice)
+    clear = resampler(tmy_slice, clouds=None)
+    per_hour = int(HOUR / STEP)
+    hours = (len(clouded) - 1) // per_hour
+    g = clouded.values(0, hours * per_hour)[0].reshape(hours, per_hour)
+    g_clear = clear.values(0, hours * per_hour)[0].reshape(hours, per_hour)
+
+    # the clouds move energy around within each clock hour
+    assert not np.allclose(g, g_clear)
+    np.testing.assert_allclose(g.mean(axis=1), g_clear.mean(axis=1), rtol=1e-9, atol=1e-9)
+    # clear moments are scaled up to make up for the clouded ones
+    assert np.any(g > g_clear * 1.05)
+
+
+def test_without_preserve_mean_clouds_only_dim(tmy_slice):
+    g = resampler(tmy_slice, preserve_mean=False).values(0, 5000)[0]
+    g_clear = resampler(tmy_slice, clouds=None).values(0, 5000)[0]
+    assert np.all(g <= g_clear)
+    assert np.any(g < g_clear)
+
+
+def test_chunk_order_does_not_matter(tmy_slice):
+    forward = np.concatenate([g for _, g, _ in resampler(tmy_slice).chunks()])
+    n = len(forward)
+
+    # the same seed in another resampler, chunks made back to front and at odd boundaries
+    other = resampler(tmy_slice)
+    bounds = [0, 777, 1080, 5001, 9999, 12345, n]
+    pieces = {a: other.values(a, b)[0] for a, b in reversed(list(zip(bounds[:-1], bounds[1:])))}
+    np.testing.assert_array_equal(np.concatenate([pieces[a] for a in bounds[:-1]]), forward)
+    np.testing.assert_array_equal(other.values(4000, 4100)[0], forward[4000:4100])
+
+    # another seed gives other clouds
+    assert not np.array_equal(resampler(tmy_slice, clouds=8).values(0, n)[0], forward)
+
+
+def test_save_round_trip(tmy_slice, tmp_path):
+    series = resampler(tmy_slice)
+    timeline = series.save(str(tmp_path / 'timeline'))
+    opened = Timeline.open(str(tmp_path / 'timeline'))
+    assert (len(opened), opened.start, opened.step) == (len(series), series.start, series.step)
+    g, t_air = series.values(0, len(series))
+    for saved in (timeline, opened):
+        g_saved, t_saved = saved.values(0, len(saved))
+        np.testing.assert_allclose(g_saved, g, rtol=2 ** -23, atol=1e-12)
+        np.testing.assert_allclose(t_saved, t_air, rtol=2 ** -23, atol=1e-12)
+        np.testing.assert_array_equal(g_saved, g.astype(np.float32))
+
+
+@pytest.mark.parametrize('saved', [False, True])
+def test_sample_matches_values(tmy_slice, tmp_path, saved):
+    series = resampler(tmy_slice)
+    if saved:
+        series = series.save(str(tmp_path / 'timeline'))
+    n = len(series)
+    g, t_air = series.values(0, n)
+    chunk = int(3 * HOUR / STEP)
+    for k in [0, 1, chunk - 1, chunk, chunk + 1, 2 * chunk - 1, 2 * chunk, n - 2, n - 1]:
+        assert series.sample(series.start + k * STEP) == (g[k], t_air[k]), k
+    # between the samples either side of a chunk boundary
+    for k in (chunk - 1, n - 2):
+        assert series.sample(series.start + (k + 0.25) * STEP) == pytest.approx(
+            (0.75 * g[k] + 0.25 * g[k + 1], 0.75 * t_air[k] + 0.25 * t_air[k + 1]), rel=1e-12)
+    # clamped before the start and after the end
+    assert series.sample(series.start - 100.0) == (g[0], t_air[0])
+    assert series.sample(series.start + n * STEP + 100.0) == (g[-1], t_air[-1])
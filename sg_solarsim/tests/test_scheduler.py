@@ -0,0 +1,116 @@
+""" test_scheduler.py
+    The tick scheduler on an injected clock, so stalls and lateness are exact.
+"""
+
+import pytest
+
+from sg_solarsim.scheduler import Scheduler, format_stats
+
+
+class FakeClock:
+    """ clock() and sleep() for the scheduler, time only moves when slept or advanced """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def scheduler(policy, **kwargs):
+    clock = FakeClock()
+    # a power of two period keeps every deadline exact
+    return Scheduler(period=0.25, policy=policy, clock=clock, sleep=clock.sleep, **kwargs).start(), clock
+
+
+def test_catch_up_runs_every_missed_tick():
+    s, clock = scheduler('catch_up', max_catch_up=10)
+    assert s.due() == []
+    assert s.remaining() == 0.25
+    clock.now = 0.35
+    assert s.due() == [0.25]
+    # stalled past four deadlines, 0.5 to 1.25
+    clock.now = 1.35
+    assert s.due() == [0.5, 0.75, 1.0, 1.25]
+    assert (s.ticks, s.skipped, s.overruns) == (5, 0, 1)
+    # back on the original grid
+    assert s.remaining() == pytest.approx(0.15)
+    clock.now = 1.5
+    assert s.due() == [1.5]
+
+
+def test_catch_up_is_capped():
+    s, clock = scheduler('catch_up', max_catch_up=3)
+    clock.now = 2.0
+    # 8 deadlines passed, 3 run and 5 skipped, the virtual time has no gap
+    assert s.due() == [0.25, 0.5, 0.75]
+    assert (s.ticks, s.skipped, s.overruns) == (3, 5, 1)
+    assert s.remaining() == 0.25
+
+
+def test_skip_runs_one_tick():
+    s, clock = scheduler('skip')
+    clock.now = 0.25
+    assert s.due() == [0.25]
+    clock.now = 1.35
+    assert s.due() == [0.5]
+    assert (s.ticks, s.skipped, s.overruns) == (2, 3, 1)
+    assert s.time == 0.5
+    # the next deadline is the first one still in the future
+    assert s.remaining() == pytest.approx(0.15)
+    clock.now = 1.5
+    assert s.due() == [0.75]
+    assert s.skipped == 3
+
+
+def test_stats():
+    s, clock = scheduler('catch_up')
+    lateness = [0.0, 0.1, 0.05, 0.6, 0.0]
+    for late in lateness:
+        clock.now = s._next + late
+        s.due()
+    stats = s.stats()
+    # 0.6 late is two deadlines missed, run back to back
+    assert stats['ticks'] == 7
+    assert stats['overruns'] == 1
+    assert stats['skipped'] == 0
+    assert stats['rate'] == pytest.approx(7 / clock.now)
+    assert stats['jitter_mean'] == pytest.approx(sum(lateness) / len(lateness))
+    assert stats['jitter_max'] == pytest.approx(0.6)
+    assert 0.1 < stats['jitter_p99'] <= 0.6
+    assert '7 ticks' in format_stats(stats)
+
+
+def test_run_on_time():
+    s, clock = scheduler('catch_up')
+    seen = []
+    s.run(seen.append, ticks=8)
+    assert seen == [0.25 * k for k in range(1, 9)]
+    assert clock.now == 2.0
+    stats = s.stats()
+    assert stats['rate'] == 4.0
+    assert stats['jitter_max'] == 0.0
+    assert stats['overruns'] == 0
+
+
+def test_run_after_a_slow_tick():
+    s, clock = scheduler('catch_up')
+    seen = []
+
+    def tick(t):
+        seen.append(t)
+        if t == 0.5:
+            clock.now += 0.6
+
+    s.run(tick, ticks=6)
+    assert seen == [0.25 * k for k in range(1, 7)]
+    assert s.overruns == 1
+    assert s.skipped == 0
+
+
+def test_policy_is_checked():
+    with pytest.raises(ValueError):
+        Scheduler(policy='drop')
@@ -0,0 +1,54 @@
+""" test_startup.py
+    The headless imports in a fresh interpreter, without the timing budgets which depend on the machine.
+"""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+import sg_solarsim
+from sg_solarsim import startup
+
+
+@pytest.fixture(autouse=True)
+def importable(monkeypatch):
+    # the child interpreter imports the package from this tree, whatever directory pytest runs in
+    root = os.path.dirname(os.path.dirname(os.path.abspath(sg_solarsim.__file__)))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+
+
+def test_package_import_is_light():
+    # sg_solarsim is already imported here, only a fresh interpreter shows what the import pulls in
+    r = startup.check('sg_solarsim', float('inf'), forbidden=('pvlib', 'pandas', 'matplotlib'), repeat=1)
+    assert r['forbidden'] == []
+    assert r['ok']
+
+
+@pytest.mark.parametrize('module', sorted(startup.BUDGETS))
+def test_no_forbidden_modules(module):
+    _, forbidden = startup.BUDGETS[module]
+    r = startup.check(module, float('inf'), forbidden=forbidden, repeat=1)
+    assert r['forbidden'] == [], startup.format_result(r)
+
+
+def test_parse_importtime():
+    text = ('import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   _io\n'
+            'import time:      1500 |       4000 | sg_solarsim\n'
+            'something else\n')
+    assert startup.parse_importtime(text) == {'_io': (120, 120), 'sg_solarsim': (1500, 4000)}
+
+
+def test_subcommand_imports_only_its_module():
+    # the yield help, then what the command line imported
+    probe = ('import sys\n'
+             'from sg_solarsim.__main__ import main\n'
+             'try:\n'
+             '    main(["yield", "--help"])\n'
+             'except SystemExit:\n'
+             '    pass\n'
+             'print("sg_solarsim.energy_yield" in sys.modules, "sg_solarsim.batch" in sys.modules)\n')
+    proc = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True)
+    assert proc.stdout.splitlines()[-1] == 'True False'
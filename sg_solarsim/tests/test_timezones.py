@@ -0,0 +1,68 @@
+""" test_timezones.py
+    Localized times and the shared timezone finder.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import timezonefinder
+
+from sg_solarsim import timezones as tzmod
+from sg_solarsim.timezones import timezone_at, timezone_at_many, timezones
+from sg_solarsim.tests import synthetic
+
+
+def test_localize_list_has_real_offset():
+    tz = timezones(synthetic.LAT, synthetic.LNG)
+    assert tz.get_tz() == synthetic.TZ.zone
+    dt = tz.localize([datetime(2000, 1, 15, 12), datetime(2000, 7, 15, 12)])
+    # not the local mean time offset of -04:56 that tzinfo=pytz.timezone(...) gives
+    assert [d.utcoffset() for d in dt] == [timedelta(hours=-5), timedelta(hours=-4)]
+    assert [d.isoformat() for d in dt] == ['2000-01-15T12:00:00-05:00', '2000-07-15T12:00:00-04:00']
+
+
+def test_localize_index_matches_list():
+    tz = timezones(synthetic.LAT, synthetic.LNG)
+    times = [datetime(2000, 1, 1) + timedelta(hours=7 * k) for k in range(1000)]
+    index = tz.localize(pd.DatetimeIndex(times), ambiguous='NaT', nonexistent='NaT')
+    listed = tz.localize(list(times))
+    for stamp, d in zip(index, listed):
+        if stamp is not pd.NaT:
+            assert stamp.utcoffset() == d.utcoffset()
+
+
+def test_timezone_at_many_matches_points():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-60, 70, 40)
+    lng = rng.uniform(-180, 180, 40)
+    # repeated coordinates are looked up once but still returned for every point
+    lat = np.concatenate([lat, lat[:10], [synthetic.LAT]])
+    lng = np.concatenate([lng, lng[:10], [synthetic.LNG]])
+    names = timezone_at_many(lat, lng)
+    assert names.shape == lat.shape
+    assert names.tolist() == [timezones(a, b).tz for a, b in zip(lat, lng)]
+    assert names[-1] == synthetic.TZ.zone
+    assert timezone_at_many(lat.reshape(3, 17), lng.reshape(3, 17)).shape == (3, 17)
+
+
+def test_finder_is_built_once(monkeypatch):
+    built = []
+
+    class Counted(timezonefinder.TimezoneFinderL):
+        def __init__(self, *args, **kwargs):
+            built.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(timezonefinder, 'TimezoneFinderL', Counted)
+    monkeypatch.setattr(tzmod, '_finder', None)
+    timezone_at.cache_clear()
+    try:
+        timezones(synthetic.LAT, synthetic.LNG)
+        timezones(48.8567, 2.3522)
+        timezone_at_many([10.0, 20.0, 30.0], [10.0, 20.0, 30.0])
+        assert tzmod.get_finder() is built[0]
+        assert len(built) == 1
+    finally:
+        # later tests get lookups from the real finder, not ones memoized from the counted one
+        timezone_at.cache_clear()
@@ -0,0 +1,43 @@
+""" test_tmy_cache.py
+    Round trip of the on-disk TMY store and its least recently used eviction.
+"""
+
+import os
+
+import numpy as np
+
+from sg_solarsim.tests import synthetic
+from sg_solarsim.tmy_cache import TmyCache
+
+
+def test_store_then_get_round_trip(tmp_path):
+    cache = TmyCache(str(tmp_path), offline=True)
+    data = synthetic.synthetic_tmy(seed=1)
+    path = cache.store(synthetic.LAT, synthetic.LNG, data)
+    assert os.path.exists(path)
+    assert not [name for name in os.listdir(str(tmp_path)) if name != os.path.basename(path)]
+
+    loaded = cache.get(synthetic.LAT + 0.01, synthetic.LNG - 0.01)     # same grid cell
+    assert loaded.index.equals(data.index)
+    assert list(loaded.columns) == list(data.columns)
+    for c in data.columns:
+        np.testing.assert_array_equal(loaded[c].to_numpy(), data[c].to_numpy(dtype='float32'))
+
+
+def test_lru_eviction(tmp_path):
+    data = synthetic.synthetic_tmy(seed=2)
+    cache = TmyCache(str(tmp_path), offline=True, max_bytes=10 ** 12)
+    a = cache.store(10.0, 10.0, data)
+    b = cache.store(20.0, 20.0, data)
+    size = os.path.getsize(a)
+    # a is older than b until it is read again
+    os.utime(a, (1000, 1000))
+    os.utime(b, (2000, 2000))
+    assert cache.load(10.0, 10.0) is not None
+
+    cache.max_bytes = int(2.5 * size)
+    c = cache.store(30.0, 30.0, data)
+    remaining = [e[0] for e in cache.entries()]
+    assert b not in remaining
+    assert a in remaining and c in remaining
+    assert cache.size() <= cache.max_bytes
@@ -0,0 +1,121 @@
+""" test_worker.py
+    The simulation worker thread: commands take effect between ticks, snapshots are bounded, stop() joins the thread
+    and an exception in the thread is kept for the gui.
+"""
+
+import time
+from datetime import datetime
+
+import pytest
+
+from sg_solarsim.array_model import ArrayModel
+from sg_solarsim.engine import SimulationEngine
+from sg_solarsim.ivtable import IVTable
+from sg_solarsim.tests import synthetic
+from sg_solarsim.worker import SimulationWorker
+
+PERIOD = 0.005      # seconds between ticks
+STEP = 0.5          # tracker step per module
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    return IVTable.for_module(synthetic.MODULE_PARAMS, name='synthetic',
+                              cache_dir=str(tmp_path_factory.mktemp('ivtable')))
+
+
+@pytest.fixture(scope='module')
+def cache(tmp_path_factory):
+    return synthetic.synthetic_cache(str(tmp_path_factory.mktemp('tmy')))
+
+
+@pytest.fixture
+def worker(table, cache):
+    # a minute of simulated time per tick
+    engine = SimulationEngine(lat=synthetic.LAT, lng=synthetic.LNG, speed=60 / PERIOD,
+                              starttime=datetime(2000, 6, 1, 12), endtime=datetime(2000, 6, 15, 12), timestep=60.0,
+                              tz=synthetic.TZ, cache=cache)
+    worker = SimulationWorker(engine, ArrayModel(table), step=STEP, period=PERIOD, capacity=8)
+    yield worker
+    worker.stop()
+
+
+def _wait(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            raise AssertionError('timed out')
+        time.sleep(PERIOD)
+
+
+def _steps(worker):
+    snapshot = worker.latest()
+    return snapshot.steps if snapshot is not None else 0
+
+
+def test_pause_stops_steps(worker):
+    worker.start()
+    _wait(lambda: _steps(worker) > 5)
+    worker.pause()
+    _wait(lambda: worker.latest().paused)
+    paused_at = _steps(worker)
+    time.sleep(20 * PERIOD)
+    assert _steps(worker) == paused_at == worker.engine.steps
+    worker.resume()
+    _wait(lambda: _steps(worker) > paused_at + 5)
+
+
+def test_seek_fraction(worker):
+    engine = worker.engine
+    worker.start()
+    worker.pause()
+    worker.seek(0.5)
+    middle = engine.starttime.timestamp() + 0.5 * (engine.endtime.timestamp() - engine.starttime.timestamp())
+    _wait(lambda: abs(worker.latest().time - middle) <= engine.timestep)
+    assert worker.latest().paused
+
+
+def test_set_model(worker, table):
+    assert worker.tracker.step == STEP
+    worker.start()
+    model = ArrayModel(table, series=10, parallel=2)
+    worker.set_model(model)
+    _wait(lambda: worker.model is model)
+    assert worker.tracker.step == STEP * 10
+    # the tracker now works on the array voltage
+    _wait(lambda: worker.latest().v_ref > 40)
+
+
+def test_stop_joins(worker):
+    worker.start()
+    _wait(lambda: _steps(worker) > 0)
+    worker.stop()
+    assert not worker.alive
+    assert worker.error is None
+    steps = worker.engine.steps
+    time.sleep(10 * PERIOD)
+    assert worker.engine.steps == steps
+
+
+def test_drain_drops_oldest(worker):
+    worker.start()
+    _wait(lambda: _steps(worker) > 40)
+    worker.stop()
+    snapshots = worker.drain()
+    # capacity 8: only the newest are kept, in order
+    assert len(snapshots) == 8
+    assert snapshots[-1] == worker.latest()
+    assert snapshots[0].steps > 1
+    assert [s.steps for s in snapshots] == sorted(s.steps for s in snapshots)
+    assert worker.drain() == []
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_error_kept(worker, monkeypatch):
+    def broken(now):
+        raise ValueError('weather gone')
+
+    monkeypatch.setattr(worker.engine, 'update', broken)
+    worker.start()
+    _wait(lambda: not worker.alive)
+    assert isinstance(worker.error, ValueError)
@@ -1,25 +1,63 @@
 """ timezones.py
     Constructor finds the timezone from latitude and longitude.
-    a method replace_dt_tz() iterates through a list of datettime objects and replaces the timezone
+    a method localize() attaches the timezone to datetimes or a DatetimeIndex
+
+    One TimezoneFinderL is shared by the whole process, it takes about half a second to load, and lookups are memoized
+    so multi-site runs resolve each coordinate once.  timezone_at_many() resolves arrays of coordinates.
 """
 
 from datetime import datetime, timedelta
+from functools import lru_cache
+
 from pytz import timezone, utc
 from pytz.exceptions import UnknownTimeZoneError
 
-from timezonefinder import TimezoneFinderL
+_finder = None
+
+
+def get_finder():
+    """ the process wide TimezoneFinderL, loaded on first use """
+    global _finder
+    if _finder is None:
+        # the finder loads its data on import, only pay for it when a timezone is looked up
+        from timezonefinder import TimezoneFinderL
+        _finder = TimezoneFinderL()
+    return _finder
+
+
+@lru_cache(maxsize=4096)
+def timezone_at(lat, lng):
+    """
+    :return: name of the timezone at a coordinate, e.g. 'America/New_York'
+    """
+    return get_finder().timezone_at(lng=float(lng), lat=float(lat))
+
+
+def timezone_at_many(lat, lng):
+    """
+    Timezone names for arrays of coordinates.  Repeated coordinates are looked up once.
+    :param lat: array of latitudes
+    :param lng: array of longitudes, broadcast against lat
+    :return: numpy object array of timezone names in the shape of the broadcast inputs
+    """
+    import numpy as np
+
+    lat, lng = np.broadcast_arrays(np.asarray(lat, dtype=float), np.asarray(lng, dtype=float))
+    points = np.stack([lat.ravel(), lng.ravel()], axis=1)
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+    names = np.array([timezone_at(a, b) for a, b in unique.tolist()], dtype=object)
+    return names[inverse.ravel()].reshape(lat.shape)
+
 
 class timezones:
     """
    Constructor finds the timezone from latitude and longitude.
-    a method replace_dt_tz() iterates through a list of datettime objects and replaces the timezone
+    a method localize() attaches the timezone to datetimes or a DatetimeIndex
     """
 
 
     def __init__(self, lat, lng):
-        tf = TimezoneFinderL()
-        self.tz = tf.timezone_at(lng=lng, lat=lat)
-        del tf
+        self.tz = timezone_at(lat, lng)
 
     def get_tz(self):
         return self.tz
@@ -27,20 +65,31 @@ class timezones:
     def get_timeinfo(self):
         return timezone
 
-    def localize(self,dt):
+    def localize(self, dt, ambiguous='raise', nonexistent='raise'):
         """
-        replaces the tzinfo with the tz from the creation of this object
-        :param dt: list of datetime objects
-        :return:  list of localized datetime objects
+        Treats the wall clock time of each datetime as local time in the tz from the creation of this object.
+
+        The utc offset is looked up for every time, replace(tzinfo=...) with a pytz timezone would give the local mean
+        time offset of the zone instead (-04:56 for New York).
+        :param dt: list of datetime objects, changed in place, or a DatetimeIndex
+        :param ambiguous: DatetimeIndex only, how to treat times repeated when the clocks go back, see
+                          pandas.DatetimeIndex.tz_localize
+        :param nonexistent: DatetimeIndex only, how to treat times skipped when the clocks go forward
+        :return: list of localized datetime objects or a localized DatetimeIndex
         """
         try:
             local = timezone(self.tz)
-            for i in range(len(dt)):
-                dt[i] = dt[i].replace(tzinfo=local)
-
         except UnknownTimeZoneError:
             raise
 
+        if hasattr(dt, 'tz_localize'):
+            # one vectorized call for a whole index
+            if dt.tz is not None:
+                dt = dt.tz_localize(None)
+            return dt.tz_localize(local, ambiguous=ambiguous, nonexistent=nonexistent)
+
+        for i in range(len(dt)):
+            dt[i] = local.localize(dt[i].replace(tzinfo=None))
         return dt
 
 
@@ -49,4 +98,4 @@ if __name__ == '__main__':
     dt = [datetime.now(), datetime.now() + timedelta(days=1)]
     print(dt)
     dt = tz.localize(dt)
-    print(dt)
\ No newline at end of file
+    print(dt)
@@ -0,0 +1,94 @@
+"""tmy.py
+    TMY weather data for the days of a simulation run, kept apart from the Tk clock face so that headless runs do not
+    import a GUI toolkit.
+"""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pytz import utc, timezone
+
+from sg_solarsim.timezones import timezones
+from sg_solarsim.tmy_cache import TmyCache, coerce_year, read_weather_file
+
+
+class tmy():
+    """
+    Gets Typical meterological year from PVGIS and stores the dat for the days of interest.
+
+    The constructor takes the lat and long and the range of dates as a list of datetime objects: [startdate, enddate].  The first thing the constructor will do is fetch the
+    TMY data, from the local TMY cache if it holds the location or else from the PVGIS online database.  The time series
+    is coerced to the year 2000.
+    The data is all in UTC time and is timezone aware, the daterange may or may not be timezone aware so if not, the lat
+    and lng will be used to determine the timezone
+    """
+    def __init__(self, lat=39.13, lng=-77.21, tz=None, daterange=None, cache=None, filename=None):
+        """
+        :param tz: pytz timezone of the site, found from lat and lng if None
+        :param daterange: [startdate, enddate], today and tomorrow if None
+        :param cache: TmyCache to read the TMY data from, the default store is used if None
+        :param filename: local PVGIS, EPW or TMY3 weather file to use instead of the cache
+        """
+
+        # get the TMY data for the lat and long
+        if filename is not None:
+            tmydata = read_weather_file(filename)[0]
+        else:
+            if cache is None:
+                cache = TmyCache()
+            tmydata = cache.get(lat, lng)
+
+        # coerce the daterange into the desired timezone
+        if tz is None:
+            tz = timezone(timezones(lat, lng).tz)
+        self.tz = tz
+        if daterange is None:
+            today = datetime.now().replace(year=2000)
+            daterange = [today, today + timedelta(days=1)]
+        daterange = list(daterange)
+        #self.daterange = self.coerce_daterange_year(daterange)
+        if daterange[0].tzinfo is None or daterange[0].utcoffset() is None:
+            daterange[0] = self.tz.localize(daterange[0])
+            daterange[1] = self.tz.localize(daterange[1])
+
+        # we need to convert the localized daterange to UTC time to get the correct tmy slice
+        daterange_utc = self.local_to_utc(daterange)
+
+        # get the slice of TMY data for the date range
+        self.tmy_slice = tmydata[daterange_utc[0] - timedelta(hours=3):daterange_utc[1] + timedelta(hours=3)]
+
+        # these times are in UTC so we need to localize them
+        self.tmy_slice.index = self.tmy_slice.index.tz_convert(self.tz)
+        self.tmy_slice.index = self.round_to_nearest_hour(self.tmy_slice.index)
+
+    @staticmethod
+    def coerce_tmy_year(tmydata):
+        """ The TMY timeseries takes months of data from different years, this wil coerce them all to 2000 so we can
+            later pick a range of dates
+        """
+        tmydata[0].index = coerce_year(tmydata[0].index)
+        return tmydata
+
+
+    @staticmethod
+    def coerce_daterange_year(dt):
+        for i in range(len(dt)):
+            dt[i] = dt[i].replace(year=2000)
+        return dt
+
+    @staticmethod
+    def local_to_utc(dt):
+        daterange_utc = []
+        for i in range(len(dt)):
+            daterange_utc.append(dt[i].astimezone(utc))
+        return daterange_utc
+
+    @staticmethod
+    def round_to_nearest_hour(ymdh):
+        dt_half_hour = ymdh[0].replace(minute=30, second=0, microsecond=0)
+        round_up = ymdh[0] >= dt_half_hour
+        # drop the minutes and seconds from every timestamp at once rather than replacing them row by row
+        ymdh = ymdh - pd.to_timedelta(ymdh.minute * 60 + ymdh.second, unit='s') - pd.to_timedelta(ymdh.microsecond, unit='us')
+        if round_up:
+            ymdh = ymdh + timedelta(hours=1)
+        return ymdh
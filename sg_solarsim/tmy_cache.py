@@ -0,0 +1,311 @@
+""" tmy_cache.py
+    Persistent on-disk store of Typical Meteorological Year data.
+
+    Entries are keyed by (lat, lng) snapped to a configurable grid and kept as uncompressed numpy .npz files, one
+    float32 array per weather variable plus an int64 array of UTC timestamps.  Loading an entry is a single file read,
+    so a cache hit does not need the network.  The total size of the store is bounded and the least recently used
+    entries are evicted first.
+
+    Local PVGIS, EPW and TMY3 weather files can be imported into the store so that air-gapped machines never need to
+    reach PVGIS:
+
+        python -m sg_solarsim.tmy_cache import tmy_39.130_-77.210_2005_2020.csv
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pvlib import iotools
+
+# weather variables kept in the store, anything else in the source data is dropped
+TMY_COLUMNS = ('ghi', 'dni', 'dhi', 'temp_air', 'wind_speed', 'relative_humidity', 'pressure')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sg_solarsim', 'tmy')
+DEFAULT_GRID = 0.1                      # degrees
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024    # about 200 sites
+TMP_PREFIX = '.tmp_'                    # entries being written
+
+# TMY3 column names (pvlib recolumn=True) mapped to the pvlib variable names used by PVGIS
+_TMY3_VARIABLES = {
+    'GHI': 'ghi',
+    'DNI': 'dni',
+    'DHI': 'dhi',
+    'DryBulb': 'temp_air',
+    'Wspd': 'wind_speed',
+    'RHum': 'relative_humidity',
+    'Pressure': 'pressure',
+}
+
+
+def coerce_year(index, year=2000):
+    """
+    Replaces the year of every timestamp in a DatetimeIndex without a per-row python loop.
+
+    The TMY timeseries takes months of data from different years, coercing them all to a single year lets a range of
+    dates be picked later.  2000 is a leap year so February 29th always survives.
+    :param index: DatetimeIndex, may be timezone aware
+    :param year: the year to coerce to
+    :return: DatetimeIndex in the same timezone
+    """
+    fields = pd.DataFrame({
+        'year': year,
+        'month': index.month,
+        'day': index.day,
+        'hour': index.hour,
+        'minute': index.minute,
+        'second': index.second,
+    })
+    coerced = pd.DatetimeIndex(pd.to_datetime(fields), name=index.name)
+    if index.tz is not None:
+        coerced = coerced.tz_localize(index.tz)
+    return coerced
+
+
+def normalize(data):
+    """
+    Converts weather data from any of the supported readers to the layout held in the store:
+    a UTC index coerced to the year 2000, sorted, with only the TMY_COLUMNS as floats.
+    :param data: DataFrame with a timezone aware DatetimeIndex
+    :return: DataFrame
+    """
+    data = data.rename(columns=_TMY3_VARIABLES)
+    if 'atmospheric_pressure' in data.columns and 'pressure' not in data.columns:
+        data = data.rename(columns={'atmospheric_pressure': 'pressure'})
+    columns = [c for c in TMY_COLUMNS if c in data.columns]
+    if 'ghi' not in columns or 'temp_air' not in columns:
+        raise ValueError('weather data must have ghi and temp_air columns, found {}'.format(list(data.columns)))
+    data = data[columns].astype('float32')
+
+    index = data.index
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    data.index = coerce_year(index.tz_convert('UTC'))
+
+    # sources labelled in local time wrap the last hours of december into january once converted to UTC
+    data = data[~data.index.duplicated(keep='first')].sort_index()
+    return data
+
+
+def read_weather_file(filename, fmt=None):
+    """
+    Reads a local weather file.
+    :param filename: path to a PVGIS (csv, json, epw or basic), EPW or TMY3 file
+    :param fmt: one of 'pvgis', 'epw' or 'tmy3', inferred from the file when None
+    :return: (DataFrame, lat, lng), lat and lng are None if the file has no location
+    """
+    if fmt is None:
+        fmt = _infer_format(filename)
+
+    if fmt == 'pvgis':
+        data, _, inputs, _ = iotools.read_pvgis_tmy(filename, map_variables=True)
+        location = (inputs or {}).get('location', inputs or {})
+        lat, lng = location.get('latitude'), location.get('longitude')
+    elif fmt == 'epw':
+        data, meta = iotools.read_epw(filename)
+        lat, lng = meta.get('latitude'), meta.get('longitude')
+    elif fmt == 'tmy3':
+        data, meta = iotools.read_tmy3(filename)
+        data['Pressure'] = data['Pressure'] * 100     # mbar to Pa, the unit PVGIS uses
+        lat, lng = meta.get('latitude'), meta.get('longitude')
+    else:
+        raise ValueError('unknown weather file format: {}'.format(fmt))
+
+    return normalize(data), lat, lng
+
+
+def _infer_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.epw':
+        # PVGIS can also write epw, the standard reader handles both
+        return 'epw'
+    if ext == '.csv':
+        with open(filename, 'r', errors='replace') as f:
+            first = f.readline()
+        return 'pvgis' if first.startswith('Latitude') else 'tmy3'
+    return 'pvgis'
+
+
+class TmyCache:
+    """
+    On-disk store of TMY data keyed by (lat, lng) snapped to a grid, with size bounded LRU eviction.
+
+    The cache directory defaults to ~/.sg_solarsim/tmy and can be moved with the SG_SOLARSIM_TMY_CACHE environment
+    variable.  Setting SG_SOLARSIM_OFFLINE=1 (or offline=True) turns cache misses into errors instead of PVGIS requests.
+    """
+
+    def __init__(self, cache_dir=None, grid=DEFAULT_GRID, max_bytes=DEFAULT_MAX_BYTES, offline=None):
+        """
+        :param cache_dir: directory holding the .npz entries
+        :param grid: grid spacing in degrees that lat and lng are snapped to, 0 keys on the exact location
+        :param max_bytes: the least recently used entries are evicted once the store grows past this size
+        :param offline: never fetch from PVGIS
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('SG_SOLARSIM_TMY_CACHE', DEFAULT_CACHE_DIR)
+        if offline is None:
+            offline = os.environ.get('SG_SOLARSIM_OFFLINE', '') not in ('', '0')
+        self.cache_dir = cache_dir
+        self.grid = grid
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    def key(self, lat, lng):
+        """ snaps a location to the grid """
+        if not self.grid:
+            return round(lat, 4), round(lng, 4)
+        return (round(round(lat / self.grid) * self.grid, 4),
+                round(round(lng / self.grid) * self.grid, 4))
+
+    def path(self, lat, lng):
+        lat, lng = self.key(lat, lng)
+        return os.path.join(self.cache_dir, 'tmy_{:+09.4f}_{:+010.4f}.npz'.format(lat, lng))
+
+    def get(self, lat, lng):
+        """
+        Returns the TMY data for a location, fetching it from PVGIS and storing it on a miss.
+        :return: DataFrame indexed in UTC with the year coerced to 2000
+        """
+        data = self.load(lat, lng)
+        if data is not None:
+            return data
+        if self.offline:
+            raise LookupError('no cached TMY data near ({}, {}) in {} and offline mode is set'
+                              .format(lat, lng, self.cache_dir))
+
+        # fetch at the grid point so every location in the cell shares the same data
+        glat, glng = self.key(lat, lng)
+        tmydata = iotools.get_pvgis_tmy(glat, glng, map_variables=True)
+        data = normalize(tmydata[0])
+        self.store(glat, glng, data, source='pvgis')
+        return data
+
+    def load(self, lat, lng):
+        """
+        Reads an entry from the store.
+        :return: DataFrame or None on a miss
+        """
+        path = self.path(lat, lng)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                columns = [str(c) for c in npz['columns']]
+                index = pd.DatetimeIndex(npz['time'].view('datetime64[ns]'), tz='UTC')
+                data = pd.DataFrame({c: npz[c] for c in columns}, index=index)
+        except FileNotFoundError:
+            return None
+
+        # a hit refreshes the entry for the LRU eviction
+        os.utime(path)
+        return data
+
+    def store(self, lat, lng, data, source=''):
+        """
+        Writes an entry to the store then evicts least recently used entries above max_bytes.
+        :param data: DataFrame as returned by normalize()
+        :param source: free text kept alongside the data, e.g. the name of an imported file
+        :return: path of the entry
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(lat, lng)
+        arrays = {c: np.ascontiguousarray(data[c].to_numpy(dtype='float32')) for c in data.columns}
+        arrays['time'] = data.index.tz_convert('UTC').tz_localize(None).to_numpy().view('int64')
+        arrays['columns'] = np.array(list(data.columns))
+        arrays['location'] = np.array([lat, lng])
+        arrays['source'] = np.array(source)
+
+        # write to a temporary file first so a crash never leaves a truncated entry behind, named uniquely so
+        # processes storing the same entry at once do not rename each other's file away
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=TMP_PREFIX, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self.evict(keep=path)
+        return path
+
+    def import_file(self, filename, fmt=None, lat=None, lng=None):
+        """
+        Imports a local PVGIS, EPW or TMY3 file into the store.
+        :param lat: overrides the latitude from the file metadata
+        :param lng: overrides the longitude from the file metadata
+        :return: path of the entry
+        """
+        data, file_lat, file_lng = read_weather_file(filename, fmt)
+        lat = file_lat if lat is None else lat
+        lng = file_lng if lng is None else lng
+        if lat is None or lng is None:
+            raise ValueError('{} has no location, pass lat and lng'.format(filename))
+        return self.store(lat, lng, data, source=os.path.basename(filename))
+
+    def entries(self):
+        """
+        :return: list of (path, size in bytes, last access time) oldest first
+        """
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            # temporary files of writes in progress start with TMP_PREFIX and are left alone
+            if name.startswith('tmy_') and name.endswith('.npz'):
+                path = os.path.join(self.cache_dir, name)
+                st = os.stat(path)
+                entries.append((path, st.st_size, st.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self, keep=None):
+        """ removes least recently used entries until the store fits in max_bytes """
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage the local TMY cache')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help='import local PVGIS, EPW or TMY3 files')
+    p_import.add_argument('files', nargs='+')
+    p_import.add_argument('--format', choices=['pvgis', 'epw', 'tmy3'], default=None)
+    p_import.add_argument('--lat', type=float, default=None)
+    p_import.add_argument('--lng', type=float, default=None)
+    p_fetch = sub.add_parser('fetch', help='fetch a location from PVGIS ahead of time')
+    p_fetch.add_argument('lat', type=float)
+    p_fetch.add_argument('lng', type=float)
+    sub.add_parser('list', help='list the cached entries')
+    sub.add_parser('clear', help='remove every cached entry')
+    args = parser.parse_args()
+
+    cache = TmyCache()
+    if args.command == 'import':
+        for f in args.files:
+            print(cache.import_file(f, fmt=args.format, lat=args.lat, lng=args.lng))
+    elif args.command == 'fetch':
+        cache.get(args.lat, args.lng)
+        print(cache.path(args.lat, args.lng))
+    elif args.command == 'list':
+        for path, size, _ in reversed(cache.entries()):
+            print('{:>10d}  {}'.format(size, path))
+    elif args.command == 'clear':
+        cache.clear()
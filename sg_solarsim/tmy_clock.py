@@ -9,21 +9,22 @@ except:
 	import tkinter as Tkinter
 
 import math	# Required For Coordinates Calculation
-from datetime import datetime, timedelta
-from pytz import utc, timezone
-from sg_solarsim.timezones import timezones
+from datetime import datetime
+from sg_solarsim.engine import SimulationEngine
+from sg_solarsim.tmy import tmy  # noqa: F401  tmy used to live here
 
-from pvlib import iotools
 
 class tmy_clock(Tkinter.Tk):
-    """"""
-    def __init__(self, lat=39.13, lng=-77.21, speed=1, starttime=datetime.now(), endtime=datetime.now() + timedelta(weeks=2), nosecond=False):
+    """ Tk clock face drawing the state of a SimulationEngine """
+    def __init__(self, lat=39.13, lng=-77.21, speed=1, starttime=None, endtime=None, nosecond=False, timestep=1.0, engine=None):
         """
 
         :param speed:  Time multiplier
-        :param starttime:  Datetime to start the clock
-        :param endtime:   Datetime to pause the clock at the end of the run
+        :param starttime:  Datetime to start the clock, defaults to now
+        :param endtime:   Datetime to pause the clock at the end of the run, defaults to two weeks after starttime
         :param nosecond:  Bool to remove the second hand
+        :param timestep:  simulated seconds per engine step
+        :param engine:  SimulationEngine to draw, one is created from the other arguments if None
         """
         Tkinter.Tk.__init__(self)
         self.x = 154    # Center point x
@@ -31,25 +32,66 @@ class tmy_clock(Tkinter.Tk):
         self.length = [100,125,125]  # stick length
         self.width = [4,2,1]
         self.color = 254
-        self.speed = speed
         self.nosecond = nosecond
-        self.then = []
-        self.displaytime = []
-        self.tz = timezone(timezones(lat, lng).tz)
-        self.starttime = self.tz.localize(starttime.replace(year=2000))
-        self.endtime = self.tz.localize(endtime.replace(year=2000))
-        self.elapsed = timedelta()
+
+        # the engine gets the tmy data and keeps the simulated time
+        if engine is None:
+            engine = SimulationEngine(lat=lat, lng=lng, speed=speed, starttime=starttime, endtime=endtime, timestep=timestep)
+        self.engine = engine
+        self.tz = engine.tz
+        self.starttime = engine.starttime
+        self.endtime = engine.endtime
+        self.tmy_slice = engine.tmy_slice
+        self._day = None        # simulated day of the date label
+        self._datetxt = ''
+        self._labeltxt = None   # text shown on the date label
+        self._face = None       # grey level of the clock face
         self.creating_all_function_trigger()
         self.title('TMY Clock')
-        self.pause = False
-
-        # get the tmy data
-        self.tmy_slice = tmy(lat=lat, lng=lng, tz=self.tz, daterange=[self.starttime, self.endtime]).tmy_slice
-        self.g_eff = 500     # effective irradiance
-        self.t_air = 20  # air temperature
 
         #self.iconphoto(False, Tkinter.PhotoImage(file='GS-PV-array-icon.png'))
 
+    # the simulation state lives in the engine
+    @property
+    def speed(self):
+        return self.engine.speed
+
+    @speed.setter
+    def speed(self, speed):
+        self.engine.speed = speed
+
+    @property
+    def pause(self):
+        return self.engine.pause
+
+    @pause.setter
+    def pause(self, pause):
+        self.engine.pause = pause
+
+    @property
+    def displaytime(self):
+        return self.engine.displaytime
+
+    @property
+    def elapsed(self):
+        return self.engine.elapsed
+
+    @property
+    def g_eff(self):
+        return self.engine.g_eff
+
+    @property
+    def t_air(self):
+        return self.engine.t_air
+
+    @property
+    def t_cell(self):
+        return self.engine.t_cell
+
+    def seek(self, when):
+        """ jumps the engine to when, see SimulationEngine.seek(), the clock is redrawn on the next update_class() """
+        self._day = None
+        return self.engine.seek(when)
 
     # Creating Trigger for other functions
     def creating_all_function_trigger(self):
@@ -89,23 +131,33 @@ class tmy_clock(Tkinter.Tk):
         self.canvas.create_window(156, 349, window=self.datelabel, anchor='center')
         return
 
-    def update_class(self):
-        now = datetime.now()
-        if self.pause:
-            self.then = now
-        if self.displaytime == []:
-            self.displaytime = self.starttime
-        else:
-            elapsed = now - self.then
-            self.elapsed += elapsed * self.speed
-            self.displaytime = self.starttime + self.elapsed
-
-        self.then = now
-        #t = time.strptime(str(self.displaytime.tm_hour), "%H")
-        #hour = int(time.strftime('%I', t))*5
-        hour = int(self.displaytime.strftime('%I')) * 5
-        min = int(self.displaytime.strftime('%M'))
-        sec = int(self.displaytime.strftime('%S'))
+    def update_class(self, now=None):
+        """
+        Advances the engine and redraws the clock
+        :param now: time passed to SimulationEngine.update(), e.g. the virtual time of a scheduler tick, the wall
+                    clock if None
+        """
+        self.engine.update(now)
+
+        # local hour, minute and second straight from the engine's epoch seconds
+        hour, min, sec = self.engine.local_time()
+        self.draw(hour, min, sec, self.g_eff, self.engine.local_day(), self.engine.time, self.pause)
+
+    def show(self, snapshot):
+        """
+        Redraws the clock from a worker.Snapshot without touching the engine, which the worker thread is running
+        """
+        self.draw(snapshot.hour, snapshot.minute, snapshot.second, snapshot.g_eff, snapshot.day, snapshot.time,
+                  snapshot.paused)
+
+    def draw(self, hour, min, sec, g_eff, day, time, pause):
+        """
+        Redraws the hands, the face and the date label
+        :param hour, min, sec: local time
+        :param day: local day number, the date text is only made when it changes
+        :param time: epoch seconds
+        """
+        hour = (hour % 12 or 12) * 5
         now=(hour,min,sec)
 
         # changing the sticks coordinates continuously
@@ -131,44 +183,28 @@ class tmy_clock(Tkinter.Tk):
             cr.append(self.length[2] * math.sin(math.radians((now[2] * 6)) - math.radians(90)) + self.x)
             self.canvas.coords(self.sticks[2], tuple(cr))
 
-        # update the effective irradiance
-        time = (self.displaytime.replace(minute=0, second=0, microsecond=0))
-        tmy_rows = self.tmy_slice.loc[time : time + timedelta(hours=1)]
-        seek = (self.displaytime.timestamp() % 3600) / 3600
-        X, Y = self.interpolate(
-            tmy_rows.index[0].timestamp(),
-            tmy_rows.iloc[0]['ghi'],
-            tmy_rows.index[1].timestamp(),
-            tmy_rows.iloc[1]['ghi'],
-            seek
-        )
-        self.g_eff = Y
         # Determine the face color based on a linear interpolation of the ghi data
-        self.change_color(int(round((self.g_eff/1000)*256)))
-
-        # update the effective temperature
-        X, Y = self.interpolate(
-            tmy_rows.index[0].timestamp(),
-            tmy_rows.iloc[0]['temp_air'],
-            tmy_rows.index[1].timestamp(),
-            tmy_rows.iloc[1]['temp_air'],
-            seek
-        )
-        self.t_air= Y
-        # update the date
-        txt = self.displaytime.strftime('%B %d')
-        if self.pause:
+        self.change_color(int(round((g_eff/1000)*256)))
+
+        # update the date, the text only changes once a simulated day
+        if day != self._day:
+            self._day = day
+            self._datetxt = datetime.fromtimestamp(time, self.tz).strftime('%B %d')
+        txt = self._datetxt
+        if pause:
             txt += ' (paused)'
-        self.datelabel.config(text=txt)
-        self.datelabel.update()
-
-        # pause after endtime
-        if self.displaytime > self.endtime:
-            self.pause = True
+        if txt != self._labeltxt:
+            self._labeltxt = txt
+            self.datelabel.config(text=txt)
+            self.datelabel.update()
 
         return
 
     def change_color(self,color):
+        color = min(max(color, 0), 255)
+        if color == self._face:
+            return
+        self._face = color
         bg = '#'+bytes([color,color,color]).hex()
         self.canvas.itemconfig(self.clkface, fill=bg)
         return
@@ -179,73 +215,6 @@ class tmy_clock(Tkinter.Tk):
         Y = y2 + (y2-y1)*(X - x2)/(x2 - x1)
         return(X,Y)
 
-class tmy():
-    """
-    Gets Typical meterological year from PVGIS and stores the dat for the days of interest.
-
-    The constructor takes the lat and long and the range of dates as a list of datetime objects: [startdate, enddate].  The first thing the constructor will do is fetch the
-    TMY data from the PVGIS online database.  Next it will coerce the time series to the year 2000.
-    The data is all in UTC time and is timezone aware, the daterange may or may not be timezone aware so if not, the lat
-    and lng will be used to determine the timezone
-    """
-    def __init__(self, lat=39.13, lng=-77.21, tz = timezone(timezones(39.13, -77.21).tz), daterange=[datetime.now().replace(year=2000), datetime.now().replace(year=2000) + timedelta(days=1)]):
-
-        # get the TMY data for the lat and long
-        tmydata = iotools.get_pvgis_tmy(lat, lng, map_variables=True)
-        tmydata = self.coerce_tmy_year(tmydata)
-
-        # coerce the daterange into the desired timezone
-        self.tz = tz
-        #self.daterange = self.coerce_daterange_year(daterange)
-        if daterange[0].tzinfo is None or daterange[0].utcoffset() is None:
-            daterange[0] = self.tz.localize(daterange[0])
-            daterange[1] = self.tz.localize(daterange[1])
-
-        # we need to convert the localized daterange to UTC time to get the correct tmy slice
-        daterange_utc = self.local_to_utc(daterange)
-
-        # get the slice of TMY data for the date range
-        self.tmy_slice = tmydata[0][daterange_utc[0] - timedelta(hours=3):daterange_utc[1] + timedelta(hours=3)]
-
-        # these times are in UTC so we need to localize them
-        self.tmy_slice.index = self.tmy_slice.index.tz_convert(self.tz)
-        self.tmy_slice.index = self.round_to_nearest_hour(self.tmy_slice.index)
-
-    @staticmethod
-    def coerce_tmy_year(tmydata):
-        """ The TMY timeseries takes months of data from different years, this wil coerce them all to 2000 so we can
-            later pick a range of dates
-        """
-        data_ymd = tmydata[0].index
-        data_ymd = data_ymd.map(lambda datetime: datetime.replace(year=2000))
-        tmydata[0].index = data_ymd
-        return tmydata
-
-
-    @staticmethod
-    def coerce_daterange_year(dt):
-        for i in range(len(dt)):
-            dt[i] = dt[i].replace(year=2000)
-        return dt
-
-    @staticmethod
-    def local_to_utc(dt):
-        daterange_utc = []
-        for i in range(len(dt)):
-            daterange_utc.append(dt[i].astimezone(utc))
-        return daterange_utc
-
-    @staticmethod
-    def round_to_nearest_hour(ymdh):
-        dt_half_hour = ymdh[0].replace(minute=30, second=0, microsecond=0)
-        if ymdh[0] >= dt_half_hour:
-            ymdh = ymdh.map(lambda datetime: datetime.replace(minute=0, second=0, microsecond=0)  + timedelta(hours=1))
-        else:
-            ymdh = ymdh.map(lambda datetime: datetime.replace(minute=0, second=0, microsecond=0))
-        return ymdh
-
-
-
 if __name__=='__main__':
      root= tmy_clock(speed=4098)
 
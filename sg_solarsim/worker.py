@@ -0,0 +1,200 @@
+""" worker.py
+    The simulation and mppt loop on a thread of its own, decoupled from the GUI refresh.
+
+    SimulationWorker owns the SimulationEngine and the tracker while it runs.  It ticks on its own Scheduler: every
+    tick advances the engine, looks the array up at the new conditions and runs the tracker, then publishes a Snapshot.
+    Snapshots go into a bounded deque, so the worker never waits on the GUI: when the GUI falls behind the oldest ones
+    are dropped.  The GUI takes them at its own frame rate:
+        drain()     every snapshot since the last call, e.g. for the mppt trajectory
+        latest()    the newest one, to draw the clock and the i-v curve
+    Nothing else of the engine or tracker is touched from outside the thread.  Pause, resume, speed, seek, a new array
+    model and checkpoints are sent as commands on a queue and applied by the worker between ticks; it waits on that
+    queue until the next tick is due, so a command is picked up at once.
+
+        worker = SimulationWorker(engine, array, period=0.05).start()
+        ...
+        snapshot = worker.latest()
+        worker.set_speed(64)
+        worker.stop()
+"""
+
+import queue
+import threading
+from collections import deque, namedtuple
+
+from sg_solarsim.mppt import MPPT
+from sg_solarsim.profiling import profiler
+from sg_solarsim.scheduler import Scheduler
+
+DEFAULT_CAPACITY = 1024     # snapshots held for the GUI
+
+Snapshot = namedtuple('Snapshot', 'time hour minute second day g_eff t_air t_cell v_ref current steps paused finished')
+
+
+class SimulationWorker:
+    """
+    Runs a SimulationEngine and an mppt tracker on a background thread, publishing a Snapshot per tick
+    """
+
+    def __init__(self, engine, model, tracker=None, step=0.5, period=0.05, policy='catch_up',
+                 capacity=DEFAULT_CAPACITY, shading=None, stream=None):
+        """
+        :param engine: SimulationEngine, only used by the worker thread once started
+        :param model: ArrayModel the operating point is looked up in
+        :param tracker: mppt tracker, a new mppt.MPPT if None
+        :param step: tracker step per module, scaled by the modules in series of the model
+        :param period: seconds between ticks
+        :param policy: what to do with ticks missed, see scheduler.Scheduler
+        :param capacity: snapshots kept until the GUI takes them, older ones are dropped
+        :param shading: per module irradiance factors of the model's shape, uniform if None
+        :param stream: instrument.SetpointStream the setpoints are submitted to
+        """
+        self.engine = engine
+        self.tracker = tracker if tracker is not None else MPPT()
+        self.scheduler = Scheduler(period=period, policy=policy)
+        self.stream = stream
+        self._step = step
+        self._set_model(model, shading)
+        self._v_ref = self.tracker.v_ref
+        self._current = 0.0
+        self._snapshots = deque(maxlen=capacity)
+        self._latest = None
+        self._commands = queue.SimpleQueue()
+        self._running = False
+        self._thread = None
+        self.error = None       # exception that ended the thread, if any
+
+    # commands, safe to call from any thread
+    def pause(self):
+        self._commands.put(('_pause', (True,)))
+
+    def resume(self):
+        self._commands.put(('_pause', (False,)))
+
+    def set_speed(self, speed):
+        self._commands.put(('_set_speed', (speed,)))
+
+    def seek(self, when):
+        """ :param when: see SimulationEngine.seek() """
+        self._commands.put(('_seek', (when,)))
+
+    def set_model(self, model, shading=None):
+        self._commands.put(('_set_model', (model, shading)))
+
+    def checkpoint(self, path):
+        """ saves the engine and tracker to a checkpoint file, see checkpoint.py """
+        self._commands.put(('_checkpoint', (path,)))
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='SimulationWorker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """ stops the thread after the tick in progress """
+        self._running = False
+        self._commands.put(('_wake', ()))
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # output, safe to call from any thread
+    def drain(self):
+        """ :return: list of the snapshots published since the last drain(), oldest first """
+        snapshots = self._snapshots
+        out = []
+        while True:
+            try:
+                out.append(snapshots.popleft())
+            except IndexError:
+                return out
+
+    def latest(self):
+        """ :return: the newest Snapshot, None before the first tick """
+        return self._latest
+
+    # the worker thread
+    def _run(self):
+        scheduler = self.scheduler.start()
+        # from here the engine follows the scheduler's virtual time, not whatever clock it was updated with before
+        self.engine.then = None
+        self._publish()
+        try:
+            while self._running:
+                self._apply(scheduler.remaining())
+                for now in scheduler.due():
+                    if not self._running:
+                        break
+                    self._tick(now)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def _apply(self, timeout):
+        """ applies the commands waiting, blocking up to timeout seconds for the first """
+        commands = self._commands
+        try:
+            command = commands.get(timeout=timeout) if timeout > 0 else commands.get_nowait()
+            while True:
+                name, args = command
+                getattr(self, name)(*args)
+                command = commands.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _tick(self, now):
+        engine = self.engine
+        with profiler.phase('engine.update'):
+            engine.update(now)
+        profiler.count('ticks')
+        with profiler.phase('model.operating_point'):
+            if self.shading is None or self.model.shape != self.shading.shape:
+                op = self.model.point(engine.g_eff, engine.t_cell)
+            else:
+                op = self.model.evaluate(engine.g_eff * self.shading, engine.t_cell)
+        v_ref = self._v_ref
+        with profiler.phase('mppt.track'):
+            v_ref = self.tracker.track(v_ref, op.i_from_v(v_ref))
+        self._v_ref = v_ref
+        self._current = op.i_from_v(v_ref)
+        if self.stream is not None:
+            from sg_solarsim.instrument import Setpoint
+            self.stream.submit(Setpoint(v_ref, self._current))
+        self._publish()
+
+    def _publish(self):
+        engine = self.engine
+        hour, minute, second = engine.local_time()
+        snapshot = Snapshot(engine.time, hour, minute, second, engine.local_day(), engine.g_eff, engine.t_air,
+                            engine.t_cell, self._v_ref, self._current, engine.steps, engine.pause,
+                            engine.finished)
+        self._snapshots.append(snapshot)
+        self._latest = snapshot
+
+    def _pause(self, pause):
+        self.engine.pause = pause
+        self._publish()
+
+    def _set_speed(self, speed):
+        self.engine.speed = speed
+
+    def _seek(self, when):
+        self.engine.seek(when)
+        self._publish()
+
+    def _set_model(self, model, shading):
+        self.model = model
+        self.shading = shading
+        # the tracker works on the array voltage, its step grows with the modules in series
+        self.tracker.step = self._step * model.series
+
+    def _checkpoint(self, path):
+        from sg_solarsim import checkpoint
+        checkpoint.save(path, engine=self.engine.snapshot(), tracker=self.tracker.snapshot())
+
+    def _wake(self):
+        pass